@@ -2,7 +2,7 @@
 Database connection and session management
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 from typing import Generator
@@ -13,19 +13,21 @@ from app.models.database import Base
 
 # Create database engine
 if settings.DATABASE_URL.startswith("sqlite"):
-    # SQLite specific configuration
+    # SQLite specific configuration. Sessions are used from the DB thread
+    # pool, so only in-memory databases share a single static connection.
+    in_memory = settings.DATABASE_URL in ("sqlite://", "sqlite:///:memory:")
     engine = create_engine(
         settings.DATABASE_URL,
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-        echo=settings.DEBUG
+        poolclass=StaticPool if in_memory else None,
+        echo=settings.SQL_ECHO
     )
 else:
     # PostgreSQL or other databases
     engine = create_engine(
         settings.DATABASE_URL,
         pool_pre_ping=True,
-        echo=settings.DEBUG
+        echo=settings.SQL_ECHO
     )
 
 # Create session factory
@@ -35,9 +37,56 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 def init_db():
     """Initialize database - create all tables"""
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    for index in missing_indexes():
+        print(f"Index {index.name} on {index.table.name} is missing; "
+              "run `python -m scripts.create_indexes`")
     print("Database initialized successfully")
 
 
+def add_missing_columns():
+    """
+    Add model columns that existing tables do not have yet
+    
+    create_all only creates missing tables, so columns added to a model
+    later would be missing from databases created before. New columns are
+    added as nullable without a default; code reading them handles NULL.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                ))
+                print(f"Added column {table.name}.{column.name}")
+
+
+def missing_indexes() -> list:
+    """
+    Model indexes that existing tables do not have yet
+    
+    Like columns, indexes declared on a model later are not created by
+    create_all for tables that already exist. Building them can lock a
+    large table for minutes, so they are created by
+    `python -m scripts.create_indexes`, not at startup.
+    """
+    inspector = inspect(engine)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
 def get_db() -> Generator[Session, None, None]:
     """
     Dependency function to get database session
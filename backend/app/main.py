@@ -7,12 +7,43 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import time
 
-from ..config import settings
-from app.database import init_db
+from config import settings
+from app.database import init_db, SessionLocal
 from app.models.ml_model import accident_model
 from app.routes import prediction, accidents
+from app.services.accident_snapshot import accident_snapshot
+from app.services.executor import worker_pools
+from app.services.index_sync import index_sync
+from app.services.inference_scheduler import inference_scheduler
+from app.services.model_reloader import model_reloader
+from app.services.pagination import NEXT_CURSOR_HEADER
+from app.services.prediction_logger import prediction_logger
+from app.services.risk_surface import risk_surface
+from app.services.segment_refresher import segment_refresher
+from app.services.spatial_index import accident_index
+from app.services.statistics_rollup import rebuild_if_empty
+
+
+# Startup work running in the background (FAST_START)
+background_tasks = set()
+
+
+def build_spatial_index():
+    db = SessionLocal()
+    try:
+        if settings.ACCIDENT_SNAPSHOT_ENABLED:
+            accident_index.build(db, snapshot=accident_snapshot)
+            print(f"Accident snapshot refreshed: {accident_snapshot.last_refresh}")
+        else:
+            accident_index.build(db)
+        print(f"Spatial index built with {len(accident_index)} accidents")
+    except Exception as e:
+        print(f"Warning: Could not build spatial index: {e}")
+    finally:
+        db.close()
 
 
 @asynccontextmanager
@@ -27,18 +58,68 @@ async def lifespan(app: FastAPI):
     init_db()
     print("Database initialized")
     
-    # Load ML model
+    # Backfill the statistics rollup of databases created before it
+    db = SessionLocal()
     try:
-        accident_model.load_model()
-        print("ML model loaded successfully")
-    except Exception as e:
-        print(f"Warning: Could not load ML model: {e}")
-        print("Using fallback prediction method")
+        if rebuild_if_empty(db):
+            print("Statistics rollup backfilled")
+    finally:
+        db.close()
+    
+    # Build in-memory spatial index of accidents. With FAST_START requests
+    # are answered from the database until the index is ready.
+    if settings.FAST_START:
+        task = asyncio.create_task(worker_pools.run_db(build_spatial_index))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    else:
+        build_spatial_index()
+    
+    # Load ML model. With FAST_START predictions wait for the background
+    # load instead of delaying startup.
+    if settings.FAST_START:
+        accident_model.load_model_in_background()
+        print("Loading ML model in the background")
+    else:
+        try:
+            accident_model.load_model()
+            print("ML model loaded successfully")
+        except Exception as e:
+            print(f"Warning: Could not load ML model: {e}")
+            print("Using fallback prediction method")
+    
+    # Map the precomputed risk surface, if one was built for this model
+    if settings.RISK_SURFACE_ENABLED:
+        risk_surface.load()
+    
+    # Start micro-batching of concurrent predictions
+    if settings.INFERENCE_BATCHING_ENABLED:
+        await inference_scheduler.start()
+        print("Inference scheduler started")
+    
+    # Write prediction history in batches, off the request path
+    if settings.PREDICTION_LOG_ENABLED:
+        await prediction_logger.start()
+    
+    # Pick up new model versions without a restart
+    await model_reloader.start()
+    
+    # Keep segment time windows and risk levels current
+    await segment_refresher.start()
+    
+    # Apply accidents created or deleted through other workers
+    await index_sync.start()
     
     yield
     
     # Shutdown
     print("Shutting down API...")
+    await index_sync.stop()
+    await segment_refresher.stop()
+    await model_reloader.stop()
+    await inference_scheduler.stop()
+    await prediction_logger.stop()
+    worker_pools.shutdown()
 
 
 # Create FastAPI app
@@ -56,6 +137,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
@@ -93,9 +175,20 @@ async def root():
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """
+    Health check endpoint
+    
+    The process is live as soon as this answers; "ready" turns true once
+    the model and the spatial index have finished loading (see FAST_START).
+    """
+    components = {
+        "model": accident_model.is_ready,
+        "spatial_index": accident_index.is_built
+    }
     return {
         "status": "healthy",
+        "ready": all(components.values()),
+        "components": components,
         "timestamp": time.time(),
         "model_loaded": accident_model.is_trained
     }
@@ -2,7 +2,7 @@
 Database models for traffic accident data
 """
 
-from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, Float, String, Date, DateTime, Boolean, Text, JSON, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -13,6 +13,11 @@ Base = declarative_base()
 class Accident(Base):
     """Model for storing accident records"""
     __tablename__ = "accidents"
+    __table_args__ = (
+        # Keyset pagination of the accident list, with and without severity filter
+        Index("ix_accidents_date_id", "accident_date", "id"),
+        Index("ix_accidents_severity_date_id", "severity", "accident_date", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     latitude = Column(Float, nullable=False, index=True)
@@ -55,6 +60,11 @@ class Accident(Base):
 class RoadSegment(Base):
     """Model for storing road segment risk data"""
     __tablename__ = "road_segments"
+    __table_args__ = (
+        # Keyset pagination of the segment list, with and without risk level filter
+        Index("ix_road_segments_score_segment", "risk_score", "segment_id"),
+        Index("ix_road_segments_level_score_segment", "risk_level", "risk_score", "segment_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     
@@ -80,6 +90,7 @@ class RoadSegment(Base):
     # Statistics
     avg_severity = Column(Float)
     peak_accident_hour = Column(Integer)  # Hour with most accidents
+    hour_counts = Column(JSON)  # Accidents per hour of day (24 ints), kept for incremental updates
     
     # Metadata
     last_updated = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -88,6 +99,25 @@ class RoadSegment(Base):
         return f"<RoadSegment(id={self.segment_id}, risk={self.risk_level})>"
 
 
+class AccidentDailyRollup(Base):
+    """Accident counts per day and category, for statistics without row scans"""
+    __tablename__ = "accident_daily_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "severity", "road_type", "hour_of_day", "day_of_week"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    severity = Column(String(20), nullable=False)  # "unknown" if not set
+    road_type = Column(String(50), nullable=False)  # "unknown" if not set
+    hour_of_day = Column(Integer, nullable=False)  # -1 if not set
+    day_of_week = Column(Integer, nullable=False)  # -1 if not set
+    accident_count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<AccidentDailyRollup(day={self.day}, count={self.accident_count})>"
+
+
 class Prediction(Base):
     """Model for storing prediction history"""
     __tablename__ = "predictions"
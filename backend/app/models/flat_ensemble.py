@@ -0,0 +1,352 @@
+"""
+Flattened tree ensembles evaluated with NumPy
+
+A trained tree ensemble and its scaler are exported into a handful of flat
+arrays: per node the split feature, threshold, left and right child
+(interleaved in one array) and leaf value, plus the root node of every
+tree. Evaluating them is a short
+loop of vectorized gathers over all trees at once, which avoids the
+per-call overhead of predict_proba when scoring one or a few rows.
+
+Supported models:
+
+- scikit-learn DecisionTree, RandomForest and ExtraTrees classifiers and
+  regressors, and GradientBoosting classifiers (binary) and regressors
+- xgboost XGBClassifier (binary:logistic) and XGBRegressor
+
+scikit-learn splits go left when x <= threshold with x rounded to float32,
+xgboost splits when x < threshold in float32; both rules are reproduced.
+scikit-learn results match predict_proba to float64 rounding; xgboost
+accumulates in float32, so results match to about 1e-6.
+"""
+
+from pathlib import Path
+from typing import List, Optional
+import json
+import os
+
+import numpy as np
+
+
+# Array files of a saved ensemble
+ARRAY_NAMES = (
+    "feature", "threshold", "children", "value", "roots",
+    "scaler_mean", "scaler_scale"
+)
+
+
+def _expit(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class FlatTreeEnsemble:
+    """
+    Tree ensemble stored as flat node arrays
+
+    Leaves point to themselves with an infinite threshold, so every row can
+    take exactly `max_depth` steps without checking for leaves.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        children: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        aggregation: str,
+        strict: bool,
+        base_score: float = 0.0,
+        scaler_mean: Optional[np.ndarray] = None,
+        scaler_scale: Optional[np.ndarray] = None,
+        source: str = ""
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children  # [left0, right0, left1, right1, ...]
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.aggregation = aggregation  # 'mean', 'sum' or 'logistic'
+        self.strict = strict  # Go left on x < threshold instead of x <= threshold
+        self.base_score = base_score
+        self.scaler_mean = scaler_mean
+        self.scaler_scale = scaler_scale
+        self.source = source
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @property
+    def left(self) -> np.ndarray:
+        return self.children[0::2]
+
+    @property
+    def right(self) -> np.ndarray:
+        return self.children[1::2]
+
+    def transform(self, features: np.ndarray) -> np.ndarray:
+        """Apply the exported scaler"""
+        if self.scaler_mean is None:
+            return features
+        return (features - self.scaler_mean) / self.scaler_scale
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Probability of the positive class (or regression output) per row
+
+        Args:
+            features: Unscaled feature matrix of shape (n, n_features)
+        """
+        x = self.transform(np.asarray(features, dtype=np.float64))
+        # Both libraries compare features in single precision
+        x = x.astype(np.float32)
+        if not self.strict:
+            x = x.astype(np.float64)
+
+        # Gather with take on flat arrays, which is cheaper than fancy
+        # indexing for the small index arrays of single-row requests
+        n_rows, n_features = x.shape
+        x = x.ravel()
+        row_offsets = (np.arange(n_rows) * n_features)[:, None]
+        children = self.children
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_trees))
+        for _ in range(self.max_depth):
+            values = x.take(row_offsets + self.feature.take(nodes))
+            threshold = self.threshold.take(nodes)
+            go_right = values >= threshold if self.strict else values > threshold
+            nodes = children.take(2 * nodes + go_right)
+
+        leaves = self.value.take(nodes)
+        if self.aggregation == "mean":
+            return leaves.sum(axis=1) / self.n_trees
+        if self.aggregation == "logistic":
+            return _expit(self.base_score + leaves.sum(axis=1))
+        return self.base_score + leaves.sum(axis=1)
+
+    def save(self, directory: str):
+        """
+        Write one .npy file per array and a JSON header
+
+        Files are written under a temporary name and renamed, so processes
+        that memory-mapped the previous export keep reading intact files.
+        The header is written last.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ARRAY_NAMES:
+            array = getattr(self, name)
+            if array is not None:
+                with open(directory / f"{name}.npy.tmp", "wb") as f:
+                    np.save(f, array)
+                os.replace(directory / f"{name}.npy.tmp", directory / f"{name}.npy")
+        (directory / "ensemble.json.tmp").write_text(json.dumps({
+            "max_depth": self.max_depth,
+            "aggregation": self.aggregation,
+            "strict": self.strict,
+            "base_score": self.base_score,
+            "source": self.source
+        }))
+        os.replace(directory / "ensemble.json.tmp", directory / "ensemble.json")
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = None) -> "FlatTreeEnsemble":
+        """Read an ensemble written by save, optionally memory-mapped"""
+        directory = Path(directory)
+        header = json.loads((directory / "ensemble.json").read_text())
+        arrays = {
+            name: np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+            if (directory / f"{name}.npy").exists() else None
+            for name in ARRAY_NAMES
+        }
+        return cls(**arrays, **header)
+
+
+class _TreeBuilder:
+    """Collects trees into the flat arrays"""
+
+    def __init__(self):
+        self.feature: List[np.ndarray] = []
+        self.threshold: List[np.ndarray] = []
+        self.left: List[np.ndarray] = []
+        self.right: List[np.ndarray] = []
+        self.value: List[np.ndarray] = []
+        self.roots: List[int] = []
+        self.max_depth = 0
+        self.n_nodes = 0
+
+    def add(self, feature, threshold, left, right, value, depth: int, root: int = 0):
+        """Add one tree; leaves are marked with left == -1"""
+        feature = np.asarray(feature, dtype=np.int64)
+        left = np.asarray(left, dtype=np.int64)
+        right = np.asarray(right, dtype=np.int64)
+        is_leaf = left < 0
+        own = np.arange(len(feature))
+
+        self.feature.append(np.where(is_leaf, 0, feature))
+        self.threshold.append(np.where(is_leaf, np.inf, np.asarray(threshold, dtype=np.float64)))
+        self.left.append(np.where(is_leaf, own, left) + self.n_nodes)
+        self.right.append(np.where(is_leaf, own, right) + self.n_nodes)
+        self.value.append(np.where(is_leaf, np.asarray(value, dtype=np.float64), 0.0))
+        self.roots.append(self.n_nodes + root)
+        self.max_depth = max(self.max_depth, depth)
+        self.n_nodes += len(feature)
+
+    def arrays(self) -> dict:
+        return {
+            "feature": np.concatenate(self.feature).astype(np.int32),
+            "threshold": np.concatenate(self.threshold),
+            "children": np.column_stack([
+                np.concatenate(self.left), np.concatenate(self.right)
+            ]).ravel().astype(np.int32),
+            "value": np.concatenate(self.value),
+            "roots": np.array(self.roots, dtype=np.int32),
+            "max_depth": self.max_depth
+        }
+
+
+def _add_sklearn_tree(builder: _TreeBuilder, estimator, classifier: bool, scale: float = 1.0):
+    tree = estimator.tree_
+    if classifier:
+        # predict_proba normalizes the class weights of the leaf
+        totals = tree.value[:, 0, :].sum(axis=1)
+        value = tree.value[:, 0, 1] / np.where(totals == 0, 1.0, totals)
+    else:
+        value = scale * tree.value[:, 0, 0]
+    builder.add(
+        tree.feature, tree.threshold, tree.children_left, tree.children_right,
+        value, tree.max_depth
+    )
+
+
+def _export_sklearn(model) -> dict:
+    from sklearn.ensemble import (
+        ExtraTreesClassifier, ExtraTreesRegressor,
+        GradientBoostingClassifier, GradientBoostingRegressor,
+        RandomForestClassifier, RandomForestRegressor
+    )
+    from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+
+    builder = _TreeBuilder()
+
+    if isinstance(model, (DecisionTreeClassifier, DecisionTreeRegressor)):
+        trees, classifier = [model], isinstance(model, DecisionTreeClassifier)
+        if classifier and len(model.classes_) != 2:
+            raise ValueError("Only binary classifiers can be flattened")
+        for tree in trees:
+            _add_sklearn_tree(builder, tree, classifier)
+        return {**builder.arrays(), "aggregation": "mean"}
+
+    if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier,
+                          RandomForestRegressor, ExtraTreesRegressor)):
+        classifier = isinstance(model, (RandomForestClassifier, ExtraTreesClassifier))
+        if classifier and len(model.classes_) != 2:
+            raise ValueError("Only binary classifiers can be flattened")
+        for tree in model.estimators_:
+            _add_sklearn_tree(builder, tree, classifier)
+        return {**builder.arrays(), "aggregation": "mean"}
+
+    if isinstance(model, (GradientBoostingClassifier, GradientBoostingRegressor)):
+        classifier = isinstance(model, GradientBoostingClassifier)
+        if classifier and len(model.classes_) != 2:
+            raise ValueError("Only binary classifiers can be flattened")
+        if model.init_ == "zero":
+            base_score = 0.0
+        elif not hasattr(model.init_, "strategy") or model.init_.strategy not in ("prior", "mean", "quantile"):
+            raise ValueError("Only the default init estimator can be flattened")
+        else:
+            # The default init predicts a constant raw score
+            base_score = float(model._raw_predict_init(np.zeros((1, model.n_features_in_)))[0, 0])
+        for tree in model.estimators_[:, 0]:
+            _add_sklearn_tree(builder, tree, classifier=False, scale=model.learning_rate)
+        return {
+            **builder.arrays(),
+            "aggregation": "logistic" if classifier else "sum",
+            "base_score": base_score
+        }
+
+    raise ValueError(f"Unsupported model type: {type(model).__name__}")
+
+
+def _export_xgboost(model) -> dict:
+    booster = model.get_booster()
+    config = json.loads(booster.save_config())
+    objective = config["learner"]["objective"]["name"]
+    base_score = float(config["learner"]["learner_model_param"]["base_score"])
+    if objective == "binary:logistic":
+        aggregation = "logistic"
+        base_score = float(np.log(base_score / (1.0 - base_score)))
+    elif objective.startswith("reg:squarederror"):
+        aggregation = "sum"
+    else:
+        raise ValueError(f"Unsupported xgboost objective: {objective}")
+
+    feature_names = booster.feature_names
+    builder = _TreeBuilder()
+    for dump in booster.get_dump(dump_format="json"):
+        nodes = {}
+        stack = [(json.loads(dump), 0)]
+        depth = 0
+        while stack:
+            node, level = stack.pop()
+            nodes[node["nodeid"]] = node
+            depth = max(depth, level)
+            for child in node.get("children", []):
+                stack.append((child, level + 1))
+
+        size = max(nodes) + 1
+        feature = np.zeros(size, dtype=np.int64)
+        threshold = np.zeros(size)
+        left = np.full(size, -1, dtype=np.int64)
+        right = np.full(size, -1, dtype=np.int64)
+        value = np.zeros(size)
+        for node_id, node in nodes.items():
+            if "leaf" in node:
+                value[node_id] = node["leaf"]
+                continue
+            split = node["split"]
+            feature[node_id] = feature_names.index(split) if feature_names else int(split[1:])
+            threshold[node_id] = np.float32(node["split_condition"])
+            left[node_id] = node["yes"]
+            right[node_id] = node["no"]
+        builder.add(feature, threshold, left, right, value, depth)
+
+    return {**builder.arrays(), "aggregation": aggregation, "base_score": base_score, "strict": True}
+
+
+def export_ensemble(model, scaler=None) -> FlatTreeEnsemble:
+    """
+    Flatten a trained tree ensemble and an optional StandardScaler
+
+    Raises:
+        ValueError: if the model or scaler type is not supported
+    """
+    module = type(model).__module__
+    if module.startswith("xgboost"):
+        exported = _export_xgboost(model)
+    elif module.startswith("sklearn"):
+        exported = _export_sklearn(model)
+    else:
+        raise ValueError(f"Unsupported model type: {type(model).__name__}")
+
+    scaler_mean = scaler_scale = None
+    if scaler is not None:
+        if type(scaler).__name__ != "StandardScaler":
+            raise ValueError(f"Unsupported scaler type: {type(scaler).__name__}")
+        n_features = scaler.n_features_in_
+        scaler_mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+        scaler_scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+
+    return FlatTreeEnsemble(
+        strict=exported.pop("strict", False),
+        scaler_mean=None if scaler_mean is None else np.asarray(scaler_mean, dtype=np.float64),
+        scaler_scale=None if scaler_scale is None else np.asarray(scaler_scale, dtype=np.float64),
+        source=type(model).__name__,
+        **exported
+    )
@@ -2,56 +2,297 @@
 Machine Learning model wrapper for accident risk prediction
 """
 
-import joblib
 import numpy as np
-import pandas as pd
-from typing import Dict, Tuple, Optional
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
 from datetime import datetime
 import os
+import threading
 from pathlib import Path
 
+from app.models.flat_ensemble import FlatTreeEnsemble, export_ensemble
 from config import settings
 
 
+RUSH_HOURS = [7, 8, 9, 17, 18, 19]
+
+# Feature scores (0-1, higher = worse conditions / more dangerous)
+WEATHER_SCORES = {
+    'clear': 0.0,
+    'rain': 0.5,
+    'fog': 0.7,
+    'snow': 0.8,
+    'storm': 1.0
+}
+ROAD_TYPE_SCORES = {
+    'highway': 0.3,
+    'national_road': 0.5,
+    'urban': 0.4,
+    'rural': 0.6
+}
+
+# Risk adjustments used by the heuristic fallback prediction
+WEATHER_ADJUSTMENTS = {
+    'clear': 0.0,
+    'rain': 0.15,
+    'fog': 0.2,
+    'snow': 0.25,
+    'storm': 0.3
+}
+ROAD_TYPE_ADJUSTMENTS = {
+    'highway': 0.05,
+    'national_road': 0.1,
+    'urban': 0.05,
+    'rural': 0.15
+}
+
+
+def _lookup(table: Dict[str, float], values, n: int, default: float) -> np.ndarray:
+    """Map a string or a sequence of strings to scores, broadcast to n rows"""
+    if values is None or isinstance(values, str):
+        score = table.get(values.lower(), default) if values else default
+        return np.full(n, score)
+    return np.array(
+        [table.get(v.lower(), default) if v else default for v in values],
+        dtype=np.float64
+    )
+
+
+def _time_features(timestamps, n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Hour of day and day of week (Monday = 0) for each row
+    
+    Accepts None, a sequence of datetimes (None entries mean now) or a
+    datetime64 array.
+    
+    Returns:
+        Tuple of (hours, days_of_week, has_timestamp)
+    """
+    if timestamps is None:
+        timestamps = [None] * n
+    
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        has_timestamp = ~np.isnat(timestamps)
+        timestamps = np.where(has_timestamp, timestamps, np.datetime64(datetime.now()))
+        days = timestamps.astype('datetime64[D]')
+        hours = (timestamps.astype('datetime64[h]') - days).astype(np.int64)
+        # 1970-01-01 was a Thursday
+        days_of_week = (days.astype(np.int64) + 3) % 7
+        return hours.astype(np.float64), days_of_week.astype(np.float64), has_timestamp
+    
+    now = datetime.now()
+    has_timestamp = np.array([t is not None for t in timestamps], dtype=bool)
+    resolved = [t if t is not None else now for t in timestamps]
+    hours = np.array([t.hour for t in resolved], dtype=np.float64)
+    days_of_week = np.array([t.weekday() for t in resolved], dtype=np.float64)
+    return hours, days_of_week, has_timestamp
+
+
+def _flat_export_is_current(flat_model_path: str, model_path: str) -> bool:
+    """Whether a flat export exists and is not older than the model file"""
+    header = Path(flat_model_path) / "ensemble.json"
+    return header.exists() and (
+        not os.path.exists(model_path) or
+        os.path.getmtime(header) >= os.path.getmtime(model_path)
+    )
+
+
+class ModelState(NamedTuple):
+    """Everything inference reads from a loaded model"""
+    model: Any = None
+    scaler: Any = None
+    flat_model: Optional[FlatTreeEnsemble] = None
+    is_trained: bool = False
+    version: Optional[str] = None
+
+
 class AccidentRiskModel:
     """Wrapper class for the ML model"""
     
     def __init__(self):
-        self.model = None
-        self.scaler = None
+        self._state = ModelState()
+        # Cleared while a background load runs; predictions wait for it
+        self._ready = threading.Event()
+        self._ready.set()
         self.feature_names = [
             'latitude', 'longitude', 'hour', 'day_of_week', 
             'is_weekend', 'is_rush_hour', 'weather_score',
             'road_type_score', 'historical_accidents_nearby'
         ]
-        self.is_trained = False
+    
+    # The loaded model is held in one ModelState reference. Inference reads
+    # it once per call and load_model replaces it in a single assignment,
+    # so a reload never mixes the old model with the new scaler.
+    
+    @property
+    def model(self):
+        return self._state.model
+    
+    @model.setter
+    def model(self, value):
+        self._state = self._state._replace(model=value)
+    
+    @property
+    def scaler(self):
+        return self._state.scaler
+    
+    @scaler.setter
+    def scaler(self, value):
+        self._state = self._state._replace(scaler=value)
+    
+    @property
+    def flat_model(self) -> Optional[FlatTreeEnsemble]:
+        """NumPy copy of the tree ensemble, used instead of model when set"""
+        return self._state.flat_model
+    
+    @flat_model.setter
+    def flat_model(self, value: Optional[FlatTreeEnsemble]):
+        self._state = self._state._replace(flat_model=value)
+    
+    @property
+    def is_trained(self) -> bool:
+        return self._state.is_trained
+    
+    @is_trained.setter
+    def is_trained(self, value: bool):
+        self._state = self._state._replace(is_trained=value)
+    
+    @property
+    def version(self) -> Optional[str]:
+        """Modification time of the loaded model file"""
+        return self._state.version
+    
+    @property
+    def is_ready(self) -> bool:
+        """False while a background load started by load_model_in_background runs"""
+        return self._ready.is_set()
+    
+    @property
+    def evaluator(self) -> str:
+        return "flat" if self.flat_model is not None else "native"
         
-    def load_model(self, model_path: str = None, scaler_path: str = None):
-        """Load trained model and scaler from disk"""
+    def load_model(self, model_path: str = None, scaler_path: str = None, mmap: bool = None) -> bool:
+        """
+        Load trained model and scaler from disk
+        
+        With `mmap` (default MODEL_MMAP) arrays are memory-mapped read-only,
+        so worker processes on one host share their pages. The new model
+        replaces the current one atomically; requests already running finish
+        on the model they started with. If loading fails the current model
+        is kept.
+        
+        Returns:
+            True if the files were loaded
+        """
         try:
-            model_path = model_path or settings.MODEL_PATH
-            scaler_path = scaler_path or settings.SCALER_PATH
-            
-            if os.path.exists(model_path):
-                self.model = joblib.load(model_path)
-                print(f"Model loaded from {model_path}")
-                self.is_trained = True
-            else:
-                print(f"Model file not found at {model_path}. Using fallback prediction.")
-                self.is_trained = False
-                
-            if os.path.exists(scaler_path):
-                self.scaler = joblib.load(scaler_path)
-                print(f"Scaler loaded from {scaler_path}")
-            else:
-                print(f"Scaler file not found at {scaler_path}")
-                
+            state = self._load_state(
+                model_path or settings.MODEL_PATH,
+                scaler_path or settings.SCALER_PATH,
+                settings.MODEL_MMAP if mmap is None else mmap
+            )
         except Exception as e:
             print(f"Error loading model: {e}")
-            self.is_trained = False
+            return False
+        
+        self._state = state
+        return True
+    
+    def load_model_in_background(self, model_path: str = None, scaler_path: str = None) -> threading.Thread:
+        """
+        Load the model on a daemon thread
+        
+        Predictions made before the load finishes block until it does, so
+        they never silently use the fallback heuristics.
+        """
+        self._ready.clear()
+        
+        def load():
+            try:
+                self.load_model(model_path, scaler_path)
+            finally:
+                self._ready.set()
+        
+        thread = threading.Thread(target=load, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+    
+    def _load_state(self, model_path: str, scaler_path: str, mmap: bool) -> ModelState:
+        mmap_mode = "r" if mmap else None
+        flat_model_path = settings.FLAT_MODEL_PATH
+        use_flat = settings.MODEL_EVALUATOR == "flat"
+        model = scaler = flat_model = None
+        
+        if not os.path.exists(model_path):
+            print(f"Model file not found at {model_path}. Using fallback prediction.")
+            return ModelState()
+        
+        if use_flat and mmap and _flat_export_is_current(flat_model_path, model_path):
+            # Tree objects copy their nodes on unpickling, so only the flat
+            # export can be shared; the native model is not needed with it
+            flat_model = FlatTreeEnsemble.load(flat_model_path, mmap_mode=mmap_mode)
+            print(f"Flat model mapped from {flat_model_path}")
+        else:
+            import joblib
+            model = joblib.load(model_path, mmap_mode=mmap_mode)
+            print(f"Model loaded from {model_path}")
+        
+        if os.path.exists(scaler_path):
+            import joblib
+            scaler = joblib.load(scaler_path, mmap_mode=mmap_mode)
+            print(f"Scaler loaded from {scaler_path}")
+        else:
+            print(f"Scaler file not found at {scaler_path}")
+        
+        if use_flat and flat_model is None:
+            flat_model = self._load_flat_model(model, scaler, flat_model_path, model_path, mmap_mode)
+        
+        return ModelState(
+            model=model,
+            scaler=scaler,
+            flat_model=flat_model,
+            is_trained=True,
+            version=datetime.fromtimestamp(os.path.getmtime(model_path)).isoformat()
+        )
+    
+    @staticmethod
+    def _load_flat_model(
+        model,
+        scaler,
+        flat_model_path: str,
+        model_path: str,
+        mmap_mode: Optional[str] = None
+    ) -> Optional[FlatTreeEnsemble]:
+        try:
+            if _flat_export_is_current(flat_model_path, model_path):
+                flat_model = FlatTreeEnsemble.load(flat_model_path, mmap_mode=mmap_mode)
+                print(f"Flat model loaded from {flat_model_path}")
+            else:
+                flat_model = export_ensemble(model, scaler)
+                print(f"Flattened {flat_model.source} with {flat_model.n_trees} trees")
+            return flat_model
+        except ValueError as e:
+            print(f"Flat evaluator not available: {e}")
+            return None
+    
+    def enable_flat_evaluator(self, flat_model_path: str = None, model_path: str = None) -> bool:
+        """
+        Switch inference to the flattened NumPy evaluator
+        
+        Uses the export at FLAT_MODEL_PATH when it is newer than the model
+        file, otherwise flattens the loaded model. Unsupported models keep
+        the native evaluator.
+        """
+        self.flat_model = self._load_flat_model(
+            self.model, self.scaler,
+            flat_model_path or settings.FLAT_MODEL_PATH,
+            model_path or settings.MODEL_PATH
+        )
+        return self.flat_model is not None
     
     def save_model(self, model_path: str = None, scaler_path: str = None):
         """Save trained model and scaler to disk"""
+        import joblib
+        
         try:
             model_path = model_path or settings.MODEL_PATH
             scaler_path = scaler_path or settings.SCALER_PATH
@@ -60,12 +301,16 @@ class AccidentRiskModel:
             Path(model_path).parent.mkdir(parents=True, exist_ok=True)
             Path(scaler_path).parent.mkdir(parents=True, exist_ok=True)
             
+            # Write to a temporary file and rename, so a server watching
+            # the path never loads a partially written file
             if self.model:
-                joblib.dump(self.model, model_path)
+                joblib.dump(self.model, f"{model_path}.tmp")
+                os.replace(f"{model_path}.tmp", model_path)
                 print(f"Model saved to {model_path}")
                 
             if self.scaler:
-                joblib.dump(self.scaler, scaler_path)
+                joblib.dump(self.scaler, f"{scaler_path}.tmp")
+                os.replace(f"{scaler_path}.tmp", scaler_path)
                 print(f"Scaler saved to {scaler_path}")
                 
         except Exception as e:
@@ -81,50 +326,65 @@ class AccidentRiskModel:
         historical_accidents: int = 0
     ) -> np.ndarray:
         """Prepare features for prediction"""
+        return self.prepare_features_many(
+            [latitude], [longitude], [timestamp],
+            weather_condition, road_type, historical_accidents
+        )
+    
+    def prepare_features_many(
+        self,
+        latitudes: Sequence[float],
+        longitudes: Sequence[float],
+        timestamps: Optional[Sequence[Optional[datetime]]] = None,
+        weather_conditions: Union[str, Sequence[str]] = "clear",
+        road_types: Union[str, Sequence[str]] = "urban",
+        historical_accidents: Union[int, Sequence[int]] = 0,
+        scale: bool = True
+    ) -> np.ndarray:
+        """
+        Prepare a feature matrix for many locations at once
         
-        if timestamp is None:
-            timestamp = datetime.now()
+        Scalars for weather, road type or historical accidents apply to every
+        row. Missing timestamps default to now.
+        
+        Returns:
+            Array of shape (n, len(feature_names)), scaled if `scale` is set
+            and a scaler is loaded
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        n = len(latitudes)
         
         # Extract time features
-        hour = timestamp.hour
-        day_of_week = timestamp.weekday()
-        is_weekend = 1 if day_of_week >= 5 else 0
-        is_rush_hour = 1 if hour in [7, 8, 9, 17, 18, 19] else 0
+        hours, days_of_week, _ = _time_features(timestamps, n)
+        is_weekend = (days_of_week >= 5).astype(np.float64)
+        is_rush_hour = np.isin(hours, RUSH_HOURS).astype(np.float64)
         
         # Weather score (0-1, higher = worse conditions)
-        weather_scores = {
-            'clear': 0.0,
-            'rain': 0.5,
-            'fog': 0.7,
-            'snow': 0.8,
-            'storm': 1.0
-        }
-        weather_score = weather_scores.get(weather_condition.lower(), 0.0)
+        weather_score = _lookup(WEATHER_SCORES, weather_conditions, n, 0.0)
         
         # Road type score (0-1, higher = more dangerous)
-        road_type_scores = {
-            'highway': 0.3,
-            'national_road': 0.5,
-            'urban': 0.4,
-            'rural': 0.6
-        }
-        road_type_score = road_type_scores.get(road_type.lower(), 0.4)
-        
-        # Create feature array
-        features = np.array([[
-            latitude,
-            longitude,
-            hour,
-            day_of_week,
+        road_type_score = _lookup(ROAD_TYPE_SCORES, road_types, n, 0.4)
+        
+        historical = np.broadcast_to(
+            np.asarray(historical_accidents, dtype=np.float64), (n,)
+        )
+        
+        # Create feature matrix
+        features = np.column_stack([
+            latitudes,
+            longitudes,
+            hours,
+            days_of_week,
             is_weekend,
             is_rush_hour,
             weather_score,
             road_type_score,
-            historical_accidents
-        ]])
+            historical
+        ])
         
         # Scale features if scaler is available
-        if self.scaler:
+        if scale and self.scaler:
             features = self.scaler.transform(features)
         
         return features
@@ -146,37 +406,102 @@ class AccidentRiskModel:
             risk_level: 'low', 'medium', or 'high'
             risk_probability: float between 0 and 1
         """
-        
-        # Prepare features
-        features = self.prepare_features(
-            latitude, longitude, timestamp, 
+        risk_levels, risk_probabilities = self.predict_risk_many(
+            [latitude], [longitude], [timestamp],
             weather_condition, road_type, historical_accidents
         )
+        return risk_levels[0], float(risk_probabilities[0])
+    
+    def predict_risk_many(
+        self,
+        latitudes: Sequence[float],
+        longitudes: Sequence[float],
+        timestamps: Optional[Sequence[Optional[datetime]]] = None,
+        weather_conditions: Union[str, Sequence[str]] = "clear",
+        road_types: Union[str, Sequence[str]] = "urban",
+        historical_accidents: Union[int, Sequence[int]] = 0
+    ) -> Tuple[List[str], np.ndarray]:
+        """
+        Predict accident risk for many locations with a single model call
+        
+        Arguments follow prepare_features_many.
+        
+        Returns:
+            Tuple of (risk_levels, risk_probabilities)
+            risk_levels: list of 'low', 'medium' or 'high'
+            risk_probabilities: float array with values between 0 and 1
+        """
+        if len(latitudes) == 0:
+            return [], np.empty(0, dtype=np.float64)
+        
+        self._ready.wait()
+        
+        # Read the loaded model once, so a concurrent reload cannot
+        # change it halfway through this call
+        state = self._state
         
         # Make prediction
-        if self.is_trained and self.model:
+        if state.is_trained and state.flat_model is not None:
+            # The flat model applies its own copy of the scaler
+            features = self.prepare_features_many(
+                latitudes, longitudes, timestamps,
+                weather_conditions, road_types, historical_accidents,
+                scale=False
+            )
+            risk_probabilities = state.flat_model.predict(features)
+        elif state.is_trained and state.model:
+            # Prepare features
+            features = self.prepare_features_many(
+                latitudes, longitudes, timestamps,
+                weather_conditions, road_types, historical_accidents,
+                scale=False
+            )
+            if state.scaler:
+                features = state.scaler.transform(features)
             try:
                 # Get probability prediction
-                risk_probability = self.model.predict_proba(features)[0][1]
-            except:
+                risk_probabilities = state.model.predict_proba(features)[:, 1]
+            except Exception:
                 # Fallback if predict_proba not available
-                risk_probability = self.model.predict(features)[0]
+                risk_probabilities = state.model.predict(features)
         else:
             # Fallback prediction based on heuristics
-            risk_probability = self._fallback_prediction(
-                latitude, longitude, timestamp,
-                weather_condition, road_type, historical_accidents
+            risk_probabilities = self._fallback_prediction_many(
+                latitudes, longitudes, timestamps,
+                weather_conditions, road_types, historical_accidents
             )
         
-        # Determine risk level based on thresholds
-        if risk_probability < settings.LOW_RISK_THRESHOLD:
-            risk_level = "low"
-        elif risk_probability < settings.HIGH_RISK_THRESHOLD:
-            risk_level = "medium"
-        else:
-            risk_level = "high"
+        risk_probabilities = np.asarray(risk_probabilities, dtype=np.float64)
+        return self.risk_levels(risk_probabilities), risk_probabilities
+    
+    def predict_risk_frame(self, frame) -> Tuple[List[str], np.ndarray]:
+        """
+        Predict accident risk for the rows of a DataFrame
         
-        return risk_level, float(risk_probability)
+        Expects 'latitude' and 'longitude' columns and optionally
+        'timestamp', 'weather_condition', 'road_type' and
+        'historical_accidents'.
+        """
+        def column(name, default):
+            return frame[name].to_numpy() if name in frame else default
+        
+        return self.predict_risk_many(
+            column('latitude', None),
+            column('longitude', None),
+            column('timestamp', None),
+            column('weather_condition', "clear"),
+            column('road_type', "urban"),
+            column('historical_accidents', 0)
+        )
+    
+    @staticmethod
+    def risk_levels(risk_probabilities: np.ndarray) -> List[str]:
+        """Map probabilities to 'low', 'medium' or 'high' using the thresholds"""
+        levels = np.where(
+            risk_probabilities < settings.LOW_RISK_THRESHOLD, "low",
+            np.where(risk_probabilities < settings.HIGH_RISK_THRESHOLD, "medium", "high")
+        )
+        return levels.tolist()
     
     def _fallback_prediction(
         self,
@@ -191,47 +516,54 @@ class AccidentRiskModel:
         Fallback prediction method when model is not trained
         Uses simple heuristics based on features
         """
+        return float(self._fallback_prediction_many(
+            [latitude], [longitude], [timestamp],
+            weather_condition, road_type, historical_accidents
+        )[0])
+    
+    def _fallback_prediction_many(
+        self,
+        latitudes: Sequence[float],
+        longitudes: Sequence[float],
+        timestamps: Optional[Sequence[Optional[datetime]]],
+        weather_conditions: Union[str, Sequence[str]],
+        road_types: Union[str, Sequence[str]],
+        historical_accidents: Union[int, Sequence[int]]
+    ) -> np.ndarray:
+        """Vectorized version of _fallback_prediction"""
+        n = len(latitudes)
+        historical = np.broadcast_to(
+            np.asarray(historical_accidents, dtype=np.float64), (n,)
+        )
         
-        base_risk = 0.2  # Base risk level
+        base_risk = np.full(n, 0.2)  # Base risk level
         
         # Adjust for historical accidents (most important factor)
-        if historical_accidents > 10:
-            base_risk += 0.4
-        elif historical_accidents > 5:
-            base_risk += 0.25
-        elif historical_accidents > 2:
-            base_risk += 0.15
+        base_risk += np.select(
+            [historical > 10, historical > 5, historical > 2],
+            [0.4, 0.25, 0.15],
+            default=0.0
+        )
         
         # Adjust for weather
-        weather_adjustments = {
-            'clear': 0.0,
-            'rain': 0.15,
-            'fog': 0.2,
-            'snow': 0.25,
-            'storm': 0.3
-        }
-        base_risk += weather_adjustments.get(weather_condition.lower(), 0.0)
+        base_risk += _lookup(WEATHER_ADJUSTMENTS, weather_conditions, n, 0.0)
         
         # Adjust for road type
-        road_adjustments = {
-            'highway': 0.05,
-            'national_road': 0.1,
-            'urban': 0.05,
-            'rural': 0.15
-        }
-        base_risk += road_adjustments.get(road_type.lower(), 0.0)
+        base_risk += _lookup(ROAD_TYPE_ADJUSTMENTS, road_types, n, 0.0)
         
-        # Adjust for time of day
-        if timestamp:
-            hour = timestamp.hour
+        # Adjust for time of day, only where a timestamp was given
+        if timestamps is not None:
+            hours, _, has_timestamp = _time_features(timestamps, n)
             # Higher risk during rush hours and late night
-            if hour in [7, 8, 9, 17, 18, 19]:
-                base_risk += 0.1
-            elif hour >= 22 or hour <= 5:
-                base_risk += 0.15
+            time_adjustment = np.select(
+                [np.isin(hours, RUSH_HOURS), (hours >= 22) | (hours <= 5)],
+                [0.1, 0.15],
+                default=0.0
+            )
+            base_risk += np.where(has_timestamp, time_adjustment, 0.0)
         
         # Cap at 1.0
-        return min(base_risk, 1.0)
+        return np.minimum(base_risk, 1.0)
     
     def get_risk_message(self, risk_level: str, language: str = "vi") -> Dict[str, str]:
         """
@@ -159,6 +159,10 @@ class RoutePoint(BaseModel):
 class RouteAnalysisRequest(BaseModel):
     """Request schema for route safety analysis"""
     route_points: List[RoutePoint] = Field(..., min_length=2)
+    resample: bool = Field(
+        default=True,
+        description="Simplify the route and cut it into ROAD_SEGMENT_LENGTH_KM pieces before scoring"
+    )
     
     class Config:
         json_schema_extra = {
@@ -181,6 +185,8 @@ class RouteSegmentRisk(BaseModel):
     distance_km: float
     estimated_time_minutes: float
     accidents_count: int
+    start_index: Optional[int] = None  # Position of the segment start in the sorted route_points
+    end_index: Optional[int] = None  # Position of the segment end in the sorted route_points
 
 
 class RouteAnalysisResponse(BaseModel):
@@ -210,6 +216,36 @@ class RouteAnalysisResponse(BaseModel):
         }
 
 
+class RouteComparisonRequest(BaseModel):
+    """Request schema for comparing alternative routes"""
+    routes: List[RouteAnalysisRequest] = Field(..., min_length=2, max_length=10)
+
+
+class RouteComparisonItem(BaseModel):
+    """One candidate route in a comparison"""
+    route_index: int  # Position of the route in the request
+    rank: int  # 1 is the safest route
+    analysis: RouteAnalysisResponse
+
+
+class RouteComparisonResponse(BaseModel):
+    """Response schema for route comparison, safest route first"""
+    routes: List[RouteComparisonItem]
+    recommended_route_index: int
+    segments_count: int  # Segments across all routes
+    scored_cells_count: int  # Distinct cells actually scored
+
+
+class BulkIngestResponse(BaseModel):
+    """Response schema for bulk accident import"""
+    rows_read: int
+    rows_inserted: int
+    rows_rejected: int
+    segments_updated: int
+    seconds: float
+    rows_per_second: float
+
+
 class NearbyAccidentsRequest(BaseModel):
     """Request schema for nearby accidents query"""
     latitude: float = Field(..., ge=-90, le=90)
@@ -2,20 +2,30 @@
 Accident data API routes
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
 from typing import List, Optional
 from datetime import datetime, timedelta
+import tempfile
 
 from app.database import get_db
 from app.models.database import Accident, RoadSegment
 from app.models.schemas import (
-    AccidentCreate, AccidentResponse,
+    AccidentCreate, AccidentResponse, BulkIngestResponse,
     NearbyAccidentsRequest, RoadSegmentResponse,
     StatisticsResponse
 )
+from app.services.accident_snapshot import accident_snapshot
+from app.services.bulk_ingest import FORMATS, IngestError, ingest_file
+from app.services.executor import worker_pools
+from app.services.pagination import NEXT_CURSOR_HEADER, keyset_page, next_cursor
+from app.services.index_sync import index_sync
+from app.services.prediction_cache import prediction_cache
 from app.services.risk_calculator import RiskCalculator
+from app.services.risk_surface import risk_surface
+from app.services.segment_refresher import segment_refresher
+from app.services.spatial_index import accident_index
+from app.services import statistics_rollup
 
 router = APIRouter(prefix="/accidents", tags=["Accidents"])
 
@@ -52,40 +62,87 @@ async def create_accident(
             reported_by="user"
         )
         
-        db.add(db_accident)
-        db.commit()
-        db.refresh(db_accident)
-        
-        # Update road segment statistics
-        segment_id = RiskCalculator.generate_segment_id(
-            accident.latitude,
-            accident.longitude
-        )
+        def save() -> AccidentResponse:
+            db.add(db_accident)
+            statistics_rollup.record_accident(db, db_accident)
+            db.commit()
+            db.refresh(db_accident)
+            
+            # Keep the in-memory spatial index in sync
+            accident_index.add(db_accident.id, db_accident.latitude, db_accident.longitude)
+            
+            # Update road segment statistics incrementally
+            RiskCalculator.record_accident(db, db_accident)
+            
+            return AccidentResponse(
+                id=db_accident.id,
+                latitude=db_accident.latitude,
+                longitude=db_accident.longitude,
+                accident_date=db_accident.accident_date,
+                severity=db_accident.severity,
+                road_name=db_accident.road_name,
+                road_type=db_accident.road_type,
+                weather_condition=db_accident.weather_condition
+            )
         
-        # Check if segment exists, create if not
-        segment = db.query(RoadSegment).filter(
-            RoadSegment.segment_id == segment_id
-        ).first()
+        response = await worker_pools.run_db(save)
         
-        if segment:
-            RiskCalculator.update_segment_statistics(db, segment_id)
+        # Cached and precomputed predictions nearby were computed without this accident
+        prediction_cache.invalidate_near(response.latitude, response.longitude)
+        risk_surface.mark_dirty(response.latitude, response.longitude)
         
-        return AccidentResponse(
-            id=db_accident.id,
-            latitude=db_accident.latitude,
-            longitude=db_accident.longitude,
-            accident_date=db_accident.accident_date,
-            severity=db_accident.severity,
-            road_name=db_accident.road_name,
-            road_type=db_accident.road_type,
-            weather_condition=db_accident.weather_condition
-        )
+        return response
         
     except Exception as e:
-        db.rollback()
+        await worker_pools.run_db(db.rollback)
         raise HTTPException(status_code=500, detail=f"Error creating accident: {str(e)}")
 
 
+@router.post("/bulk", response_model=BulkIngestResponse)
+async def bulk_import_accidents(
+    request: Request,
+    file_format: str = Query("csv", alias="format", pattern=f"^({'|'.join(FORMATS)})$"),
+    db: Session = Depends(get_db)
+):
+    """
+    Import many accidents from a CSV or Parquet file sent as the request body
+    
+    The upload is spooled to a temporary file as it arrives and imported in
+    chunks (see app.services.bulk_ingest). Road segment statistics and the
+    spatial index are refreshed once at the end.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        
+        try:
+            report = await worker_pools.run_db(ingest_file, db, upload, file_format)
+        except IngestError as e:
+            # Rows committed before the failure are kept and indexed
+            prediction_cache.clear()
+            risk_surface.mark_all_dirty()
+            status_code = 400 if isinstance(e.__cause__, ValueError) else 500
+            raise HTTPException(status_code=status_code, detail={
+                "message": f"Error importing accidents: {e}",
+                "rows_inserted": e.report.rows_inserted
+            })
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error importing accidents: {str(e)}")
+    
+    # Cached predictions were computed without the imported accidents
+    if report.rows_inserted:
+        prediction_cache.clear()
+        risk_surface.mark_all_dirty()
+    
+    return BulkIngestResponse(
+        **report._asdict(),
+        rows_per_second=round(report.rows_per_second, 1)
+    )
+
+
 @router.post("/nearby", response_model=List[AccidentResponse])
 async def get_nearby_accidents(
     request: NearbyAccidentsRequest,
@@ -97,7 +154,8 @@ async def get_nearby_accidents(
     Returns list of accidents within specified radius
     """
     try:
-        accidents = RiskCalculator.get_nearby_accidents(
+        accidents = await worker_pools.run_db(
+            RiskCalculator.get_nearby_accidents,
             db,
             request.latitude,
             request.longitude,
@@ -126,16 +184,26 @@ async def get_nearby_accidents(
 
 @router.get("/", response_model=List[AccidentResponse])
 async def list_accidents(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
     severity: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     db: Session = Depends(get_db)
 ):
     """
-    List accidents with optional filters
+    List accidents with optional filters, newest first
+    
+    Pages are ordered by (accident_date, id). When a page is full, the
+    X-Next-Cursor header holds the cursor of the next one; pass it as
+    `cursor` instead of increasing `skip`, which has to scan all rows
+    before the page.
     """
+    if cursor is not None and skip:
+        raise HTTPException(status_code=400, detail="Use either skip or cursor, not both")
+    
     try:
         query = db.query(Accident)
         
@@ -149,11 +217,17 @@ async def list_accidents(
         if end_date:
             query = query.filter(Accident.accident_date <= end_date)
         
-        # Order by date descending
-        query = query.order_by(desc(Accident.accident_date))
+        # Order by date descending, continuing after the cursor
+        try:
+            query = keyset_page(query, [Accident.accident_date, Accident.id], cursor, (datetime, int), limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        accidents = await worker_pools.run_db(query.offset(skip).all)
         
-        # Pagination
-        accidents = query.offset(skip).limit(limit).all()
+        cursor = next_cursor(accidents, ["accident_date", "id"], limit)
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
         
         return [
             AccidentResponse(
@@ -169,6 +243,8 @@ async def list_accidents(
             for accident in accidents
         ]
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing accidents: {str(e)}")
 
@@ -180,58 +256,28 @@ async def get_statistics(
 ):
     """
     Get accident statistics for specified time period
+    
+    Counts come from the daily rollup (see app.services.statistics_rollup),
+    so the cost depends on the number of days, not of accidents.
     """
     try:
         # Calculate date range
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        # Get accidents in date range
-        accidents = db.query(Accident).filter(
-            Accident.accident_date >= start_date
-        ).all()
-        
-        total_accidents = len(accidents)
-        
-        # Accidents by severity
-        accidents_by_severity = {}
-        for accident in accidents:
-            severity = accident.severity or "unknown"
-            accidents_by_severity[severity] = accidents_by_severity.get(severity, 0) + 1
-        
-        # Accidents by road type
-        accidents_by_road_type = {}
-        for accident in accidents:
-            road_type = accident.road_type or "unknown"
-            accidents_by_road_type[road_type] = accidents_by_road_type.get(road_type, 0) + 1
-        
-        # Accidents by hour
-        accidents_by_hour = {}
-        for accident in accidents:
-            hour = accident.hour_of_day
-            if hour is not None:
-                accidents_by_hour[str(hour)] = accidents_by_hour.get(str(hour), 0) + 1
-        
-        # Accidents by day of week
-        accidents_by_day = {}
-        day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        for accident in accidents:
-            day = accident.day_of_week
-            if day is not None:
-                day_name = day_names[day]
-                accidents_by_day[day_name] = accidents_by_day.get(day_name, 0) + 1
+        counts = await worker_pools.run_db(
+            statistics_rollup.accident_statistics, db, start_date
+        )
         
         # Count high risk segments
-        high_risk_segments = db.query(RoadSegment).filter(
-            RoadSegment.risk_level == "high"
-        ).count()
+        high_risk_segments = await worker_pools.run_db(
+            db.query(RoadSegment).filter(
+                RoadSegment.risk_level == "high"
+            ).count
+        )
         
         return StatisticsResponse(
-            total_accidents=total_accidents,
-            accidents_by_severity=accidents_by_severity,
-            accidents_by_road_type=accidents_by_road_type,
-            accidents_by_hour=accidents_by_hour,
-            accidents_by_day=accidents_by_day,
+            **counts,
             high_risk_segments_count=high_risk_segments,
             last_updated=datetime.now()
         )
@@ -242,24 +288,39 @@ async def get_statistics(
 
 @router.get("/segments", response_model=List[RoadSegmentResponse])
 async def list_road_segments(
+    response: Response,
     risk_level: Optional[str] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """
-    List road segments with optional risk level filter
+    List road segments with optional risk level filter, riskiest first
+    
+    Pages are ordered by (risk_score, segment_id); see list_accidents for
+    the X-Next-Cursor header and the `cursor` parameter.
     """
+    if cursor is not None and skip:
+        raise HTTPException(status_code=400, detail="Use either skip or cursor, not both")
+    
     try:
         query = db.query(RoadSegment)
         
         if risk_level:
             query = query.filter(RoadSegment.risk_level == risk_level)
         
-        # Order by risk score descending
-        query = query.order_by(desc(RoadSegment.risk_score))
+        # Order by risk score descending, continuing after the cursor
+        try:
+            query = keyset_page(query, [RoadSegment.risk_score, RoadSegment.segment_id], cursor, (float, str), limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        segments = await worker_pools.run_db(query.offset(skip).all)
         
-        segments = query.offset(skip).limit(limit).all()
+        cursor = next_cursor(segments, ["risk_score", "segment_id"], limit)
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
         
         return [
             RoadSegmentResponse(
@@ -279,10 +340,28 @@ async def list_road_segments(
             for segment in segments
         ]
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing segments: {str(e)}")
 
 
+@router.get("/segments/refresh-stats")
+async def get_segment_refresh_stats():
+    """
+    Metrics of the periodic segment statistics recompute
+    """
+    return segment_refresher.stats()
+
+
+@router.get("/index/sync-stats")
+async def get_index_sync_stats():
+    """
+    Metrics of the spatial index catch-up with other workers
+    """
+    return index_sync.stats()
+
+
 @router.delete("/{accident_id}")
 async def delete_accident(
     accident_id: int,
@@ -292,18 +371,30 @@ async def delete_accident(
     Delete an accident record (admin only in production)
     """
     try:
-        accident = db.query(Accident).filter(Accident.id == accident_id).first()
-        
-        if not accident:
-            raise HTTPException(status_code=404, detail="Accident not found")
-        
-        db.delete(accident)
-        db.commit()
+        def remove():
+            accident = db.query(Accident).filter(Accident.id == accident_id).first()
+            
+            if not accident:
+                raise HTTPException(status_code=404, detail="Accident not found")
+            
+            latitude, longitude = accident.latitude, accident.longitude
+            db.delete(accident)
+            statistics_rollup.record_accident(db, accident, delta=-1)
+            db.commit()
+            
+            accident_index.remove(accident_id)
+            accident_snapshot.mark_deleted(accident_id)
+            RiskCalculator.record_accident(db, accident, delta=-1)
+            return latitude, longitude
+        
+        latitude, longitude = await worker_pools.run_db(remove)
+        prediction_cache.invalidate_near(latitude, longitude)
+        risk_surface.mark_dirty(latitude, longitude)
         
         return {"message": "Accident deleted successfully", "id": accident_id}
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await worker_pools.run_db(db.rollback)
         raise HTTPException(status_code=500, detail=f"Error deleting accident: {str(e)}")
@@ -3,18 +3,31 @@ Prediction API routes
 """
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
 from datetime import datetime
+import json
 
-from app.database import get_db
+import numpy as np
+
+from app.database import get_db, SessionLocal
 from app.models.schemas import (
     PredictionRequest, PredictionResponse,
     RouteAnalysisRequest, RouteAnalysisResponse,
-    RouteSegmentRisk, RoutePoint, RiskLevel
+    RouteComparisonRequest, RouteComparisonResponse,
+    RiskLevel
 )
 from app.models.ml_model import accident_model
+from app.services.executor import worker_pools
+from app.services.inference_scheduler import inference_scheduler
+from app.services.model_reloader import model_reloader
+from app.services.prediction_cache import PredictionCache, prediction_cache
+from app.services.prediction_logger import prediction_logger
 from app.services.risk_calculator import RiskCalculator
+from app.services.risk_surface import risk_surface
+from app.services.route_engine import PreparedRoute, RouteEngine, RouteSummary
+from app.services.route_preprocessing import densify_route
 from config import settings
 
 router = APIRouter(prefix="/prediction", tags=["Prediction"])
@@ -31,13 +44,51 @@ async def predict_risk(
     Returns risk level (low/medium/high), probability, and warning message
     """
     try:
-        # Get nearby accidents for context
-        nearby_accidents = RiskCalculator.get_nearby_accidents(
-            db,
-            request.latitude,
-            request.longitude,
-            radius_km=settings.NEARBY_RADIUS_KM
-        )
+        # Prepare timestamp
+        timestamp = request.timestamp or datetime.now()
+        weather_condition = request.weather_condition.value if request.weather_condition else "clear"
+        road_type = request.road_type.value if request.road_type else "urban"
+        
+        async def compute():
+            # Precomputed cells answer without a count or a model call
+            if settings.RISK_SURFACE_ENABLED:
+                precomputed = risk_surface.lookup(
+                    request.latitude, request.longitude, timestamp, weather_condition, road_type
+                )
+                if precomputed is not None:
+                    return precomputed
+            
+            # Count nearby accidents for context
+            nearby_accidents_count = await worker_pools.run_db(
+                RiskCalculator.count_nearby_accidents,
+                db,
+                request.latitude,
+                request.longitude,
+                radius_km=settings.NEARBY_RADIUS_KM
+            )
+            
+            # Get prediction from ML model, batched with concurrent requests
+            risk_level, risk_probability = await inference_scheduler.predict_risk(
+                latitude=request.latitude,
+                longitude=request.longitude,
+                timestamp=timestamp,
+                weather_condition=weather_condition,
+                road_type=road_type,
+                historical_accidents=nearby_accidents_count
+            )
+            return risk_level, risk_probability, nearby_accidents_count
+        
+        # Requests in the same ~100m cell, hour of week, weather and road
+        # type share one result until it expires or an accident nearby changes
+        if settings.PREDICTION_CACHE_ENABLED:
+            cache_key = PredictionCache.make_key(
+                request.latitude, request.longitude, timestamp, weather_condition, road_type
+            )
+            risk_level, risk_probability, nearby_accidents_count = await prediction_cache.get_or_compute(
+                cache_key, request.latitude, request.longitude, compute
+            )
+        else:
+            risk_level, risk_probability, nearby_accidents_count = await compute()
         
         # Generate segment ID
         segment_id = RiskCalculator.generate_segment_id(
@@ -45,25 +96,23 @@ async def predict_risk(
             request.longitude
         )
         
-        # Prepare timestamp
-        timestamp = request.timestamp or datetime.now()
-        
-        # Get prediction from ML model
-        risk_level, risk_probability = accident_model.predict_risk(
-            latitude=request.latitude,
-            longitude=request.longitude,
-            timestamp=timestamp,
-            weather_condition=request.weather_condition.value if request.weather_condition else "clear",
-            road_type=request.road_type.value if request.road_type else "urban",
-            historical_accidents=len(nearby_accidents)
-        )
-        
         # Get appropriate message
         messages = accident_model.get_risk_message(risk_level, language="vi")
         
         # Calculate risk score (0-100)
         risk_score = risk_probability * 100
         
+        # Prediction history, written in batches in the background
+        await prediction_logger.log(
+            latitude=request.latitude,
+            longitude=request.longitude,
+            risk_level=risk_level,
+            risk_probability=risk_probability,
+            timestamp=timestamp,
+            weather_condition=weather_condition,
+            model_version=accident_model.version if accident_model.is_trained else "fallback"
+        )
+        
         return PredictionResponse(
             latitude=request.latitude,
             longitude=request.longitude,
@@ -72,7 +121,7 @@ async def predict_risk(
             risk_score=risk_score,
             message=messages["message"],
             warning_message=messages["warning"],
-            nearby_accidents_count=len(nearby_accidents),
+            nearby_accidents_count=nearby_accidents_count,
             road_segment_id=segment_id,
             timestamp=timestamp
         )
@@ -81,6 +130,61 @@ async def predict_risk(
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
 
+def prepare_routes(db: Session, requests: List[RouteAnalysisRequest]) -> List[PreparedRoute]:
+    """
+    Resample requested routes and assign accidents to their segments
+
+    Candidate accidents for all corridors are fetched once, so alternative
+    routes sharing most of their geometry do not repeat the query.
+    Blocking; run on the DB pool.
+    """
+    width_km = settings.ROUTE_CORRIDOR_WIDTH_KM
+    # Segment boundaries, lengths and midpoints along each route
+    resampled = [
+        RouteEngine.prepare_points(request.route_points, request.resample)
+        for request in requests
+    ]
+    
+    dense = [
+        densify_route(geometry.path_latitudes, geometry.path_longitudes, width_km)
+        for _, _, _, geometry in resampled
+    ]
+    candidates = RouteEngine.fetch_candidates(
+        db,
+        np.concatenate([lats for lats, _ in dense]),
+        np.concatenate([lons for _, lons in dense]),
+        width_km * 1.5
+    )
+    
+    routes = []
+    for points, start_indices, end_indices, geometry in resampled:
+        # Accident counts from one corridor query along the full path,
+        # bends included, summed per segment
+        corridor = RiskCalculator.get_route_corridor_accidents(
+            db, list(zip(geometry.path_latitudes.tolist(), geometry.path_longitudes.tolist())),
+            width_km=width_km, candidates=candidates
+        )
+        edge_segments = np.searchsorted(
+            geometry.boundary_positions, np.arange(len(geometry.path_latitudes) - 1), side="right"
+        ) - 1
+        accidents_counts = np.bincount(
+            edge_segments, weights=corridor['segment_counts'], minlength=len(points) - 1
+        ).astype(np.int64)
+        routes.append(PreparedRoute(
+            points=points,
+            geometry=geometry,
+            start_indices=start_indices,
+            end_indices=end_indices,
+            accidents_counts=accidents_counts.tolist()
+        ))
+    return routes
+
+
+def prepare_route(db: Session, request: RouteAnalysisRequest) -> PreparedRoute:
+    """Single-route version of prepare_routes"""
+    return prepare_routes(db, [request])[0]
+
+
 @router.post("/route-analysis", response_model=RouteAnalysisResponse)
 async def analyze_route(
     request: RouteAnalysisRequest,
@@ -98,107 +202,134 @@ async def analyze_route(
                 detail="Route must have at least 2 points"
             )
         
-        # Sort route points by order
-        sorted_points = sorted(request.route_points, key=lambda p: p.order)
+        route = await worker_pools.run_db(prepare_route, db, request)
+        geometry = route.geometry
         
-        # Convert to coordinate tuples
-        route_coords = [(p.latitude, p.longitude) for p in sorted_points]
+        # Count accidents around every midpoint from one candidate fetch;
+        # this matches the model's historical_accidents feature
+        historical_counts = await worker_pools.run_db(
+            RouteEngine.count_accidents,
+            db, geometry.mid_latitudes, geometry.mid_longitudes
+        )
         
-        # Analyze route
-        analysis = RiskCalculator.analyze_route(db, route_coords)
+        # Score all segment midpoints with a single model call
+        risk_levels, risk_probabilities = await worker_pools.run_model(
+            accident_model.predict_risk_many,
+            geometry.mid_latitudes, geometry.mid_longitudes,
+            historical_accidents=historical_counts
+        )
         
-        # Build segment risks
-        segment_risks = []
-        total_distance = 0
-        high_risk_count = 0
+        return RouteEngine.build_response(route, risk_levels, risk_probabilities)
         
-        for i in range(len(sorted_points) - 1):
-            start_point = sorted_points[i]
-            end_point = sorted_points[i + 1]
-            
-            # Calculate segment distance
-            distance = RiskCalculator.calculate_distance(
-                start_point.latitude, start_point.longitude,
-                end_point.latitude, end_point.longitude
-            )
-            total_distance += distance
-            
-            # Get midpoint for risk assessment
-            mid_lat = (start_point.latitude + end_point.latitude) / 2
-            mid_lon = (start_point.longitude + end_point.longitude) / 2
-            
-            # Get prediction for segment
-            risk_level, risk_probability = accident_model.predict_risk(
-                latitude=mid_lat,
-                longitude=mid_lon,
-                historical_accidents=len(RiskCalculator.get_nearby_accidents(
-                    db, mid_lat, mid_lon, radius_km=1.0
-                ))
-            )
-            
-            if risk_level == "high":
-                high_risk_count += 1
-            
-            # Estimate time (assuming 50 km/h average speed)
-            estimated_time = (distance / 50) * 60  # minutes
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Route analysis error: {str(e)}")
+
+
+def _ndjson(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+@router.post("/route-analysis/stream")
+async def analyze_route_stream(
+    request: RouteAnalysisRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Analyze a route and stream segment risks as newline-delimited JSON
+    
+    Each line is a JSON object with a "type" field: one "segment" line per
+    scored segment in route order, then a final "summary" line with the
+    overall metrics of /route-analysis. Segments are scored in chunks of
+    ROUTE_STREAM_CHUNK_SIZE, so clients can render the first segments of a
+    long route before the rest is done. An "error" line ends the stream if
+    scoring fails midway.
+    """
+    if len(request.route_points) < 2:
+        raise HTTPException(
+            status_code=400,
+            detail="Route must have at least 2 points"
+        )
+    
+    try:
+        route = await worker_pools.run_db(prepare_route, db, request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Route analysis error: {str(e)}")
+    
+    async def stream():
+        # The request session may be closed once the response starts,
+        # so chunks are scored on a session owned by the stream
+        stream_db = SessionLocal()
+        chunks = RouteEngine.iter_segment_chunks(stream_db, route)
+        summary = RouteSummary()
+        index = 0
+        try:
+            while True:
+                chunk = await worker_pools.run_db(next, chunks, None)
+                if chunk is None:
+                    break
+                summary.add(chunk, route.geometry.distances_km[index:index + len(chunk)])
+                for segment in chunk:
+                    yield _ndjson({"type": "segment", "index": index, **segment.model_dump(mode="json")})
+                    index += 1
             
-            segment_risks.append(RouteSegmentRisk(
-                start_point=start_point,
-                end_point=end_point,
-                risk_level=RiskLevel(risk_level),
-                risk_score=risk_probability * 100,
-                distance_km=round(distance, 2),
-                estimated_time_minutes=round(estimated_time, 1),
-                accidents_count=len(RiskCalculator.get_nearby_accidents(
-                    db, mid_lat, mid_lon, radius_km=1.0
-                ))
-            ))
+            overall = summary.to_response([]).model_dump(mode="json", exclude={"segment_risks"})
+            yield _ndjson({"type": "summary", "segments_count": index, **overall})
+        except Exception as e:
+            yield _ndjson({"type": "error", "detail": f"Route analysis error: {str(e)}"})
+        finally:
+            await worker_pools.run_db(stream_db.close)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.post("/route-comparison", response_model=RouteComparisonResponse)
+async def compare_routes(
+    request: RouteComparisonRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Compare alternative routes, safest first
+    
+    Segment midpoints of all routes are merged into cells of
+    ROUTE_COMPARISON_CELL_DEG, and each distinct cell is counted and scored
+    once, so stretches shared by several alternatives cost nothing extra.
+    Each route gets the same analysis as /route-analysis; scores of shared
+    cells are taken at the first midpoint seen in the cell.
+    """
+    try:
+        routes = await worker_pools.run_db(prepare_routes, db, request.routes)
         
-        # Calculate overall metrics
-        avg_risk_score = sum(s.risk_score for s in segment_risks) / len(segment_risks)
-        estimated_total_time = sum(s.estimated_time_minutes for s in segment_risks)
+        mid_lats = np.concatenate([r.geometry.mid_latitudes for r in routes])
+        mid_lons = np.concatenate([r.geometry.mid_longitudes for r in routes])
+        cell_lats, cell_lons, inverse = RouteEngine.unique_cells(mid_lats, mid_lons)
         
-        # Determine overall risk level
-        if avg_risk_score < 20:
-            overall_risk_level = RiskLevel.LOW
-        elif avg_risk_score < 50:
-            overall_risk_level = RiskLevel.MEDIUM
-        else:
-            overall_risk_level = RiskLevel.HIGH
+        # Score the union of all routes with one count and one model call
+        historical_counts = await worker_pools.run_db(
+            RouteEngine.count_accidents, db, cell_lats, cell_lons
+        )
+        risk_levels, risk_probabilities = await worker_pools.run_model(
+            accident_model.predict_risk_many,
+            cell_lats, cell_lons,
+            historical_accidents=historical_counts
+        )
+        segment_levels = np.asarray(risk_levels)[inverse].tolist()
+        segment_probabilities = np.asarray(risk_probabilities)[inverse]
         
-        # Generate recommendations
-        recommendations = []
-        if high_risk_count > 0:
-            recommendations.append(
-                f"Tuyến đường có {high_risk_count} đoạn nguy hiểm. Cân nhắc chọn tuyến đường khác."
-            )
-        if overall_risk_level == RiskLevel.HIGH:
-            recommendations.append(
-                "Mức độ rủi ro tổng thể cao. Giảm tốc độ và tăng cường cảnh giác."
-            )
-        if avg_risk_score > 30:
-            recommendations.append(
-                "Tránh di chuyển vào giờ cao điểm hoặc thời tiết xấu nếu có thể."
-            )
-        if not recommendations:
-            recommendations.append(
-                "Tuyến đường tương đối an toàn. Vẫn cần chú ý quan sát."
-            )
+        analyses = []
+        offset = 0
+        for route in routes:
+            stop = offset + len(route.geometry.distances_km)
+            analyses.append(RouteEngine.build_response(
+                route, segment_levels[offset:stop], segment_probabilities[offset:stop]
+            ))
+            offset = stop
         
-        return RouteAnalysisResponse(
-            total_distance_km=round(total_distance, 2),
-            estimated_time_minutes=round(estimated_total_time, 1),
-            overall_risk_level=overall_risk_level,
-            overall_risk_score=round(avg_risk_score, 2),
-            segment_risks=segment_risks,
-            high_risk_segments_count=high_risk_count,
-            recommendations=recommendations
-        )
+        return RouteEngine.rank_routes(analyses, scored_cells_count=len(cell_lats))
         
-    except HTTPException:
-        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Route analysis error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Route comparison error: {str(e)}")
 
 
 @router.get("/health")
@@ -207,5 +338,30 @@ async def health_check():
     return {
         "status": "healthy",
         "model_loaded": accident_model.is_trained,
+        "model": model_reloader.stats(),
         "timestamp": datetime.now().isoformat()
     }
+
+
+@router.get("/scheduler-stats")
+async def scheduler_stats():
+    """Batching window, batch sizes and queue depth of the inference scheduler"""
+    return inference_scheduler.stats()
+
+
+@router.get("/cache-stats")
+async def cache_stats():
+    """Size and hit/miss/eviction counters of the prediction cache"""
+    return prediction_cache.stats()
+
+
+@router.get("/log-stats")
+async def log_stats():
+    """Prediction history logger metrics"""
+    return prediction_logger.stats()
+
+
+@router.get("/surface-stats")
+async def surface_stats():
+    """Grid, size and build metadata of the precomputed risk surface"""
+    return risk_surface.stats()
@@ -0,0 +1,406 @@
+"""
+Columnar, memory-mapped snapshot of the accidents table
+
+Features that need every accident (index builds, training) read these
+NumPy column files instead of loading ORM objects. Per accident they hold
+the id, coordinates, timestamp, hour of day and encoded severity, road
+type and weather in 37 bytes.
+
+Files live in ACCIDENT_SNAPSHOT_DIR:
+
+    snapshot.json             rows, capacity, watermark, generation
+    <column>-<generation>.npy preallocated to `capacity` rows
+
+The files are mapped read-only, so every worker on a host shares one copy
+in the page cache. refresh() brings the snapshot up to date under a file
+lock:
+
+- Rows with an id above the watermark (the largest id in the snapshot) are
+  appended in id order. They are written past `rows` and then published by
+  rewriting snapshot.json, so readers never see a partial row.
+- When the capacity runs out, a new generation of files with twice the
+  capacity is written and swapped in. Old files stay valid for whoever
+  still has them mapped.
+- Deleted accidents are flagged in the `deleted` column by mark_deleted,
+  under the same locks. If the number of live rows then differs from the
+  accident total of the statistics rollup, ids are compared with the
+  table (an index-only scan) to find deletions made elsewhere.
+
+A restart therefore only reads the accidents added since the last refresh.
+Changes that keep ids, such as UPDATEs of coordinates, are not detected;
+run `python -m scripts.refresh_accident_snapshot --rebuild` after them.
+"""
+
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.database import Accident, AccidentDailyRollup
+from app.models.ml_model import ROAD_TYPE_SCORES, WEATHER_SCORES
+from app.services.risk_calculator import SEVERITY_SCORES
+from config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: refreshes from several processes are not serialized
+    fcntl = None
+
+
+# Condition columns are stored as codes into these lists; the last entry
+# (None) stands for missing values and values the model does not know
+SEVERITY_VALUES = list(SEVERITY_SCORES) + [None]
+WEATHER_VALUES = list(WEATHER_SCORES) + [None]
+ROAD_TYPE_VALUES = list(ROAD_TYPE_SCORES) + [None]
+
+COLUMN_DTYPES = {
+    "id": np.int64,
+    "latitude": np.float64,
+    "longitude": np.float64,
+    "timestamp": "datetime64[s]",
+    "hour": np.int8,  # -1 if not set
+    "severity": np.int8,
+    "road_type": np.int8,
+    "weather": np.int8,
+    "deleted": np.bool_,
+}
+
+FORMAT_VERSION = 1
+METADATA_FILE = "snapshot.json"
+LOCK_FILE = "snapshot.lock"
+
+# Accidents read per chunk of the table scan
+SCAN_CHUNK_ROWS = 100_000
+
+# Capacity of a new snapshot beyond the current row count
+MIN_CAPACITY = 1024
+
+
+def encode(values: Iterable[Optional[str]], vocabulary: List[Optional[str]]) -> np.ndarray:
+    """Codes of `values` in `vocabulary`, case-insensitive"""
+    codes = {value: i for i, value in enumerate(vocabulary) if value is not None}
+    unknown = len(vocabulary) - 1
+    return np.array(
+        [codes.get(value.lower(), unknown) if value else unknown for value in values],
+        dtype=np.int8
+    )
+
+
+def _source_id() -> str:
+    # Identifies the database without keeping its credentials on disk
+    return hashlib.sha256(settings.DATABASE_URL.encode()).hexdigest()[:16]
+
+
+class AccidentSnapshot:
+    """Memory-mapped accident columns, refreshed incrementally from the database"""
+
+    def __init__(self, directory: str = None):
+        self.directory = Path(directory or settings.ACCIDENT_SNAPSHOT_DIR)
+        self._metadata: Optional[dict] = None
+        self._columns: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+        # Metrics of the last refresh
+        self.last_refresh: Optional[dict] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._metadata is not None
+
+    @property
+    def watermark(self) -> int:
+        return self._metadata["watermark"] if self._metadata else 0
+
+    @property
+    def created_at(self) -> Optional[str]:
+        """When the snapshot was started; changes when it is rebuilt"""
+        return self._metadata["created_at"] if self._metadata else None
+
+    def __len__(self) -> int:
+        """Number of live (not deleted) accidents"""
+        if not self._metadata:
+            return 0
+        return self._metadata["rows"] - int(np.count_nonzero(self._columns["deleted"][:self._metadata["rows"]]))
+
+    # Reading
+
+    def open(self) -> bool:
+        """
+        Map the snapshot on disk read-only
+
+        Returns:
+            False if there is no usable snapshot for the configured database
+        """
+        metadata = self._read_metadata()
+        if metadata is None:
+            self._metadata, self._columns = None, {}
+            return False
+        if self._metadata is None or metadata["generation"] != self._metadata["generation"]:
+            self._columns = {
+                name: np.load(self._column_path(name, metadata["generation"]), mmap_mode="r")
+                for name in COLUMN_DTYPES
+            }
+        self._metadata = metadata
+        return True
+
+    def columns(self, names: Iterable[str] = None, include_deleted: bool = False) -> Dict[str, np.ndarray]:
+        """
+        Columns of the snapshot's accidents in id order
+
+        Without `include_deleted` the arrays are copies holding live rows
+        only; with it they are read-only views of the mapped files.
+        """
+        if not self.is_open:
+            raise RuntimeError("Accident snapshot is not open; call refresh() first")
+        rows = self._metadata["rows"]
+        names = list(names or COLUMN_DTYPES)
+        views = {name: self._columns[name][:rows] for name in names}
+        if include_deleted:
+            return views
+        live = ~self._columns["deleted"][:rows]
+        if live.all():
+            return {name: np.array(view) for name, view in views.items()}
+        return {name: view[live] for name, view in views.items()}
+
+    def mark_deleted(self, accident_id: int) -> bool:
+        """Flag a deleted accident; False if it is not in the snapshot"""
+        if not self.is_open:
+            return False
+        with self._lock, self._file_lock():
+            # Another process may have appended or moved to a new generation
+            if not self.open():
+                return False
+            rows = self._metadata["rows"]
+            position = int(np.searchsorted(self._columns["id"][:rows], accident_id))
+            if position >= rows or self._columns["id"][position] != accident_id:
+                return False
+            deleted = np.load(self._column_path("deleted", self._metadata["generation"]), mmap_mode="r+")
+            deleted[position] = True
+            deleted.flush()
+        return True
+
+    # Writing
+
+    def refresh(self, db: Session, rebuild: bool = False) -> dict:
+        """
+        Append accidents added since the last refresh and detect deletions
+
+        The first refresh, and one with `rebuild`, reads the whole table.
+
+        Returns:
+            Dictionary with the rows appended, deletions found, whether the
+            snapshot was rebuilt and the time taken
+        """
+        started_at = time.perf_counter()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        with self._lock, self._file_lock():
+            rebuilt = rebuild or not self.open()
+            if rebuilt:
+                self._create(db)
+
+            appended = self._append(db)
+            deleted = self._reconcile(db)
+            if deleted is None:
+                # Ids the snapshot has never seen below the watermark
+                self._create(db)
+                appended = self._append(db)
+                deleted, rebuilt = 0, True
+
+        self.last_refresh = {
+            "rebuilt": rebuilt,
+            "appended": appended,
+            "deleted": deleted,
+            "rows": len(self),
+            "watermark": self.watermark,
+            "seconds": round(time.perf_counter() - started_at, 3),
+            "finished_at": datetime.now().isoformat()
+        }
+        return self.last_refresh
+
+    def _create(self, db: Session):
+        """Start an empty snapshot sized for the current table"""
+        total = db.query(func.count(Accident.id)).scalar()
+        generation = (self._metadata["generation"] + 1) if self._metadata else 1
+        capacity = max(MIN_CAPACITY, int(total * 1.25))
+        self._allocate(generation, capacity, rows=0)
+        self._publish({
+            "version": FORMAT_VERSION,
+            "source": _source_id(),
+            "generation": generation,
+            "capacity": capacity,
+            "rows": 0,
+            "watermark": 0,
+            "created_at": datetime.now().isoformat()
+        })
+
+    def _append(self, db: Session) -> int:
+        metadata = dict(self._metadata)
+        pending = db.query(func.count(Accident.id)).filter(Accident.id > metadata["watermark"]).scalar()
+        if not pending:
+            return 0
+
+        rows = metadata["rows"]
+        if rows + pending > metadata["capacity"]:
+            capacity = max(2 * metadata["capacity"], rows + pending)
+            metadata["generation"] += 1
+            metadata["capacity"] = capacity
+            self._allocate(metadata["generation"], capacity, rows)
+
+        writable = {
+            name: np.load(self._column_path(name, metadata["generation"]), mmap_mode="r+")
+            for name in COLUMN_DTYPES
+        }
+        query = iter(db.query(
+            Accident.id, Accident.latitude, Accident.longitude, Accident.accident_date,
+            Accident.hour_of_day, Accident.severity, Accident.road_type, Accident.weather_condition
+        ).filter(Accident.id > metadata["watermark"]).order_by(Accident.id).yield_per(SCAN_CHUNK_ROWS))
+
+        # Rows inserted after the count are left for the next refresh
+        appended = 0
+        while appended < pending:
+            chunk = list(islice(query, min(SCAN_CHUNK_ROWS, pending - appended)))
+            if not chunk:
+                break
+            ids, latitudes, longitudes, dates, hours, severities, road_types, weather = zip(*chunk)
+            start, stop = rows + appended, rows + appended + len(chunk)
+            writable["id"][start:stop] = ids
+            writable["latitude"][start:stop] = latitudes
+            writable["longitude"][start:stop] = longitudes
+            writable["timestamp"][start:stop] = np.array(dates, dtype="datetime64[s]")
+            writable["hour"][start:stop] = [-1 if hour is None else hour for hour in hours]
+            writable["severity"][start:stop] = encode(severities, SEVERITY_VALUES)
+            writable["road_type"][start:stop] = encode(road_types, ROAD_TYPE_VALUES)
+            writable["weather"][start:stop] = encode(weather, WEATHER_VALUES)
+            writable["deleted"][start:stop] = False
+            appended += len(chunk)
+            metadata["watermark"] = int(ids[-1])
+
+        for column in writable.values():
+            column.flush()
+        metadata["rows"] = rows + appended
+        self._publish(metadata)
+        return appended
+
+    def _reconcile(self, db: Session) -> Optional[int]:
+        """
+        Flag accidents deleted outside mark_deleted
+
+        Returns:
+            Number of rows newly flagged, or None if the table has ids below
+            the watermark that the snapshot does not know
+        """
+        expected = db.query(func.coalesce(func.sum(AccidentDailyRollup.accident_count), 0)).scalar()
+        if expected == len(self):
+            return 0
+
+        rows = self._metadata["rows"]
+        table_ids = np.fromiter(
+            (accident_id for accident_id, in db.query(Accident.id).filter(
+                Accident.id <= self.watermark
+            ).yield_per(SCAN_CHUNK_ROWS)),
+            dtype=np.int64
+        )
+        snapshot_ids = self._columns["id"][:rows]
+        live = ~self._columns["deleted"][:rows]
+        if not np.isin(table_ids, snapshot_ids[live], assume_unique=True).all():
+            return None
+
+        missing = live & ~np.isin(snapshot_ids, table_ids, assume_unique=True)
+        if missing.any():
+            deleted = np.load(self._column_path("deleted", self._metadata["generation"]), mmap_mode="r+")
+            deleted[np.flatnonzero(missing)] = True
+            deleted.flush()
+        return int(missing.sum())
+
+    def _allocate(self, generation: int, capacity: int, rows: int):
+        """Write column files of a new generation, copying the first `rows` rows"""
+        for name, dtype in COLUMN_DTYPES.items():
+            path = self._column_path(name, generation)
+            temporary = path.with_suffix(".tmp.npy")
+            column = np.lib.format.open_memmap(temporary, mode="w+", dtype=dtype, shape=(capacity,))
+            if rows:
+                column[:rows] = self._columns[name][:rows]
+            column.flush()
+            del column
+            os.replace(temporary, path)
+
+    def _publish(self, metadata: dict):
+        """Atomically replace snapshot.json and remap if the generation changed"""
+        path = self.directory / METADATA_FILE
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(metadata, indent=2))
+        os.replace(temporary, path)
+
+        self.open()
+        current = {self._column_path(name, metadata["generation"]) for name in COLUMN_DTYPES}
+        for path in self.directory.glob("*-*.npy"):
+            if path not in current:
+                try:
+                    path.unlink()
+                except OSError:  # Still mapped by another process on Windows
+                    pass
+
+    # Files
+
+    def _column_path(self, name: str, generation: int) -> Path:
+        return self.directory / f"{name}-{generation}.npy"
+
+    def _read_metadata(self) -> Optional[dict]:
+        try:
+            metadata = json.loads((self.directory / METADATA_FILE).read_text())
+        except (OSError, ValueError):
+            return None
+        if metadata.get("version") != FORMAT_VERSION or metadata.get("source") != _source_id():
+            return None
+        if not all(self._column_path(name, metadata["generation"]).exists() for name in COLUMN_DTYPES):
+            return None
+        return metadata
+
+    def _file_lock(self):
+        return _FileLock(self.directory / LOCK_FILE)
+
+    def stats(self) -> dict:
+        """State of the snapshot and metrics of the last refresh"""
+        return {
+            "open": self.is_open,
+            "directory": str(self.directory),
+            "rows": len(self),
+            "capacity": self._metadata["capacity"] if self._metadata else 0,
+            "watermark": self.watermark,
+            "generation": self._metadata["generation"] if self._metadata else None,
+            "last_refresh": self.last_refresh
+        }
+
+
+class _FileLock:
+    """Exclusive lock on a file, held by one process at a time"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+# Global snapshot instance
+accident_snapshot = AccidentSnapshot()
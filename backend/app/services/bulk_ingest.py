@@ -0,0 +1,235 @@
+"""
+Bulk import of accident records from CSV or Parquet files
+
+Files are parsed in chunks of BULK_INGEST_CHUNK_ROWS with pandas, so memory
+does not grow with the file size. Each chunk is validated and its time
+columns derived with vectorized operations. The chunk is then written in
+its own transaction with a single statement: COPY on PostgreSQL
+(psycopg2), a multi-row INSERT elsewhere.
+
+Nothing is maintained per row. The daily statistics rollup is updated
+with the counts of each chunk in the chunk's transaction; road segment
+statistics and the spatial index are refreshed once, after the last chunk
+or after the chunk that failed.
+
+Column names follow the accidents table. `latitude`, `longitude` and
+`accident_date` are required. `hour_of_day` and `day_of_week` are always
+derived from `accident_date`. Rows with a missing or invalid required
+value are skipped and counted as rejected.
+"""
+
+from datetime import datetime
+from typing import IO, Iterator, NamedTuple, Optional, Union
+import io
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.database import Accident
+from app.services.accident_snapshot import accident_snapshot
+from app.services.segment_refresher import recompute_segments
+from app.services.spatial_index import accident_index
+from app.services.statistics_rollup import record_frame
+from config import settings
+
+
+FORMATS = ("csv", "parquet")
+
+TEXT_COLUMNS = [
+    "road_name", "road_type", "district", "city", "severity", "accident_type",
+    "weather_condition", "road_condition", "light_condition", "description", "reported_by"
+]
+# Lowercased so they match the API enums and the model's score tables
+LOWERCASE_COLUMNS = ["road_type", "severity", "weather_condition", "road_condition", "light_condition"]
+INTEGER_DEFAULTS = {"num_casualties": 0, "num_vehicles": 1}
+
+INSERT_COLUMNS = (
+    ["latitude", "longitude", "accident_date", "hour_of_day", "day_of_week"] +
+    TEXT_COLUMNS + list(INTEGER_DEFAULTS) + ["created_at", "updated_at"]
+)
+
+
+class IngestReport(NamedTuple):
+    """Outcome of a bulk import"""
+    rows_read: int
+    rows_inserted: int
+    rows_rejected: int
+    segments_updated: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_inserted / self.seconds if self.seconds > 0 else 0.0
+
+
+class IngestError(Exception):
+    """An import that failed after some chunks were committed"""
+
+    def __init__(self, message: str, report: IngestReport):
+        super().__init__(message)
+        self.report = report
+
+
+def read_chunks(source: Union[str, IO], file_format: str = "csv", chunk_size: int = None) -> Iterator:
+    """Yield DataFrames of at most `chunk_size` rows from a CSV or Parquet file"""
+    chunk_size = chunk_size or settings.BULK_INGEST_CHUNK_ROWS
+
+    if file_format == "csv":
+        import pandas as pd
+        yield from pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=True)
+    elif file_format == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet import requires the pyarrow package")
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unknown format {file_format!r}; expected one of {FORMATS}")
+
+
+def prepare_chunk(frame, imported_at: datetime):
+    """
+    Normalize a raw chunk into the columns of INSERT_COLUMNS
+
+    Returns:
+        Tuple of (DataFrame of valid rows, number of rejected rows)
+    """
+    import pandas as pd
+
+    frame = frame.rename(columns=lambda name: str(name).strip().lower())
+    missing = {"latitude", "longitude", "accident_date"} - set(frame.columns)
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(sorted(missing))}")
+
+    latitudes = pd.to_numeric(frame["latitude"], errors="coerce")
+    longitudes = pd.to_numeric(frame["longitude"], errors="coerce")
+    dates = pd.to_datetime(frame["accident_date"], errors="coerce", format="mixed")
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+
+    valid = (
+        latitudes.between(-90, 90) &
+        longitudes.between(-180, 180) &
+        dates.notna()
+    )
+
+    rows = pd.DataFrame({
+        "latitude": latitudes[valid].astype("float64"),
+        "longitude": longitudes[valid].astype("float64"),
+        "accident_date": dates[valid],
+        "hour_of_day": dates[valid].dt.hour.astype("int64"),
+        "day_of_week": dates[valid].dt.dayofweek.astype("int64"),
+    })
+    for column in TEXT_COLUMNS:
+        values = frame[column][valid] if column in frame.columns else pd.Series(None, index=rows.index, dtype=object)
+        values = values.astype(object).where(values.notna(), None)
+        if column in LOWERCASE_COLUMNS:
+            values = values.map(lambda value: value.strip().lower() if isinstance(value, str) else value)
+        rows[column] = values
+    rows["reported_by"] = rows["reported_by"].where(rows["reported_by"].notna(), "import")
+    for column, default in INTEGER_DEFAULTS.items():
+        if column in frame.columns:
+            values = pd.to_numeric(frame[column][valid], errors="coerce").fillna(default)
+        else:
+            values = pd.Series(default, index=rows.index)
+        rows[column] = values.astype("int64")
+    rows["created_at"] = imported_at
+    rows["updated_at"] = imported_at
+
+    return rows[INSERT_COLUMNS], int((~valid).sum())
+
+
+def _copy_rows(db: Session, rows):
+    """COPY the rows through the session's psycopg2 connection"""
+    buffer = io.StringIO()
+    rows.to_csv(buffer, header=False, index=False, date_format="%Y-%m-%d %H:%M:%S.%f")
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {Accident.__tablename__} ({', '.join(INSERT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def _insert_rows(db: Session, rows):
+    # Built column-wise: DataFrame.to_dict boxes every value as a pandas
+    # scalar, which takes longer than the insert itself
+    columns = [
+        rows[name].to_numpy().astype("datetime64[us]").tolist()
+        if rows[name].dtype.kind == "M" else rows[name].tolist()
+        for name in INSERT_COLUMNS
+    ]
+    records = [dict(zip(INSERT_COLUMNS, values)) for values in zip(*columns)]
+    db.execute(insert(Accident.__table__), records)
+
+
+def ingest_file(
+    db: Session,
+    source: Union[str, IO],
+    file_format: str = "csv",
+    chunk_size: int = None
+) -> IngestReport:
+    """
+    Import every valid row of a file, one transaction per chunk
+
+    Segment statistics are recomputed in one pass at the end (see
+    recompute_segments) and the spatial index, if built, is rebuilt.
+
+    A failing chunk is rolled back; chunks committed before it stay
+    imported and are maintained as above. If nothing was committed the
+    error is re-raised as is, otherwise as IngestError carrying the report
+    of the partial import.
+    """
+    started_at = time.perf_counter()
+    imported_at = datetime.now()
+    use_copy = db.get_bind().dialect.driver == "psycopg2"
+    rows_read = rows_inserted = rows_rejected = 0
+    error: Optional[Exception] = None
+
+    try:
+        for frame in read_chunks(source, file_format, chunk_size):
+            rows, rejected = prepare_chunk(frame, imported_at)
+            rows_read += len(frame)
+            rows_rejected += rejected
+            if rows.empty:
+                continue
+
+            try:
+                if use_copy:
+                    _copy_rows(db, rows)
+                else:
+                    _insert_rows(db, rows)
+                record_frame(db, rows)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+
+            rows_inserted += len(rows)
+    except Exception as e:
+        if not rows_inserted:
+            raise
+        error = e
+
+    snapshot = accident_snapshot if settings.ACCIDENT_SNAPSHOT_ENABLED else None
+    segments_updated = recompute_segments(db, snapshot)["segments_updated"] if rows_inserted else 0
+    if rows_inserted and accident_index.is_built:
+        accident_index.build(db, snapshot=snapshot)
+
+    report = IngestReport(
+        rows_read=rows_read,
+        rows_inserted=rows_inserted,
+        rows_rejected=rows_rejected,
+        segments_updated=segments_updated,
+        seconds=time.perf_counter() - started_at
+    )
+    if error is not None:
+        raise IngestError(
+            f"{error} (after importing {rows_inserted} rows, which were kept)", report
+        ) from error
+    return report
@@ -0,0 +1,70 @@
+"""
+Thread pools for blocking work called from async route handlers
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+import asyncio
+import functools
+
+from config import settings
+
+
+class WorkerPools:
+    """
+    Bounded executors that keep the event loop responsive
+
+    Synchronous SQLAlchemy calls run on the DB pool and CPU-bound model
+    inference on the model pool, so one slow request cannot stall every
+    other request on the worker. Threads are used for inference as well:
+    NumPy, scikit-learn and XGBoost release the GIL in their compute
+    kernels, and a thread pool avoids pickling the model into every
+    process. Pools are created on first use.
+    """
+
+    def __init__(self, db_workers: int = None, model_workers: int = None):
+        self.db_workers = db_workers or settings.DB_THREAD_POOL_SIZE
+        self.model_workers = model_workers or settings.MODEL_THREAD_POOL_SIZE
+        self._db_pool: Optional[ThreadPoolExecutor] = None
+        self._model_pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def db_pool(self) -> ThreadPoolExecutor:
+        if self._db_pool is None:
+            self._db_pool = ThreadPoolExecutor(
+                max_workers=self.db_workers, thread_name_prefix="db"
+            )
+        return self._db_pool
+
+    @property
+    def model_pool(self) -> ThreadPoolExecutor:
+        if self._model_pool is None:
+            self._model_pool = ThreadPoolExecutor(
+                max_workers=self.model_workers, thread_name_prefix="model"
+            )
+        return self._model_pool
+
+    async def run_db(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking database call on the DB pool"""
+        return await self._run(self.db_pool, func, *args, **kwargs)
+
+    async def run_model(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a CPU-bound model call on the model pool"""
+        return await self._run(self.model_pool, func, *args, **kwargs)
+
+    @staticmethod
+    async def _run(pool: ThreadPoolExecutor, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        """Shut down both pools; they are recreated if used again"""
+        for pool in (self._db_pool, self._model_pool):
+            if pool is not None:
+                pool.shutdown(wait=wait)
+        self._db_pool = None
+        self._model_pool = None
+
+
+# Global pools instance
+worker_pools = WorkerPools()
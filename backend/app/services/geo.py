@@ -0,0 +1,110 @@
+"""
+Vectorized great-circle distance kernels
+
+All functions accept scalars or NumPy arrays and broadcast like ufuncs, so a
+whole batch of distances is computed in a single NumPy pass.
+
+Two formulas are available:
+
+- Haversine: exact on a spherical Earth (R = 6371 km).
+- Equirectangular: projects the pair onto a plane scaled by the cosine of
+  the mean latitude. It needs one trigonometric call per pair instead of
+  five. Against haversine, the relative error stays below 1e-6 for
+  separations up to 10 km at latitudes within ±70°, and below 3e-5 up to
+  50 km. Callers switch to it for radii up to `FAST_DISTANCE_MAX_KM`.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import numpy as np
+
+from config import settings
+
+
+EARTH_RADIUS_KM = 6371.0
+
+# Matrices larger than this are split across threads. NumPy releases the
+# GIL inside ufuncs, so chunks run in parallel on all cores.
+PARALLEL_THRESHOLD = 1_000_000
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Haversine distance in kilometers, broadcasting over all arguments"""
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    delta_lat = lat2 - lat1
+    delta_lon = np.radians(np.subtract(lon2, lon1))
+
+    a = (np.sin(delta_lat / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def equirectangular_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Equirectangular approximation in kilometers (see module docstring)"""
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    # Wrap longitude difference into [-pi, pi) so the antimeridian is handled
+    delta_lon = (np.radians(np.subtract(lon2, lon1)) + np.pi) % (2 * np.pi) - np.pi
+
+    x = delta_lon * np.cos((lat1 + lat2) / 2)
+    y = lat2 - lat1
+    return EARTH_RADIUS_KM * np.hypot(x, y)
+
+
+def distance_km(lat1, lon1, lat2, lon2, approximate: bool = False) -> np.ndarray:
+    """Elementwise distance using the requested formula"""
+    kernel = equirectangular_km if approximate else haversine_km
+    return kernel(lat1, lon1, lat2, lon2)
+
+
+def distance_matrix(
+    origin_lats,
+    origin_lons,
+    lats,
+    lons,
+    approximate: bool = False,
+    workers: int = None
+) -> np.ndarray:
+    """
+    Distances from every origin to every candidate
+
+    Returns:
+        Array of shape (len(origins), len(candidates)) in kilometers
+    """
+    origin_lats = np.asarray(origin_lats, dtype=np.float64).reshape(-1, 1)
+    origin_lons = np.asarray(origin_lons, dtype=np.float64).reshape(-1, 1)
+    lats = np.asarray(lats, dtype=np.float64).reshape(1, -1)
+    lons = np.asarray(lons, dtype=np.float64).reshape(1, -1)
+
+    n_origins, n_candidates = origin_lats.shape[0], lats.shape[1]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or n_origins < 2 or n_origins * n_candidates < PARALLEL_THRESHOLD:
+        return distance_km(origin_lats, origin_lons, lats, lons, approximate)
+
+    result = np.empty((n_origins, n_candidates), dtype=np.float64)
+    bounds = np.linspace(0, n_origins, min(workers, n_origins) + 1, dtype=int)
+
+    def fill(start: int, stop: int):
+        result[start:stop] = distance_km(
+            origin_lats[start:stop], origin_lons[start:stop], lats, lons, approximate
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fill, bounds[:-1], bounds[1:]))
+
+    return result
+
+
+def path_lengths_km(lats, lons, approximate: bool = False) -> np.ndarray:
+    """Lengths of the consecutive segments of a polyline"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    return distance_km(lats[:-1], lons[:-1], lats[1:], lons[1:], approximate)
+
+
+def use_approximation(radius_km: float) -> bool:
+    """Whether the equirectangular kernel is accurate enough for this radius"""
+    return radius_km <= settings.FAST_DISTANCE_MAX_KM
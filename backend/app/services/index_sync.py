@@ -0,0 +1,126 @@
+"""
+Catch-up of the in-memory spatial index with other workers
+
+Each API worker has its own AccidentSpatialIndex and prediction cache. A
+create, delete or bulk import only updates the worker that handled it, so
+with several workers /accidents/nearby, the historical_accidents feature
+and cached predictions would depend on which worker answers. IndexSync
+runs AccidentSpatialIndex.sync every SPATIAL_INDEX_SYNC_INTERVAL_SECONDS,
+from the shared accident snapshot when it is enabled, and then drops the
+cached predictions and risk surface cells around the accidents it applied.
+"""
+
+from typing import Optional
+import asyncio
+import time
+
+from app.database import SessionLocal
+from app.services.accident_snapshot import accident_snapshot
+from app.services.executor import worker_pools
+from app.services.prediction_cache import prediction_cache
+from app.services.risk_surface import risk_surface
+from app.services.spatial_index import accident_index
+from config import settings
+
+
+# Above this many changes the whole cache is dropped instead of each area
+MAX_AREA_INVALIDATIONS = 100
+
+
+class IndexSync:
+    """Periodically applies other workers' accident changes to this worker's index"""
+
+    def __init__(self, interval_seconds: float = None):
+        self.interval_seconds = (
+            settings.SPATIAL_INDEX_SYNC_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+        )
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.syncs = 0
+        self.failures = 0
+        self.rebuilds = 0
+        self.applied_total = 0
+        self.last_sync_ms = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.is_running or self.interval_seconds <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self.is_running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.sync()
+            except Exception as e:
+                self.failures += 1
+                print(f"Spatial index sync failed: {e}")
+
+    async def sync(self) -> Optional[int]:
+        """
+        Run one catch-up now
+
+        Returns:
+            Number of accidents added or removed, or None if the index was
+            rebuilt
+        """
+        started_at = time.perf_counter()
+        changed = await worker_pools.run_db(self._sync)
+        self.syncs += 1
+        self.last_sync_ms = (time.perf_counter() - started_at) * 1000
+
+        if changed is None:
+            self.rebuilds += 1
+        else:
+            self.applied_total += len(changed)
+
+        # Cached and precomputed predictions nearby were computed without these changes
+        if changed is None or len(changed) > MAX_AREA_INVALIDATIONS:
+            prediction_cache.clear()
+            risk_surface.mark_all_dirty()
+        else:
+            for latitude, longitude in changed:
+                prediction_cache.invalidate_near(latitude, longitude)
+                risk_surface.mark_dirty(latitude, longitude)
+        return None if changed is None else len(changed)
+
+    @staticmethod
+    def _sync():
+        db = SessionLocal()
+        try:
+            return accident_index.sync(
+                db, snapshot=accident_snapshot if settings.ACCIDENT_SNAPSHOT_ENABLED else None
+            )
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.is_running,
+            "interval_seconds": self.interval_seconds,
+            "syncs": self.syncs,
+            "failures": self.failures,
+            "rebuilds": self.rebuilds,
+            "applied_total": self.applied_total,
+            "last_sync_ms": round(self.last_sync_ms, 3),
+            "indexed_accidents": len(accident_index)
+        }
+
+
+# Global sync instance
+index_sync = IndexSync()
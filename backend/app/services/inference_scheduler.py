@@ -0,0 +1,202 @@
+"""
+Micro-batching scheduler for risk predictions
+"""
+
+from typing import List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import time
+
+from app.models.ml_model import AccidentRiskModel, accident_model
+from app.services.executor import worker_pools
+from config import settings
+
+
+class _PendingPrediction:
+    """A queued prediction request and the future its caller awaits"""
+
+    __slots__ = (
+        "latitude", "longitude", "timestamp", "weather_condition",
+        "road_type", "historical_accidents", "future", "enqueued_at"
+    )
+
+    def __init__(self, latitude, longitude, timestamp, weather_condition,
+                 road_type, historical_accidents, future):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.timestamp = timestamp
+        self.weather_condition = weather_condition
+        self.road_type = road_type
+        self.historical_accidents = historical_accidents
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class InferenceScheduler:
+    """
+    Collects concurrent predict_risk calls into batched model invocations
+
+    Requests are queued and a single worker task drains them: it waits for
+    the first request, keeps collecting until `window_ms` has elapsed or
+    `max_batch_size` requests are waiting, runs one predict_risk_many call
+    on the model pool and resolves every caller's future with its own row.
+    """
+
+    def __init__(
+        self,
+        model: AccidentRiskModel = None,
+        window_ms: float = None,
+        max_batch_size: int = None,
+        max_queue_size: int = None
+    ):
+        self.model = model or accident_model
+        self.window_ms = settings.INFERENCE_BATCH_WINDOW_MS if window_ms is None else window_ms
+        self.max_batch_size = max_batch_size or settings.INFERENCE_MAX_BATCH_SIZE
+        self.max_queue_size = max_queue_size or settings.INFERENCE_MAX_QUEUE_SIZE
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.requests_total = 0
+        self.batches_total = 0
+        self.largest_batch = 0
+        self.last_batch_size = 0
+        self.total_wait_ms = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """Start the batching worker on the running event loop"""
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker after answering every queued request"""
+        if not self.is_running:
+            return
+        # The sentinel is queued behind all pending requests
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+
+        # Answer anything that was queued behind the sentinel
+        pending = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                pending.append(item)
+        if pending:
+            await self._run_batch(pending)
+
+    async def predict_risk(
+        self,
+        latitude: float,
+        longitude: float,
+        timestamp: Optional[datetime] = None,
+        weather_condition: str = "clear",
+        road_type: str = "urban",
+        historical_accidents: int = 0
+    ) -> Tuple[str, float]:
+        """
+        Same contract as AccidentRiskModel.predict_risk
+
+        Falls back to a direct model call when the scheduler is not running.
+        """
+        if not self.is_running:
+            return await worker_pools.run_model(
+                self.model.predict_risk,
+                latitude, longitude, timestamp,
+                weather_condition, road_type, historical_accidents
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingPrediction(
+            latitude, longitude, timestamp, weather_condition,
+            road_type, historical_accidents, future
+        ))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stopping = False
+            deadline = loop.time() + self.window_ms / 1000.0
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._run_batch(batch)
+            if stopping:
+                return
+
+    async def _run_batch(self, batch: List[_PendingPrediction]):
+        started_at = time.perf_counter()
+        try:
+            risk_levels, risk_probabilities = await worker_pools.run_model(
+                self.model.predict_risk_many,
+                [p.latitude for p in batch],
+                [p.longitude for p in batch],
+                [p.timestamp for p in batch],
+                [p.weather_condition for p in batch],
+                [p.road_type for p in batch],
+                [p.historical_accidents for p in batch]
+            )
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        for pending, risk_level, risk_probability in zip(
+            batch, risk_levels, risk_probabilities.tolist()
+        ):
+            if not pending.future.done():
+                pending.future.set_result((risk_level, risk_probability))
+
+        self._record_batch(batch, started_at)
+
+    def _record_batch(self, batch: List[_PendingPrediction], started_at: float):
+        self.requests_total += len(batch)
+        self.batches_total += 1
+        self.last_batch_size = len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self.total_wait_ms += sum(started_at - p.enqueued_at for p in batch) * 1000
+
+    def stats(self) -> dict:
+        """Configuration and runtime metrics of the scheduler"""
+        return {
+            "running": self.is_running,
+            "window_ms": self.window_ms,
+            "max_batch_size": self.max_batch_size,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "requests_total": self.requests_total,
+            "batches_total": self.batches_total,
+            "avg_batch_size": round(self.requests_total / self.batches_total, 2) if self.batches_total else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "largest_batch": self.largest_batch,
+            "avg_queue_wait_ms": round(self.total_wait_ms / self.requests_total, 3) if self.requests_total else 0.0
+        }
+
+
+# Global scheduler instance
+inference_scheduler = InferenceScheduler()
@@ -0,0 +1,119 @@
+"""
+Hot reload of the ML model when a new version appears on disk
+"""
+
+from pathlib import Path
+from typing import Optional, Tuple
+import asyncio
+import os
+
+from app.models.ml_model import AccidentRiskModel, accident_model
+from app.services.executor import worker_pools
+from app.services.prediction_cache import prediction_cache
+from app.services.risk_surface import risk_surface
+from config import settings
+
+
+def _mtime(path) -> Optional[float]:
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+class ModelReloader:
+    """
+    Polls the model files and swaps in a new version without a restart
+
+    A change is picked up once the file times have been identical for two
+    consecutive polls, so a file that is still being copied is not loaded.
+    Loading runs on the model pool; AccidentRiskModel.load_model swaps the
+    model in one assignment, so in-flight requests are not affected. Cached
+    predictions are dropped and the risk surface is remapped afterwards.
+    """
+
+    def __init__(self, model: AccidentRiskModel = None, interval_seconds: float = None):
+        self.model = model or accident_model
+        self.interval_seconds = (
+            settings.MODEL_RELOAD_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+        )
+        self._task: Optional[asyncio.Task] = None
+        self._loaded: Optional[Tuple] = None
+        self._pending: Optional[Tuple] = None
+
+        # Metrics
+        self.reloads = 0
+        self.failures = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @staticmethod
+    def signature() -> Tuple:
+        """Modification times of every file a model load reads"""
+        return (
+            _mtime(settings.MODEL_PATH),
+            _mtime(settings.SCALER_PATH),
+            _mtime(Path(settings.FLAT_MODEL_PATH) / "ensemble.json")
+        )
+
+    async def start(self):
+        """Start polling; the files loaded at startup are the baseline"""
+        if self.is_running or self.interval_seconds <= 0:
+            return
+        self._loaded = self.signature()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self.is_running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"Model reload check failed: {e}")
+
+    async def check(self) -> bool:
+        """Reload if the files changed and have settled; True if reloaded"""
+        signature = self.signature()
+        if signature == self._loaded:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            self._pending = signature
+            return False
+
+        self._pending = None
+        self._loaded = signature
+        if not await worker_pools.run_model(self.model.load_model):
+            self.failures += 1
+            return False
+
+        self.reloads += 1
+        prediction_cache.clear()
+        if settings.RISK_SURFACE_ENABLED and not risk_surface.load():
+            # A surface of the previous model must not answer requests
+            risk_surface.unload()
+        print(f"Model reloaded (version {self.model.version})")
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "running": self.is_running,
+            "interval_seconds": self.interval_seconds,
+            "model_version": self.model.version,
+            "evaluator": self.model.evaluator,
+            "reloads": self.reloads,
+            "failures": self.failures
+        }
+
+
+# Global reloader instance
+model_reloader = ModelReloader()
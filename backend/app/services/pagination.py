@@ -0,0 +1,80 @@
+"""
+Keyset (cursor) pagination for list endpoints
+
+A page is ordered by a unique key, e.g. (accident_date, id), and the next
+page starts after the key of the last row of the previous one:
+
+    WHERE (accident_date, id) < (:last_date, :last_id)
+    ORDER BY accident_date DESC, id DESC LIMIT :limit
+
+With an index on the key columns every page is an index range scan of
+`limit` rows, however deep it is; OFFSET reads and discards every row
+before the page. The key of the last row is handed to the client as an
+opaque cursor (URL-safe base64 of a JSON list) in the X-Next-Cursor
+response header.
+"""
+
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+import base64
+import binascii
+import json
+
+from sqlalchemy import tuple_
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the key of the last row of a page"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    data = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> List[Any]:
+    """
+    Decode a cursor into key values of the given types
+
+    Raises:
+        ValueError: If the cursor is malformed or does not match `types`
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("Invalid cursor")
+
+    decoded = []
+    for value, value_type in zip(values, types):
+        if value_type is datetime and isinstance(value, str):
+            decoded.append(datetime.fromisoformat(value))
+        elif value_type is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+            decoded.append(float(value))
+        elif isinstance(value, value_type) and not isinstance(value, bool):
+            decoded.append(value)
+        else:
+            raise ValueError("Invalid cursor")
+    return decoded
+
+
+def keyset_page(query, columns: Sequence, cursor: Optional[str], types: Sequence[type], limit: int):
+    """
+    Apply descending keyset order, the cursor condition and the limit
+
+    Returns:
+        The limited query; pass its rows to next_cursor
+    """
+    if cursor is not None:
+        query = query.filter(tuple_(*columns) < tuple_(*decode_cursor(cursor, types)))
+    return query.order_by(*(column.desc() for column in columns)).limit(limit)
+
+
+def next_cursor(rows: Sequence, attributes: Sequence[str], limit: int) -> Optional[str]:
+    """Cursor of the page after `rows`, or None if it was the last page"""
+    if len(rows) < limit:
+        return None
+    return encode_cursor([getattr(rows[-1], name) for name in attributes])
@@ -0,0 +1,217 @@
+"""
+In-process cache of location risk predictions
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Set
+import asyncio
+import time
+
+import numpy as np
+
+from app.services.geo import distance_km
+from app.services.risk_calculator import RiskCalculator
+from config import settings
+
+
+# Coordinate precision of the cache cells, as used by generate_segment_id
+CELL_PRECISION = 3
+
+
+class PredictionKey(NamedTuple):
+    """Cache key: segment cell, hour of week, weather and road type"""
+    segment_id: str
+    day_of_week: int
+    hour: int
+    weather_condition: str
+    road_type: str
+
+
+class PredictionCache:
+    """
+    TTL + LRU cache with single-flight misses
+
+    Entries live for `ttl_seconds` and the least recently used entry is
+    evicted once `max_entries` is reached. Concurrent misses for the same
+    key share one computation. All methods must be called from the event
+    loop thread.
+    """
+
+    def __init__(self, ttl_seconds: float = None, max_entries: int = None):
+        self.ttl_seconds = settings.CACHE_EXPIRY_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_entries = max_entries or settings.PREDICTION_CACHE_MAX_ENTRIES
+
+        self._entries: "OrderedDict[PredictionKey, tuple]" = OrderedDict()
+        self._inflight: Dict[PredictionKey, asyncio.Future] = {}
+        # segment_id -> (cell latitude, cell longitude, cached keys)
+        self._cells: Dict[str, tuple] = {}
+        # Bumped by invalidation, so results computed before it are not stored
+        self._generation = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(
+        latitude: float,
+        longitude: float,
+        timestamp: datetime,
+        weather_condition: str,
+        road_type: str
+    ) -> PredictionKey:
+        return PredictionKey(
+            segment_id=RiskCalculator.generate_segment_id(latitude, longitude, CELL_PRECISION),
+            day_of_week=timestamp.weekday(),
+            hour=timestamp.hour,
+            weather_condition=weather_condition,
+            road_type=road_type
+        )
+
+    async def get_or_compute(
+        self,
+        key: PredictionKey,
+        latitude: float,
+        longitude: float,
+        compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Cached value for key, or the result of `compute()`
+
+        Only one `compute()` runs per key at a time; other callers missing
+        the same key wait for its result. Failures are not cached.
+        """
+        value = self._get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The computing caller was cancelled, not us: try again
+                if pending.cancelled():
+                    return await self.get_or_compute(key, latitude, longitude, compute)
+                raise
+
+        self.misses += 1
+        generation = self._generation
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure without waiters is not logged
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+        if generation == self._generation:
+            self._put(key, latitude, longitude, value)
+        future.set_result(value)
+        return value
+
+    def _get(self, key: PredictionKey) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self.expirations += 1
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key: PredictionKey, latitude: float, longitude: float, value: Any):
+        if key in self._entries:
+            self._remove(key)
+        while len(self._entries) >= self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        cell = self._cells.get(key.segment_id)
+        if cell is None:
+            cell = (round(latitude, CELL_PRECISION), round(longitude, CELL_PRECISION), set())
+            self._cells[key.segment_id] = cell
+        cell[2].add(key)
+
+    def _remove(self, key: PredictionKey):
+        del self._entries[key]
+        cell = self._cells.get(key.segment_id)
+        if cell is not None:
+            keys: Set[PredictionKey] = cell[2]
+            keys.discard(key)
+            if not keys:
+                del self._cells[key.segment_id]
+
+    def invalidate_near(self, latitude: float, longitude: float, radius_km: float = None) -> int:
+        """
+        Drop entries whose nearby accident count may include this location
+
+        Called when an accident is created or deleted. Returns the number of
+        entries removed.
+        """
+        radius_km = radius_km or settings.NEARBY_RADIUS_KM
+        self._generation += 1
+        if not self._cells:
+            return 0
+
+        segment_ids = list(self._cells)
+        cell_lats = np.array([self._cells[s][0] for s in segment_ids])
+        cell_lons = np.array([self._cells[s][1] for s in segment_ids])
+
+        # Requests anywhere in a cell count accidents within radius, so
+        # widen the radius by the cell half-diagonal
+        margin_km = distance_km(0.0, 0.0, 0.5 * 10 ** -CELL_PRECISION, 0.5 * 10 ** -CELL_PRECISION)
+        affected = distance_km(latitude, longitude, cell_lats, cell_lons) <= radius_km + margin_km
+
+        removed = 0
+        for index in np.flatnonzero(affected).tolist():
+            for key in list(self._cells[segment_ids[index]][2]):
+                self._remove(key)
+                removed += 1
+        self.invalidations += removed
+        return removed
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._cells.clear()
+
+    def stats(self) -> dict:
+        """Size, configuration and hit/miss/eviction counters"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "enabled": settings.PREDICTION_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "inflight": len(self._inflight)
+        }
+
+
+# Global cache instance
+prediction_cache = PredictionCache()
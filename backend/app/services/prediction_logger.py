@@ -0,0 +1,231 @@
+"""
+Write-behind logging of predictions to the predictions table
+
+Requests only append a record to an in-memory queue. A background task
+writes the queue in batches of `batch_size` rows, each with one
+executemany INSERT and one commit, when a batch is full or every
+`flush_interval` seconds. stop() flushes what is left.
+
+The queue holds at most `max_queue_size` records. When the database falls
+behind, `overflow` decides what gives:
+
+- drop_oldest: discard the oldest queued record (default; the API never waits)
+- drop_newest: discard the new record
+- block: the request waits until the flusher has made room
+
+Dropped records are counted in stats(). A batch that fails to write is
+put back at the front of the queue and retried at the next flush.
+"""
+
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+import asyncio
+import time
+
+from sqlalchemy import insert
+
+from app.database import SessionLocal
+from app.models.database import Prediction
+from app.services.executor import worker_pools
+from config import settings
+
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class PredictionLogger:
+    """Queues prediction records and writes them to the database in batches"""
+
+    def __init__(
+        self,
+        batch_size: int = None,
+        flush_interval: float = None,
+        max_queue_size: int = None,
+        overflow: str = None
+    ):
+        self.batch_size = batch_size or settings.PREDICTION_LOG_BATCH_SIZE
+        self.flush_interval = (
+            settings.PREDICTION_LOG_FLUSH_INTERVAL_SECONDS if flush_interval is None else flush_interval
+        )
+        self.max_queue_size = max_queue_size or settings.PREDICTION_LOG_MAX_QUEUE_SIZE
+        self.overflow = overflow or settings.PREDICTION_LOG_OVERFLOW
+        if self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {self.overflow!r}; expected one of {OVERFLOW_POLICIES}")
+
+        self._queue: deque = deque()
+        self._worker: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._not_full: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+        # Metrics
+        self.logged_total = 0
+        self.written_total = 0
+        self.dropped_total = 0
+        self.failed_flushes = 0
+        self.flushes_total = 0
+        self.last_flush_rows = 0
+        self.last_flush_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """Start the flusher on the running event loop"""
+        if self.is_running:
+            return
+        self._wakeup = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write every queued record"""
+        if not self.is_running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._worker
+        self._worker = None
+        await self.flush()
+        if self._queue:
+            print(f"Warning: {len(self._queue)} predictions not written: {self.last_error}")
+        # Release callers still blocked on a full queue; their records are dropped
+        self._not_full.set()
+
+    async def log(
+        self,
+        latitude: float,
+        longitude: float,
+        risk_level: str,
+        risk_probability: float,
+        timestamp: datetime,
+        weather_condition: Optional[str] = None,
+        model_version: Optional[str] = None
+    ):
+        """
+        Queue one prediction for writing
+
+        Returns immediately unless the queue is full and the overflow policy
+        is "block". Does nothing while the logger is not running.
+        """
+        if not self.is_running:
+            return
+        if self._stopping:
+            self.dropped_total += 1
+            return
+
+        if len(self._queue) >= self.max_queue_size:
+            if self.overflow == "drop_newest":
+                self.dropped_total += 1
+                return
+            if self.overflow == "drop_oldest":
+                self._queue.popleft()
+                self.dropped_total += 1
+            else:
+                while len(self._queue) >= self.max_queue_size:
+                    self._wakeup.set()
+                    await self._not_full.wait()
+                    if self._stopping:
+                        self.dropped_total += 1
+                        return
+
+        self._queue.append({
+            "latitude": latitude,
+            "longitude": longitude,
+            "risk_level": risk_level,
+            "risk_probability": risk_probability,
+            "timestamp": timestamp,
+            "weather_condition": weather_condition,
+            "time_of_day": timestamp.hour,
+            "model_version": model_version
+        })
+        self.logged_total += 1
+
+        if len(self._queue) >= self.max_queue_size:
+            self._not_full.clear()
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Write queued records in batches until the queue is empty or a write fails"""
+        async with self._flush_lock:
+            while self._queue:
+                count = min(self.batch_size, len(self._queue))
+                batch = [self._queue.popleft() for _ in range(count)]
+                self._not_full.set()
+
+                started_at = time.perf_counter()
+                try:
+                    await worker_pools.run_db(self._write, batch)
+                except Exception as e:
+                    self.failed_flushes += 1
+                    self.last_error = str(e)
+                    self._requeue(batch)
+                    return
+
+                self.flushes_total += 1
+                self.written_total += count
+                self.last_flush_rows = count
+                self.last_flush_ms = (time.perf_counter() - started_at) * 1000
+
+    def _requeue(self, batch: List[dict]):
+        # Back at the front, in order; what no longer fits is dropped oldest first
+        room = self.max_queue_size - len(self._queue)
+        kept = batch[len(batch) - room:] if room < len(batch) else batch
+        self.dropped_total += len(batch) - len(kept)
+        self._queue.extendleft(reversed(kept))
+        if len(self._queue) >= self.max_queue_size:
+            self._not_full.clear()
+
+    @staticmethod
+    def _write(batch: List[dict]):
+        db = SessionLocal()
+        try:
+            db.execute(insert(Prediction.__table__), batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            await self.flush()
+
+    def stats(self) -> dict:
+        """Configuration and runtime metrics of the logger"""
+        return {
+            "running": self.is_running,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "max_queue_size": self.max_queue_size,
+            "overflow": self.overflow,
+            "queue_depth": len(self._queue),
+            "logged_total": self.logged_total,
+            "written_total": self.written_total,
+            "dropped_total": self.dropped_total,
+            "flushes_total": self.flushes_total,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_rows": self.last_flush_rows,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "last_error": self.last_error
+        }
+
+
+# Global logger instance
+prediction_logger = PredictionLogger()
@@ -5,14 +5,28 @@ Risk calculation and analysis service
 from typing import List, Tuple, Optional
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, case, update
 import math
 
+import numpy as np
+
 from app.models.database import Accident, RoadSegment
 from app.models.schemas import RiskLevel
+from app.services.geo import distance_km, path_lengths_km, use_approximation
+from app.services.route_engine import RouteEngine
+from app.services.route_preprocessing import densify_route
+from app.services.spatial_index import accident_index
 from config import settings
 
 
+# Severity on a 0-1 scale; other values count as 0.5
+SEVERITY_SCORES = {'minor': 0.25, 'moderate': 0.5, 'severe': 0.75, 'fatal': 1.0}
+DEFAULT_SEVERITY_SCORE = 0.5
+
+# Accidents within this many degrees of a segment's bounds count towards it
+SEGMENT_MARGIN_DEG = 0.01
+
+
 class RiskCalculator:
     """Service for calculating accident risk"""
     
@@ -46,30 +60,51 @@ class RiskCalculator:
         limit: int = 100
     ) -> List[Accident]:
         """
-        Get accidents within radius of given location
+        Get the `limit` nearest accidents within radius of given location,
+        sorted by distance
+        
+        Served from the in-memory spatial index when it has been built,
+        otherwise from a bounding-box query on the database.
         """
         radius_km = radius_km or settings.NEARBY_RADIUS_KM
         
+        if accident_index.is_built:
+            return RiskCalculator._get_nearby_accidents_indexed(
+                db, latitude, longitude, radius_km, limit
+            )
+        
         # Approximate degree offset for the radius
         # 1 degree latitude ≈ 111 km
         lat_offset = radius_km / 111.0
         lon_offset = radius_km / (111.0 * math.cos(math.radians(latitude)))
         
-        # Query accidents within bounding box
+        # Query the nearest accidents within bounding box, using the planar
+        # squared distance so the database applies the limit to the closest rows
+        lon_scale = math.cos(math.radians(latitude))
+        planar_distance = (
+            (Accident.latitude - latitude) * (Accident.latitude - latitude) +
+            (Accident.longitude - longitude) * (Accident.longitude - longitude) * lon_scale * lon_scale
+        )
         accidents = db.query(Accident).filter(
             and_(
                 Accident.latitude.between(latitude - lat_offset, latitude + lat_offset),
                 Accident.longitude.between(longitude - lon_offset, longitude + lon_offset)
             )
-        ).limit(limit).all()
+        ).order_by(planar_distance).limit(limit).all()
+        
+        if not accidents:
+            return []
+        
+        # Filter by exact distance in one vectorized pass
+        distances = distance_km(
+            latitude, longitude,
+            np.array([a.latitude for a in accidents]),
+            np.array([a.longitude for a in accidents]),
+            approximate=use_approximation(radius_km)
+        )
         
-        # Filter by exact distance
         nearby_accidents = []
-        for accident in accidents:
-            distance = RiskCalculator.calculate_distance(
-                latitude, longitude,
-                accident.latitude, accident.longitude
-            )
+        for accident, distance in zip(accidents, distances.tolist()):
             if distance <= radius_km:
                 # Add distance attribute for sorting/display
                 accident.distance_km = distance
@@ -80,6 +115,68 @@ class RiskCalculator:
         
         return nearby_accidents
     
+    @staticmethod
+    def _get_nearby_accidents_indexed(
+        db: Session,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: int
+    ) -> List[Accident]:
+        """Answer a k-nearest query from the spatial index, then load rows by id"""
+        ids, distances = accident_index.nearest(latitude, longitude, limit, radius_km)
+        if len(ids) == 0:
+            return []
+        
+        distances_by_id = dict(zip(ids.tolist(), distances.tolist()))
+        accidents = db.query(Accident).filter(
+            Accident.id.in_(list(distances_by_id))
+        ).all()
+        
+        for accident in accidents:
+            accident.distance_km = distances_by_id[accident.id]
+        accidents.sort(key=lambda x: x.distance_km)
+        
+        return accidents
+    
+    @staticmethod
+    def count_nearby_accidents(
+        db: Session,
+        latitude: float,
+        longitude: float,
+        radius_km: float = None
+    ) -> int:
+        """
+        Count accidents within radius of given location
+        
+        Unlike get_nearby_accidents the count is not capped by a limit and
+        no Accident rows are loaded. With the spatial index built the count
+        is a cumulative-count grid lookup (see AccidentCountGrid).
+        """
+        radius_km = radius_km or settings.NEARBY_RADIUS_KM
+        
+        if accident_index.is_built:
+            return accident_index.count_within(latitude, longitude, radius_km)
+        
+        # Bounding box count, refined by exact distance on coordinates only
+        lat_offset = radius_km / 111.0
+        lon_offset = radius_km / (111.0 * math.cos(math.radians(latitude)))
+        rows = db.query(Accident.latitude, Accident.longitude).filter(
+            and_(
+                Accident.latitude.between(latitude - lat_offset, latitude + lat_offset),
+                Accident.longitude.between(longitude - lon_offset, longitude + lon_offset)
+            )
+        ).all()
+        if not rows:
+            return 0
+        
+        coords = np.array(rows, dtype=np.float64)
+        distances = distance_km(
+            latitude, longitude, coords[:, 0], coords[:, 1],
+            approximate=use_approximation(radius_km)
+        )
+        return int(np.count_nonzero(distances <= radius_km))
+    
     @staticmethod
     def calculate_segment_risk(
         db: Session,
@@ -96,8 +193,21 @@ class RiskCalculator:
         if not segment:
             return 0.0, RiskLevel.LOW
         
+        return RiskCalculator.segment_risk(
+            segment.accidents_last_year,
+            segment.accidents_last_month,
+            segment.avg_severity
+        )
+    
+    @staticmethod
+    def segment_risk(
+        accidents_last_year: int,
+        accidents_last_month: int,
+        avg_severity: Optional[float]
+    ) -> Tuple[float, RiskLevel]:
+        """Risk score (0-100) and level from a segment's counters"""
         # Calculate risk based on accident frequency
-        accidents_per_year = segment.accidents_last_year
+        accidents_per_year = accidents_last_year or 0
         
         # Base risk score (0-100)
         if accidents_per_year == 0:
@@ -112,12 +222,12 @@ class RiskCalculator:
             risk_score = min(85.0 + (accidents_per_year - 10) * 2, 100.0)
         
         # Adjust for recent accidents (last month)
-        if segment.accidents_last_month > 0:
-            risk_score += min(segment.accidents_last_month * 5, 15)
+        if accidents_last_month:
+            risk_score += min(accidents_last_month * 5, 15)
         
         # Adjust for average severity
-        if segment.avg_severity:
-            risk_score *= (1 + segment.avg_severity * 0.2)
+        if avg_severity:
+            risk_score *= (1 + avg_severity * 0.2)
         
         # Cap at 100
         risk_score = min(risk_score, 100.0)
@@ -151,60 +261,141 @@ class RiskCalculator:
     def update_segment_statistics(db: Session, segment_id: str):
         """
         Update statistics for a road segment based on accidents
+        
+        Counts, average severity and accidents per hour are aggregated by
+        the database; no Accident rows are loaded.
         """
         segment = db.query(RoadSegment).filter(
             RoadSegment.segment_id == segment_id
-        ).first()
+        ).with_for_update().first()
         
         if not segment:
             return
         
-        # Get all accidents in this segment
-        accidents = db.query(Accident).filter(
-            and_(
-                Accident.latitude.between(segment.start_lat - 0.01, segment.end_lat + 0.01),
-                Accident.longitude.between(segment.start_lon - 0.01, segment.end_lon + 0.01)
+        RiskCalculator._recompute_segment(db, segment, datetime.now())
+        db.commit()
+    
+    @staticmethod
+    def _recompute_segment(db: Session, segment: RoadSegment, now: datetime):
+        """Set a segment's statistics from its accidents, without committing"""
+        # Accidents in this segment
+        in_segment = and_(
+            Accident.latitude.between(
+                segment.start_lat - SEGMENT_MARGIN_DEG, segment.end_lat + SEGMENT_MARGIN_DEG
+            ),
+            Accident.longitude.between(
+                segment.start_lon - SEGMENT_MARGIN_DEG, segment.end_lon + SEGMENT_MARGIN_DEG
             )
-        ).all()
+        )
+        one_year_ago = now - timedelta(days=365)
+        one_month_ago = now - timedelta(days=30)
         
-        # Update total accidents
-        segment.total_accidents = len(accidents)
+        total, last_year, last_month, avg_severity = db.query(
+            func.count(Accident.id),
+            func.sum(case((Accident.accident_date >= one_year_ago, 1), else_=0)),
+            func.sum(case((Accident.accident_date >= one_month_ago, 1), else_=0)),
+            func.avg(case(SEVERITY_SCORES, value=Accident.severity, else_=DEFAULT_SEVERITY_SCORE))
+        ).filter(in_segment).one()
         
-        # Count accidents in last year
-        one_year_ago = datetime.now() - timedelta(days=365)
-        segment.accidents_last_year = sum(
-            1 for a in accidents if a.accident_date >= one_year_ago
-        )
+        hour_counts = [0] * 24
+        for hour, count in db.query(
+            Accident.hour_of_day, func.count(Accident.id)
+        ).filter(in_segment, Accident.hour_of_day.isnot(None)).group_by(Accident.hour_of_day):
+            if 0 <= hour < 24:
+                hour_counts[hour] = count
+        
+        segment.total_accidents = total
+        segment.accidents_last_year = last_year or 0
+        segment.accidents_last_month = last_month or 0
+        segment.avg_severity = float(avg_severity) if total else None
+        segment.hour_counts = hour_counts
+        segment.peak_accident_hour = RiskCalculator._peak_hour(hour_counts)
+        
+        RiskCalculator._apply_segment_risk(segment, now)
+    
+    @staticmethod
+    def record_accident(db: Session, accident: Accident, delta: int = 1) -> int:
+        """
+        Add an accident to (or with delta=-1 remove it from) its segments
         
-        # Count accidents in last month
-        one_month_ago = datetime.now() - timedelta(days=30)
-        segment.accidents_last_month = sum(
-            1 for a in accidents if a.accident_date >= one_month_ago
+        Every segment whose area contains the accident has its counters
+        adjusted in place, without rescanning its accidents. Segments that
+        have no per-hour counts yet are recomputed in full once. Counters for
+        the last year and month only grow here; accidents leaving those
+        windows are handled by the next full recompute.
+        
+        The segments are locked from the read until the commit, so
+        concurrent calls for the same segment do not lose updates.
+        
+        Returns:
+            Number of segments updated
+        """
+        in_area = (
+            RoadSegment.start_lat - SEGMENT_MARGIN_DEG <= accident.latitude,
+            RoadSegment.end_lat + SEGMENT_MARGIN_DEG >= accident.latitude,
+            RoadSegment.start_lon - SEGMENT_MARGIN_DEG <= accident.longitude,
+            RoadSegment.end_lon + SEGMENT_MARGIN_DEG >= accident.longitude
         )
+        if db.get_bind().dialect.name == "sqlite":
+            # No row locks (FOR UPDATE is not emitted): a no-op write takes
+            # the database write lock before the segments are read. Setting
+            # last_updated to itself keeps its onupdate from firing.
+            db.execute(update(RoadSegment).where(*in_area).values(
+                id=RoadSegment.id, last_updated=RoadSegment.last_updated
+            ))
+        segments = db.query(RoadSegment).filter(*in_area).order_by(
+            RoadSegment.id
+        ).with_for_update().populate_existing().all()
         
-        # Calculate average severity (0-1 scale)
-        severity_scores = {'minor': 0.25, 'moderate': 0.5, 'severe': 0.75, 'fatal': 1.0}
-        if accidents:
-            avg_severity = sum(
-                severity_scores.get(a.severity, 0.5) for a in accidents
-            ) / len(accidents)
-            segment.avg_severity = avg_severity
-        
-        # Find peak accident hour
-        if accidents:
-            hour_counts = {}
-            for accident in accidents:
-                hour = accident.hour_of_day
-                hour_counts[hour] = hour_counts.get(hour, 0) + 1
-            segment.peak_accident_hour = max(hour_counts, key=hour_counts.get)
-        
-        # Calculate risk score and level
-        risk_score, risk_level = RiskCalculator.calculate_segment_risk(db, segment_id)
-        segment.risk_score = risk_score / 100.0  # Store as 0-1
-        segment.risk_level = risk_level.value
+        now = datetime.now()
+        severity = SEVERITY_SCORES.get(accident.severity, DEFAULT_SEVERITY_SCORE)
+        hour = accident.hour_of_day
+        
+        for segment in segments:
+            if segment.hour_counts is None or (segment.total_accidents and segment.avg_severity is None):
+                RiskCalculator._recompute_segment(db, segment, now)
+                continue
+            
+            previous_total = segment.total_accidents or 0
+            total = max(previous_total + delta, 0)
+            if accident.accident_date >= now - timedelta(days=365):
+                segment.accidents_last_year = max((segment.accidents_last_year or 0) + delta, 0)
+            if accident.accident_date >= now - timedelta(days=30):
+                segment.accidents_last_month = max((segment.accidents_last_month or 0) + delta, 0)
+            
+            if total:
+                severity_sum = (segment.avg_severity or 0.0) * previous_total + delta * severity
+                segment.avg_severity = severity_sum / total
+            else:
+                segment.avg_severity = None
+            segment.total_accidents = total
+            
+            if hour is not None and 0 <= hour < 24:
+                hour_counts = list(segment.hour_counts)
+                hour_counts[hour] = max(hour_counts[hour] + delta, 0)
+                segment.hour_counts = hour_counts
+                segment.peak_accident_hour = RiskCalculator._peak_hour(hour_counts)
+            
+            RiskCalculator._apply_segment_risk(segment, now)
         
-        segment.last_updated = datetime.now()
         db.commit()
+        return len(segments)
+    
+    @staticmethod
+    def _peak_hour(hour_counts: List[int]) -> Optional[int]:
+        """Hour with the most accidents, the earliest on ties"""
+        return hour_counts.index(max(hour_counts)) if any(hour_counts) else None
+    
+    @staticmethod
+    def _apply_segment_risk(segment: RoadSegment, now: datetime):
+        risk_score, risk_level = RiskCalculator.segment_risk(
+            segment.accidents_last_year,
+            segment.accidents_last_month,
+            segment.avg_severity
+        )
+        segment.risk_score = risk_score / 100.0  # Store as 0-1
+        segment.risk_level = risk_level.value
+        segment.last_updated = now
     
     @staticmethod
     def analyze_route(
@@ -223,7 +414,20 @@ class RiskCalculator:
                 'high_risk_segments': []
             }
         
-        total_distance = 0
+        lats = np.array([lat for lat, _ in route_points])
+        lons = np.array([lon for _, lon in route_points])
+        
+        # Segment lengths and midpoints for the whole route at once
+        distances = path_lengths_km(lats, lons)
+        mid_lats = (lats[:-1] + lats[1:]) / 2
+        mid_lons = (lons[:-1] + lons[1:]) / 2
+        total_distance = float(distances.sum())
+        
+        # Count nearby accidents around every midpoint in one pass
+        accidents_counts = RouteEngine.count_accidents(
+            db, mid_lats, mid_lons, radius_km=settings.ROUTE_SEGMENT_RADIUS_KM
+        ).tolist()
+        
         total_risk_score = 0
         high_risk_segments = []
         
@@ -231,22 +435,10 @@ class RiskCalculator:
         for i in range(len(route_points) - 1):
             lat1, lon1 = route_points[i]
             lat2, lon2 = route_points[i + 1]
-            
-            # Calculate segment distance
-            distance = RiskCalculator.calculate_distance(lat1, lon1, lat2, lon2)
-            total_distance += distance
-            
-            # Get midpoint for risk assessment
-            mid_lat = (lat1 + lat2) / 2
-            mid_lon = (lon1 + lon2) / 2
-            
-            # Get nearby accidents
-            accidents = RiskCalculator.get_nearby_accidents(
-                db, mid_lat, mid_lon, radius_km=1.0
-            )
+            accidents_count = accidents_counts[i]
             
             # Calculate segment risk
-            segment_risk = len(accidents) * 10  # Simple risk score
+            segment_risk = accidents_count * 10  # Simple risk score
             total_risk_score += segment_risk
             
             if segment_risk > 50:
@@ -254,7 +446,7 @@ class RiskCalculator:
                     'start': (lat1, lon1),
                     'end': (lat2, lon2),
                     'risk_score': segment_risk,
-                    'accidents_count': len(accidents)
+                    'accidents_count': accidents_count
                 })
         
         # Calculate overall risk
@@ -274,3 +466,92 @@ class RiskCalculator:
             'high_risk_segments': high_risk_segments,
             'segment_count': len(route_points) - 1
         }
+    
+    @staticmethod
+    def get_route_corridor_accidents(
+        db: Session,
+        route_points: List[Tuple[float, float]],
+        width_km: float = None,
+        candidates: Tuple[np.ndarray, np.ndarray, np.ndarray] = None
+    ) -> dict:
+        """
+        Find accidents inside a corridor around the route polyline
+        
+        The route is projected onto a local plane (kilometers, centered on
+        the route), buffered by `width_km` on each side and matched against
+        an STRtree of candidate accidents. Linear referencing gives each
+        accident's distance along the route, which assigns it to exactly one
+        segment, so overlapping segments never double count.
+        
+        `candidates` (ids, latitudes, longitudes) may be passed when they were
+        already fetched for a larger area, e.g. several routes at once.
+        
+        Returns:
+            Dictionary with 'accident_ids', 'distances_along_km',
+            'segment_indices' and 'segment_counts' (one count per segment)
+        """
+        # Imported here to keep shapely out of API startup
+        import shapely
+        
+        width_km = width_km or settings.ROUTE_CORRIDOR_WIDTH_KM
+        n_segments = max(len(route_points) - 1, 0)
+        
+        lats = np.array([lat for lat, _ in route_points], dtype=np.float64)
+        lons = np.array([lon for _, lon in route_points], dtype=np.float64)
+        
+        empty = {
+            'accident_ids': [],
+            'distances_along_km': [],
+            'segment_indices': [],
+            'segment_counts': [0] * n_segments
+        }
+        if n_segments == 0:
+            return empty
+        
+        # Samples are at most width_km apart, so every corridor point lies
+        # within 1.5 * width_km of one of them
+        if candidates is None:
+            dense_lats, dense_lons = densify_route(lats, lons, width_km)
+            candidates = RouteEngine.fetch_candidates(
+                db, dense_lats, dense_lons, width_km * 1.5
+            )
+        ids, cand_lats, cand_lons = candidates
+        if len(ids) == 0:
+            return empty
+        
+        # Local equirectangular projection in kilometers
+        lat0 = float(lats.mean())
+        lon0 = float(lons.mean())
+        km_per_deg = math.pi * 6371.0 / 180.0
+        lon_scale = km_per_deg * math.cos(math.radians(lat0))
+        
+        def project(point_lats, point_lons):
+            return (point_lons - lon0) * lon_scale, (point_lats - lat0) * km_per_deg
+        
+        route_x, route_y = project(lats, lons)
+        line = shapely.LineString(np.column_stack([route_x, route_y]))
+        corridor = line.buffer(width_km)
+        
+        points = shapely.points(*project(cand_lats, cand_lons))
+        tree = shapely.STRtree(points)
+        inside = np.sort(tree.query(corridor, predicate="intersects"))
+        if len(inside) == 0:
+            return empty
+        
+        # Linear referencing: distance along the route of each accident
+        distances_along = shapely.line_locate_point(line, points[inside])
+        
+        # Assign to segments by cumulative projected length
+        segment_ends = np.cumsum(np.hypot(np.diff(route_x), np.diff(route_y)))
+        segment_indices = np.minimum(
+            np.searchsorted(segment_ends, distances_along, side="left"),
+            n_segments - 1
+        )
+        segment_counts = np.bincount(segment_indices, minlength=n_segments)
+        
+        return {
+            'accident_ids': ids[inside].tolist(),
+            'distances_along_km': distances_along.tolist(),
+            'segment_indices': segment_indices.tolist(),
+            'segment_counts': segment_counts.tolist()
+        }
@@ -0,0 +1,296 @@
+"""
+Precomputed risk surface
+
+Besides location, the model only sees a few discrete inputs: hour, weekday,
+weather (5 values) and road type (4 values). For a fixed area the whole
+prediction space is evaluated offline on a grid and stored as a uint8 array
+of shape (rows, cols, 168, weather, road type), so serving a prediction is
+a single array index. The array is written as .npy and memory-mapped on
+load; a JSON file next to it holds the grid metadata.
+
+Each cell is evaluated at its center, with the nearby accident count at
+the center as `historical_accidents`. Probabilities are quantized to
+1/255, so a value within 0.002 of a risk threshold may change level.
+
+The counts are those at build time. When an accident is added or deleted,
+mark_dirty flags every cell within the count radius of it, and lookup
+returns None for flagged cells, so they are answered by live inference
+until the surface is rebuilt and reloaded. Like the prediction cache, the
+flags are per process.
+
+The array size is rows x cols x 168 x 20 bytes; build_risk_surface refuses
+grids above RISK_SURFACE_MAX_BYTES unless told otherwise.
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+import json
+import math
+import os
+import time
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.ml_model import AccidentRiskModel, ROAD_TYPE_SCORES, WEATHER_SCORES, accident_model
+from app.services.risk_calculator import RiskCalculator
+from app.services.spatial_index import KM_PER_DEGREE, accident_index
+from config import settings
+
+
+WEATHER_CONDITIONS = list(WEATHER_SCORES)
+ROAD_TYPES = list(ROAD_TYPE_SCORES)
+HOURS_PER_WEEK = 168
+
+# 2024-01-01 was a Monday, so hour h of the week is this plus h hours
+_WEEK_START = np.datetime64("2024-01-01T00", "h")
+
+# Cells evaluated per model call group
+BUILD_CHUNK_CELLS = 512
+
+
+def _metadata_path(path: str) -> Path:
+    return Path(path).with_suffix(".json")
+
+
+def _model_mtime(model_path: str) -> Optional[float]:
+    return os.path.getmtime(model_path) if os.path.exists(model_path) else None
+
+
+class RiskSurface:
+    """Lookup table of risk probabilities over a lat/lon grid"""
+
+    def __init__(self):
+        self.probabilities: Optional[np.ndarray] = None  # uint8, probability * 255
+        self.accident_counts: Optional[np.ndarray] = None  # Nearby accidents per cell
+        self.dirty: Optional[np.ndarray] = None  # Cells whose count changed since the build
+        self.min_lat = 0.0
+        self.min_lon = 0.0
+        self.cell_size_deg = 0.0
+        self.metadata: dict = {}
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.probabilities is not None
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.probabilities.shape[:2] if self.is_loaded else (0, 0)
+
+    def load(self, path: str = None, model_path: str = None) -> bool:
+        """
+        Memory-map a surface built by build_risk_surface
+
+        The surface is not loaded if it was built from a different model
+        file than the one configured now.
+        """
+        path = path or settings.RISK_SURFACE_PATH
+        model_path = model_path or settings.MODEL_PATH
+        metadata_path = _metadata_path(path)
+        if not os.path.exists(path) or not metadata_path.exists():
+            print(f"Risk surface not found at {path}")
+            return False
+
+        metadata = json.loads(metadata_path.read_text())
+        if metadata.get("model_mtime") != _model_mtime(model_path):
+            print(f"Risk surface at {path} was built from another model version; rebuild it")
+            return False
+
+        self.probabilities = np.load(path, mmap_mode="r")
+        self.accident_counts = np.asarray(metadata["accident_counts"], dtype=np.int64).reshape(
+            self.probabilities.shape[:2]
+        )
+        self.dirty = np.zeros(self.probabilities.shape[:2], dtype=bool)
+        self.min_lat = metadata["min_lat"]
+        self.min_lon = metadata["min_lon"]
+        self.cell_size_deg = metadata["cell_size_deg"]
+        self.metadata = {k: v for k, v in metadata.items() if k != "accident_counts"}
+        print(f"Risk surface loaded from {path} ({self.shape[0]}x{self.shape[1]} cells)")
+        return True
+
+    def unload(self):
+        self.probabilities = None
+        self.accident_counts = None
+        self.dirty = None
+        self.metadata = {}
+
+    def mark_dirty(self, latitude: float, longitude: float):
+        """Stop serving cells whose nearby accident count includes this location"""
+        if not self.is_loaded:
+            return
+        # Cell centers within the radius lie in this box, widened by a cell
+        radius_deg = self.metadata.get("radius_km", settings.NEARBY_RADIUS_KM) / KM_PER_DEGREE
+        lat_offset = radius_deg + self.cell_size_deg
+        lon_offset = radius_deg / max(math.cos(math.radians(latitude)), 0.01) + self.cell_size_deg
+        rows, cols = self.shape
+        row_start = max(math.floor((latitude - lat_offset - self.min_lat) / self.cell_size_deg), 0)
+        row_stop = min(math.floor((latitude + lat_offset - self.min_lat) / self.cell_size_deg) + 1, rows)
+        col_start = max(math.floor((longitude - lon_offset - self.min_lon) / self.cell_size_deg), 0)
+        col_stop = min(math.floor((longitude + lon_offset - self.min_lon) / self.cell_size_deg) + 1, cols)
+        if row_start < row_stop and col_start < col_stop:
+            self.dirty[row_start:row_stop, col_start:col_stop] = True
+
+    def mark_all_dirty(self):
+        """Stop serving every cell, e.g. after a bulk import"""
+        if self.is_loaded:
+            self.dirty[:] = True
+
+    def lookup(
+        self,
+        latitude: float,
+        longitude: float,
+        timestamp: datetime,
+        weather_condition: str = "clear",
+        road_type: str = "urban"
+    ) -> Optional[Tuple[str, float, int]]:
+        """
+        Precomputed (risk_level, risk_probability, nearby_accidents_count)
+
+        Returns None when the surface is not loaded, the point is off the
+        grid, its cell is dirty or a condition is not part of the surface.
+        """
+        if not self.is_loaded:
+            return None
+
+        row = math.floor((latitude - self.min_lat) / self.cell_size_deg)
+        col = math.floor((longitude - self.min_lon) / self.cell_size_deg)
+        rows, cols = self.shape
+        if not (0 <= row < rows and 0 <= col < cols) or self.dirty[row, col]:
+            return None
+
+        try:
+            weather = WEATHER_CONDITIONS.index(weather_condition)
+            road = ROAD_TYPES.index(road_type)
+        except ValueError:
+            return None
+
+        hour_of_week = timestamp.weekday() * 24 + timestamp.hour
+        probability = self.probabilities[row, col, hour_of_week, weather, road] / 255.0
+        risk_level = AccidentRiskModel.risk_levels(np.array([probability]))[0]
+        return risk_level, probability, int(self.accident_counts[row, col])
+
+    def stats(self) -> dict:
+        rows, cols = self.shape
+        return {
+            "loaded": self.is_loaded,
+            "rows": rows,
+            "cols": cols,
+            "size_bytes": int(self.probabilities.nbytes) if self.is_loaded else 0,
+            "dirty_cells": int(np.count_nonzero(self.dirty)) if self.is_loaded else 0,
+            **self.metadata
+        }
+
+
+def surface_size_bytes(rows: int, cols: int) -> int:
+    """Size of the probability array of a rows x cols surface"""
+    return rows * cols * HOURS_PER_WEEK * len(WEATHER_CONDITIONS) * len(ROAD_TYPES)
+
+
+def build_risk_surface(
+    db: Session,
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+    cell_size_deg: float = None,
+    path: str = None,
+    model: AccidentRiskModel = None,
+    radius_km: float = None,
+    max_bytes: Optional[int] = -1
+) -> dict:
+    """
+    Evaluate the model over every cell, hour of week, weather and road type
+
+    The array is written to a temporary file and renamed into place, so a
+    running server never maps a half-written surface. Accident counts use
+    the spatial index if it is built.
+
+    Raises:
+        ValueError: If the surface would exceed `max_bytes` (default
+            RISK_SURFACE_MAX_BYTES; None for no limit)
+
+    Returns:
+        Metadata of the written surface
+    """
+    cell_size_deg = cell_size_deg or settings.RISK_SURFACE_CELL_DEG
+    path = path or settings.RISK_SURFACE_PATH
+    model = model or accident_model
+    radius_km = radius_km or settings.NEARBY_RADIUS_KM
+    if max_bytes == -1:
+        max_bytes = settings.RISK_SURFACE_MAX_BYTES
+    started_at = time.perf_counter()
+
+    rows = max(int(math.ceil((max_lat - min_lat) / cell_size_deg - 1e-9)), 1)
+    cols = max(int(math.ceil((max_lon - min_lon) / cell_size_deg - 1e-9)), 1)
+    size_bytes = surface_size_bytes(rows, cols)
+    if max_bytes is not None and size_bytes > max_bytes:
+        raise ValueError(
+            f"A {rows} x {cols} cell surface needs {size_bytes / 1e9:.1f} GB, more than the "
+            f"{max_bytes / 1e9:.1f} GB limit; use smaller bounds or larger cells"
+        )
+
+    center_lats = min_lat + (np.arange(rows) + 0.5) * cell_size_deg
+    center_lons = min_lon + (np.arange(cols) + 0.5) * cell_size_deg
+    cell_lats = np.repeat(center_lats, cols)
+    cell_lons = np.tile(center_lons, rows)
+
+    if accident_index.is_built:
+        counts = accident_index.count_many(cell_lats, cell_lons, radius_km)
+    else:
+        counts = np.array([
+            RiskCalculator.count_nearby_accidents(db, lat, lon, radius_km)
+            for lat, lon in zip(cell_lats.tolist(), cell_lons.tolist())
+        ], dtype=np.int64)
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    surface = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.uint8,
+        shape=(rows, cols, HOURS_PER_WEEK, len(WEATHER_CONDITIONS), len(ROAD_TYPES))
+    )
+    # Cells in row-major order, as cell_lats and cell_lons
+    flat = surface.reshape(rows * cols, HOURS_PER_WEEK, len(WEATHER_CONDITIONS), len(ROAD_TYPES))
+
+    week = _WEEK_START + np.arange(HOURS_PER_WEEK)
+    for start in range(0, rows * cols, BUILD_CHUNK_CELLS):
+        stop = min(start + BUILD_CHUNK_CELLS, rows * cols)
+        n = stop - start
+        lats = np.repeat(cell_lats[start:stop], HOURS_PER_WEEK)
+        lons = np.repeat(cell_lons[start:stop], HOURS_PER_WEEK)
+        historical = np.repeat(counts[start:stop], HOURS_PER_WEEK)
+        timestamps = np.tile(week, n)
+
+        for w, weather in enumerate(WEATHER_CONDITIONS):
+            for r, road_type in enumerate(ROAD_TYPES):
+                _, probabilities = model.predict_risk_many(
+                    lats, lons, timestamps, weather, road_type, historical
+                )
+                quantized = np.rint(np.clip(probabilities, 0.0, 1.0) * 255).astype(np.uint8)
+                flat[start:stop, :, w, r] = quantized.reshape(n, HOURS_PER_WEEK)
+
+    surface.flush()
+    del flat, surface
+
+    metadata = {
+        "min_lat": min_lat,
+        "min_lon": min_lon,
+        "cell_size_deg": cell_size_deg,
+        "radius_km": radius_km,
+        "weather_conditions": WEATHER_CONDITIONS,
+        "road_types": ROAD_TYPES,
+        "model_mtime": _model_mtime(settings.MODEL_PATH) if model.is_trained else None,
+        "built_at": datetime.now().isoformat(),
+        "build_seconds": round(time.perf_counter() - started_at, 2),
+    }
+    metadata_path = _metadata_path(path)
+    tmp_metadata_path = metadata_path.with_suffix(".json.tmp")
+    tmp_metadata_path.write_text(json.dumps({**metadata, "accident_counts": counts.tolist()}))
+
+    os.replace(tmp_path, path)
+    os.replace(tmp_metadata_path, metadata_path)
+    return {**metadata, "rows": rows, "cols": cols}
+
+
+# Global surface instance
+risk_surface = RiskSurface()
@@ -0,0 +1,392 @@
+"""
+Batched route analysis engine
+"""
+
+from typing import Iterator, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from app.models.database import Accident
+from app.models.ml_model import AccidentRiskModel, accident_model
+from app.models.schemas import (
+    RiskLevel, RoutePoint, RouteAnalysisResponse, RouteSegmentRisk,
+    RouteComparisonItem, RouteComparisonResponse
+)
+from app.services.geo import distance_matrix, path_lengths_km, use_approximation
+from app.services.route_preprocessing import points_along, preprocess_route
+from app.services.spatial_index import accident_index
+from config import settings
+
+
+# Upper bound on distance matrix elements held in memory at once
+MATRIX_CHUNK_ELEMENTS = 4_000_000
+
+# Average speed used for travel time estimates
+AVERAGE_SPEED_KMH = 50
+
+
+class RouteGeometry(NamedTuple):
+    """Vectorized geometry of a polyline route"""
+    latitudes: np.ndarray  # Segment boundaries
+    longitudes: np.ndarray
+    distances_km: np.ndarray  # Length of each segment along the path
+    mid_latitudes: np.ndarray  # Halfway along each segment's path
+    mid_longitudes: np.ndarray
+    path_latitudes: np.ndarray  # Polyline the segments follow, bends included
+    path_longitudes: np.ndarray
+    boundary_positions: np.ndarray  # Path index of each boundary
+
+
+class PreparedRoute(NamedTuple):
+    """Route points ready for scoring, with per-segment context"""
+    points: List[RoutePoint]
+    geometry: RouteGeometry
+    start_indices: List[int]  # Original point index of each segment start
+    end_indices: List[int]  # Original point index of each segment end
+    accidents_counts: List[int]  # Accidents assigned to each segment
+
+
+class RouteEngine:
+    """
+    Scores a whole route with a constant number of queries
+
+    All candidate accidents around the route are fetched once, assigned to
+    segment midpoints with vectorized distance math, and every midpoint is
+    scored in one batched model call.
+    """
+
+    @staticmethod
+    def geometry(path_lats, path_lons, boundary_positions=None) -> RouteGeometry:
+        """
+        Segment lengths and midpoints of a route
+
+        Segment i follows the path from vertex boundary_positions[i] to
+        boundary_positions[i + 1]. By default every path edge is a segment.
+        """
+        path_lats = np.asarray(path_lats, dtype=np.float64)
+        path_lons = np.asarray(path_lons, dtype=np.float64)
+        if boundary_positions is None:
+            boundary_positions = np.arange(len(path_lats))
+
+        cumulative = np.concatenate([[0.0], np.cumsum(path_lengths_km(path_lats, path_lons))])
+        starts = cumulative[boundary_positions[:-1]]
+        ends = cumulative[boundary_positions[1:]]
+        mid_lats, mid_lons = points_along(path_lats, path_lons, (starts + ends) / 2)
+        return RouteGeometry(
+            latitudes=path_lats[boundary_positions],
+            longitudes=path_lons[boundary_positions],
+            distances_km=ends - starts,
+            mid_latitudes=mid_lats,
+            mid_longitudes=mid_lons,
+            path_latitudes=path_lats,
+            path_longitudes=path_lons,
+            boundary_positions=boundary_positions
+        )
+
+    @staticmethod
+    def fetch_candidates(
+        db: Session,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        radius_km: float
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Ids and coordinates of all accidents that may lie within radius of
+        any point
+
+        Served from the spatial index when built, otherwise from a single
+        bounding-box query over the whole route.
+        """
+        if accident_index.is_built:
+            return accident_index.candidates_near(latitudes, longitudes, radius_km)
+
+        # 1 degree latitude ≈ 111 km
+        lat_offset = radius_km / 111.0
+        max_abs_lat = float(np.max(np.abs(latitudes)))
+        lon_offset = radius_km / (111.0 * max(np.cos(np.radians(max_abs_lat)), 1e-6))
+
+        rows = db.query(Accident.id, Accident.latitude, Accident.longitude).filter(
+            and_(
+                Accident.latitude.between(
+                    float(latitudes.min()) - lat_offset, float(latitudes.max()) + lat_offset
+                ),
+                Accident.longitude.between(
+                    float(longitudes.min()) - lon_offset, float(longitudes.max()) + lon_offset
+                )
+            )
+        ).all()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+
+        ids, lats, lons = zip(*rows)
+        return (
+            np.array(ids, dtype=np.int64),
+            np.array(lats, dtype=np.float64),
+            np.array(lons, dtype=np.float64)
+        )
+
+    @staticmethod
+    def count_accidents(
+        db: Session,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        radius_km: float = None
+    ) -> np.ndarray:
+        """Number of accidents within radius of each point"""
+        radius_km = radius_km or settings.ROUTE_SEGMENT_RADIUS_KM
+        counts = np.zeros(len(latitudes), dtype=np.int64)
+        if len(latitudes) == 0:
+            return counts
+
+        _, cand_lats, cand_lons = RouteEngine.fetch_candidates(
+            db, latitudes, longitudes, radius_km
+        )
+        if len(cand_lats) == 0:
+            return counts
+
+        approximate = use_approximation(radius_km)
+        chunk = max(1, MATRIX_CHUNK_ELEMENTS // len(cand_lats))
+        for start in range(0, len(latitudes), chunk):
+            stop = start + chunk
+            distances = distance_matrix(
+                latitudes[start:stop], longitudes[start:stop],
+                cand_lats, cand_lons, approximate=approximate
+            )
+            counts[start:stop] = np.count_nonzero(distances <= radius_km, axis=1)
+        return counts
+
+    @staticmethod
+    def prepare_points(
+        route_points: Sequence[RoutePoint],
+        resample: bool = True
+    ) -> Tuple[List[RoutePoint], List[int], List[int], RouteGeometry]:
+        """
+        Sort route points and optionally simplify and resample them
+
+        Returns:
+            Tuple of (points, start_indices, end_indices, geometry) where
+            points are the segment boundaries and the indices map each
+            segment back to the sorted original points
+        """
+        sorted_points = sorted(route_points, key=lambda p: p.order)
+        if not resample:
+            n_segments = len(sorted_points) - 1
+            geometry = RouteEngine.geometry(
+                [p.latitude for p in sorted_points], [p.longitude for p in sorted_points]
+            )
+            return sorted_points, list(range(n_segments)), list(range(1, n_segments + 1)), geometry
+
+        # Simplify GPS-dense routes and cut them into fixed-length pieces,
+        # so cost follows the road length rather than the sampling rate
+        route = preprocess_route(
+            [p.latitude for p in sorted_points],
+            [p.longitude for p in sorted_points]
+        )
+        points = [
+            RoutePoint(latitude=lat, longitude=lon, order=i)
+            for i, (lat, lon) in enumerate(zip(route.latitudes.tolist(), route.longitudes.tolist()))
+        ]
+        geometry = RouteEngine.geometry(route.path_latitudes, route.path_longitudes, route.boundary_positions)
+        return points, route.start_indices.tolist(), route.end_indices.tolist(), geometry
+
+    @staticmethod
+    def make_segments(
+        route: PreparedRoute,
+        start: int,
+        stop: int,
+        risk_levels: Sequence[str],
+        risk_probabilities: np.ndarray
+    ) -> List[RouteSegmentRisk]:
+        """Segment risks for segments start..stop-1 from their model outputs"""
+        distances = route.geometry.distances_km[start:stop].tolist()
+        risk_probabilities = np.asarray(risk_probabilities).tolist()
+
+        segment_risks = []
+        for offset, distance in enumerate(distances):
+            i = start + offset
+
+            # Estimate time (assuming 50 km/h average speed)
+            estimated_time = (distance / AVERAGE_SPEED_KMH) * 60  # minutes
+
+            segment_risks.append(RouteSegmentRisk(
+                start_point=route.points[i],
+                end_point=route.points[i + 1],
+                risk_level=RiskLevel(risk_levels[offset]),
+                risk_score=risk_probabilities[offset] * 100,
+                distance_km=round(distance, 2),
+                estimated_time_minutes=round(estimated_time, 1),
+                accidents_count=int(route.accidents_counts[i]),
+                start_index=route.start_indices[i],
+                end_index=route.end_indices[i]
+            ))
+        return segment_risks
+
+    @staticmethod
+    def iter_segment_chunks(
+        db: Session,
+        route: PreparedRoute,
+        model: AccidentRiskModel = None,
+        chunk_size: int = None
+    ) -> Iterator[List[RouteSegmentRisk]]:
+        """
+        Score a prepared route chunk by chunk
+
+        Each chunk costs one candidate fetch and one batched model call, so
+        the first segments are available long before a long route finishes.
+        """
+        model = model or accident_model
+        chunk_size = chunk_size or settings.ROUTE_STREAM_CHUNK_SIZE
+        geometry = route.geometry
+        n_segments = len(route.points) - 1
+
+        for start in range(0, n_segments, chunk_size):
+            stop = min(start + chunk_size, n_segments)
+            mid_lats = geometry.mid_latitudes[start:stop]
+            mid_lons = geometry.mid_longitudes[start:stop]
+
+            historical_counts = RouteEngine.count_accidents(db, mid_lats, mid_lons)
+            risk_levels, risk_probabilities = model.predict_risk_many(
+                mid_lats, mid_lons, historical_accidents=historical_counts
+            )
+            yield RouteEngine.make_segments(route, start, stop, risk_levels, risk_probabilities)
+
+    @staticmethod
+    def unique_cells(
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        cell_size_deg: float = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Collapse points falling into the same grid cell
+
+        Each cell is represented by the first of its points. With a cell
+        size of 0 only identical coordinates are merged.
+
+        Returns:
+            Tuple of (cell_latitudes, cell_longitudes, inverse) where
+            inverse maps every input point to its cell
+        """
+        cell_size_deg = settings.ROUTE_COMPARISON_CELL_DEG if cell_size_deg is None else cell_size_deg
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+
+        if cell_size_deg > 0:
+            keys = np.column_stack([
+                np.floor(latitudes / cell_size_deg), np.floor(longitudes / cell_size_deg)
+            ])
+        else:
+            keys = np.column_stack([latitudes, longitudes])
+
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        return latitudes[first], longitudes[first], inverse.reshape(-1)
+
+    @staticmethod
+    def rank_routes(
+        analyses: Sequence[RouteAnalysisResponse],
+        scored_cells_count: int
+    ) -> RouteComparisonResponse:
+        """Rank analyzed routes by overall risk, then high-risk segments, then length"""
+        order = sorted(
+            range(len(analyses)),
+            key=lambda i: (
+                analyses[i].overall_risk_score,
+                analyses[i].high_risk_segments_count,
+                analyses[i].total_distance_km
+            )
+        )
+        return RouteComparisonResponse(
+            routes=[
+                RouteComparisonItem(route_index=i, rank=rank, analysis=analyses[i])
+                for rank, i in enumerate(order, start=1)
+            ],
+            recommended_route_index=order[0],
+            segments_count=sum(len(a.segment_risks) for a in analyses),
+            scored_cells_count=scored_cells_count
+        )
+
+    @staticmethod
+    def build_response(
+        route: PreparedRoute,
+        risk_levels: Sequence[str],
+        risk_probabilities: np.ndarray
+    ) -> RouteAnalysisResponse:
+        """Assemble per-segment risks, overall metrics and recommendations"""
+        segment_risks = RouteEngine.make_segments(
+            route, 0, len(route.points) - 1, risk_levels, risk_probabilities
+        )
+        summary = RouteSummary()
+        summary.add(segment_risks, route.geometry.distances_km)
+        return summary.to_response(segment_risks)
+
+
+class RouteSummary:
+    """
+    Running totals of scored segments
+
+    Only aggregates are kept, so streamed routes do not hold every segment
+    in memory to produce the summary.
+    """
+
+    def __init__(self):
+        self.segments_count = 0
+        self.total_distance = 0.0
+        self.total_risk_score = 0.0
+        self.estimated_total_time = 0.0
+        self.high_risk_count = 0
+
+    def add(self, segment_risks: Sequence[RouteSegmentRisk], distances_km: Sequence[float]):
+        """Add scored segments and their unrounded lengths"""
+        for segment in segment_risks:
+            self.segments_count += 1
+            self.total_risk_score += segment.risk_score
+            self.estimated_total_time += segment.estimated_time_minutes
+            if segment.risk_level == RiskLevel.HIGH:
+                self.high_risk_count += 1
+        self.total_distance += float(np.sum(distances_km))
+
+    def to_response(self, segment_risks: List[RouteSegmentRisk]) -> RouteAnalysisResponse:
+        """Overall metrics and recommendations"""
+        high_risk_count = self.high_risk_count
+
+        # Calculate overall metrics
+        avg_risk_score = self.total_risk_score / self.segments_count if self.segments_count else 0.0
+        estimated_total_time = self.estimated_total_time
+
+        # Determine overall risk level
+        if avg_risk_score < 20:
+            overall_risk_level = RiskLevel.LOW
+        elif avg_risk_score < 50:
+            overall_risk_level = RiskLevel.MEDIUM
+        else:
+            overall_risk_level = RiskLevel.HIGH
+
+        # Generate recommendations
+        recommendations = []
+        if high_risk_count > 0:
+            recommendations.append(
+                f"Tuyến đường có {high_risk_count} đoạn nguy hiểm. Cân nhắc chọn tuyến đường khác."
+            )
+        if overall_risk_level == RiskLevel.HIGH:
+            recommendations.append(
+                "Mức độ rủi ro tổng thể cao. Giảm tốc độ và tăng cường cảnh giác."
+            )
+        if avg_risk_score > 30:
+            recommendations.append(
+                "Tránh di chuyển vào giờ cao điểm hoặc thời tiết xấu nếu có thể."
+            )
+        if not recommendations:
+            recommendations.append(
+                "Tuyến đường tương đối an toàn. Vẫn cần chú ý quan sát."
+            )
+
+        return RouteAnalysisResponse(
+            total_distance_km=round(self.total_distance, 2),
+            estimated_time_minutes=round(estimated_total_time, 1),
+            overall_risk_level=overall_risk_level,
+            overall_risk_score=round(avg_risk_score, 2),
+            segment_risks=segment_risks,
+            high_risk_segments_count=high_risk_count,
+            recommendations=recommendations
+        )
@@ -0,0 +1,204 @@
+"""
+Route simplification and resampling before scoring
+
+GPS-dense polylines are first simplified with Douglas-Peucker and then cut
+into pieces of about `ROAD_SEGMENT_LENGTH_KM`, so the number of scored segments
+follows the length of the road rather than the sampling rate of the device.
+Every resulting piece keeps the range of original point indices it covers.
+
+Only piece boundaries are interpolated. A piece follows the simplified
+polyline between its boundaries, bends included, so piece lengths add up
+to the length of the simplified route.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from app.services.geo import EARTH_RADIUS_KM, path_lengths_km
+from config import settings
+
+
+class ResampledRoute(NamedTuple):
+    """Preprocessed route with a mapping back to the original points"""
+    latitudes: np.ndarray  # Piece boundaries
+    longitudes: np.ndarray
+    start_indices: np.ndarray  # Original index at or before each piece start
+    end_indices: np.ndarray  # Original index at or after each piece end
+    path_latitudes: np.ndarray  # Simplified polyline with the boundaries inserted
+    path_longitudes: np.ndarray
+    boundary_positions: np.ndarray  # Path index of each boundary; piece i spans [i], [i + 1]
+
+
+def _project_km(lats: np.ndarray, lons: np.ndarray):
+    """Local equirectangular projection in kilometers"""
+    km_per_deg = np.pi * EARTH_RADIUS_KM / 180.0
+    lat0 = np.radians(lats.mean())
+    return (lons - lons.mean()) * km_per_deg * np.cos(lat0), (lats - lats.mean()) * km_per_deg
+
+
+def simplify_route(lats, lons, tolerance_km: float = None) -> np.ndarray:
+    """
+    Douglas-Peucker simplification
+
+    Returns:
+        Sorted indices of the points to keep, always including both ends
+    """
+    tolerance_km = settings.ROUTE_SIMPLIFY_TOLERANCE_M / 1000.0 if tolerance_km is None else tolerance_km
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+    if n <= 2 or tolerance_km <= 0:
+        return np.arange(n)
+
+    x, y = _project_km(lats, lons)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        # Distance of interior points to the segment first-last
+        px, py = x[first + 1:last], y[first + 1:last]
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            distances = np.hypot(px - x[first], py - y[first])
+        else:
+            t = np.clip(((px - x[first]) * dx + (py - y[first]) * dy) / length_sq, 0.0, 1.0)
+            distances = np.hypot(px - (x[first] + t * dx), py - (y[first] + t * dy))
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_km:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return np.flatnonzero(keep)
+
+
+def _locate(cumulative: np.ndarray, lengths: np.ndarray, targets: np.ndarray):
+    """Segment containing each distance along a polyline and the fraction into it"""
+    segments = np.clip(np.searchsorted(cumulative, targets, side="right") - 1, 0, len(lengths) - 1)
+    safe_lengths = np.where(lengths[segments] > 0, lengths[segments], 1.0)
+    fractions = np.clip((targets - cumulative[segments]) / safe_lengths, 0.0, 1.0)
+    return segments, fractions
+
+
+def points_along(lats, lons, distances_km):
+    """
+    Points at the given distances along a polyline
+
+    Returns:
+        Tuple of (latitudes, longitudes), interpolated linearly between
+        the surrounding vertices
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    lengths = path_lengths_km(lats, lons)
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    segments, fractions = _locate(cumulative, lengths, np.asarray(distances_km, dtype=np.float64))
+    return (
+        lats[segments] + (lats[segments + 1] - lats[segments]) * fractions,
+        lons[segments] + (lons[segments + 1] - lons[segments]) * fractions
+    )
+
+
+def resample_route(lats, lons, segment_length_km: float = None) -> ResampledRoute:
+    """
+    Cut a polyline into equal pieces of about `segment_length_km`
+
+    The piece count is the route length divided by the target length,
+    rounded, so there is no short remainder piece. Piece boundaries are
+    interpolated linearly between the surrounding vertices and inserted
+    into the path; every vertex is kept.
+    """
+    segment_length_km = segment_length_km or settings.ROAD_SEGMENT_LENGTH_KM
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    lengths = path_lengths_km(lats, lons)
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    total = cumulative[-1]
+    if total == 0:
+        last = len(lats) - 1
+        return ResampledRoute(
+            lats[[0, last]], lons[[0, last]], np.array([0]), np.array([last]),
+            lats, lons, np.array([0, last])
+        )
+
+    n_pieces = max(int(round(total / segment_length_km)), 1)
+    targets = np.linspace(0.0, total, n_pieces + 1)
+
+    # Segment containing each target and the position inside it
+    segments, fractions = _locate(cumulative, lengths, targets)
+    new_lats = lats[segments] + (lats[segments + 1] - lats[segments]) * fractions
+    new_lons = lons[segments] + (lons[segments + 1] - lons[segments]) * fractions
+
+    # Boundaries strictly inside a segment are inserted after its first
+    # vertex; the others coincide with a vertex
+    inserted = (fractions > 0) & (fractions < 1)
+    inserted_segments = segments[inserted]
+    vertices = np.arange(len(lats))
+    vertex_positions = vertices + np.searchsorted(inserted_segments, vertices, side="left")
+    boundary_positions = vertex_positions[segments + (fractions >= 1)]
+    boundary_positions[inserted] = inserted_segments + 1 + np.arange(len(inserted_segments))
+
+    path_lats = np.empty(len(lats) + len(inserted_segments))
+    path_lons = np.empty(len(path_lats))
+    path_lats[vertex_positions], path_lons[vertex_positions] = lats, lons
+    path_lats[boundary_positions[inserted]] = new_lats[inserted]
+    path_lons[boundary_positions[inserted]] = new_lons[inserted]
+
+    start_indices = segments[:-1]
+    end_indices = np.clip(np.searchsorted(cumulative, targets[1:], side="left"), 0, len(lats) - 1)
+    return ResampledRoute(
+        new_lats, new_lons, start_indices, end_indices, path_lats, path_lons, boundary_positions
+    )
+
+
+def densify_route(lats, lons, spacing_km: float):
+    """
+    Insert points so consecutive samples are at most `spacing_km` apart
+
+    Returns:
+        Tuple of (latitudes, longitudes) including every original vertex
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n_segments = len(lats) - 1
+    if n_segments < 1:
+        return lats, lons
+
+    lengths = path_lengths_km(lats, lons)
+    steps = np.maximum(np.ceil(lengths / spacing_km).astype(np.int64), 1)
+    fractions = np.concatenate([np.arange(n) / n for n in steps.tolist()] + [np.array([0.0])])
+    starts = np.append(np.repeat(np.arange(n_segments), steps), n_segments - 1)
+    fractions[-1] = 1.0
+    return (
+        lats[starts] + (lats[starts + 1] - lats[starts]) * fractions,
+        lons[starts] + (lons[starts + 1] - lons[starts]) * fractions
+    )
+
+
+def preprocess_route(
+    lats,
+    lons,
+    tolerance_km: float = None,
+    segment_length_km: float = None
+) -> ResampledRoute:
+    """Simplify, then resample; start and end indices refer to the original points"""
+    kept = simplify_route(lats, lons, tolerance_km)
+    resampled = resample_route(
+        np.asarray(lats, dtype=np.float64)[kept],
+        np.asarray(lons, dtype=np.float64)[kept],
+        segment_length_km
+    )
+    return resampled._replace(
+        start_indices=kept[resampled.start_indices],
+        end_indices=kept[resampled.end_indices]
+    )
@@ -0,0 +1,502 @@
+"""
+Periodic recompute of road segment statistics
+
+The last-year and last-month counters of a segment depend on the current
+date, so they drift even when no accident is added. Calling
+update_segment_statistics once per segment costs one range scan of the
+accidents table per segment; so does a single SQL join of segments to
+accidents. recompute_segments reads the accidents table once instead:
+
+1. Each accident is reduced to coordinates, an age bucket (last month,
+   last year, older), hour of day and severity score, computed by the
+   database in the same scan.
+2. BoxAggregator sorts the accidents by latitude into buckets of
+   `bucket_size`, each sorted by longitude. A segment's area covers a run
+   of whole buckets, where the matching accidents are one contiguous
+   longitude slice per bucket, plus at most two partial buckets checked
+   accident by accident.
+3. The matches are reduced per segment with np.bincount.
+
+With an accident snapshot, step 1 derives the same columns from its
+memory-mapped files, and only accidents added since its last refresh
+are read from the database.
+
+Results equal update_segment_statistics. Only segments whose values
+changed are written back, with one executemany UPDATE per batch.
+
+Segments are read before the accidents. When a batch is written, its
+segments are locked and their last_updated is read again. A segment
+whose last_updated changed since the first read was updated by
+record_accident in the meantime. The scan may have missed that accident,
+so the segment is skipped and left to the next pass.
+
+Every API worker starts a SegmentRefresher, but only the one holding
+SegmentRefreshLock runs passes; the others retry the lock each interval
+and take over if that process exits. The lock is per host: with API
+servers on several hosts, set SEGMENT_REFRESH_INTERVAL_SECONDS=0 and run
+`python -m scripts.refresh_segments` from one scheduler instead.
+"""
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+import asyncio
+import time
+
+import numpy as np
+from sqlalchemy import bindparam, case, update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.database import Accident, RoadSegment
+from app.services.accident_snapshot import SEVERITY_VALUES, accident_snapshot
+from app.services.executor import worker_pools
+from app.services.risk_calculator import (
+    DEFAULT_SEVERITY_SCORE, SEGMENT_MARGIN_DEG, SEVERITY_SCORES, RiskCalculator
+)
+from config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process runs its own passes
+    fcntl = None
+
+
+STATISTIC_COLUMNS = [
+    "total_accidents", "accidents_last_year", "accidents_last_month",
+    "avg_severity", "peak_accident_hour", "hour_counts", "risk_score", "risk_level"
+]
+
+# Age buckets of an accident relative to the pass
+OLDER, LAST_YEAR, LAST_MONTH = 0, 1, 2
+
+# Hour code of accidents without hour_of_day
+NO_HOUR = 24
+
+# Segments aggregated and written per batch
+BATCH_SIZE = 5000
+
+# Accidents read per chunk of the table scan
+SCAN_CHUNK_ROWS = 50_000
+
+
+class AccidentColumns(NamedTuple):
+    """Per-accident inputs of segment statistics"""
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    age_buckets: np.ndarray  # OLDER, LAST_YEAR or LAST_MONTH
+    hours: np.ndarray  # 0-23, NO_HOUR if unknown
+    severities: np.ndarray  # SEVERITY_SCORES value
+
+
+class SegmentAggregates(NamedTuple):
+    totals: np.ndarray
+    last_year: np.ndarray
+    last_month: np.ndarray
+    severity_sums: np.ndarray
+    hour_counts: np.ndarray  # (segments, 24)
+
+
+def load_accident_columns(db: Session, now: datetime, snapshot=None) -> AccidentColumns:
+    """
+    Read the accidents table once, bucketing by age in the query
+
+    With an AccidentSnapshot as `snapshot`, the snapshot is refreshed and
+    the columns are computed from its live rows instead of the table.
+    """
+    if snapshot is not None:
+        return _snapshot_columns(db, now, snapshot)
+
+    age_bucket = case(
+        (Accident.accident_date >= now - timedelta(days=30), LAST_MONTH),
+        (Accident.accident_date >= now - timedelta(days=365), LAST_YEAR),
+        else_=OLDER
+    )
+    severity = case(
+        *[(Accident.severity == name, score) for name, score in SEVERITY_SCORES.items()],
+        else_=DEFAULT_SEVERITY_SCORE
+    )
+    rows = db.query(
+        Accident.latitude, Accident.longitude, age_bucket,
+        case((Accident.hour_of_day.between(0, 23), Accident.hour_of_day), else_=NO_HOUR),
+        severity
+    ).yield_per(SCAN_CHUNK_ROWS)
+
+    chunks = []
+    batch = []
+    for row in rows:
+        batch.append(tuple(row))
+        if len(batch) == SCAN_CHUNK_ROWS:
+            chunks.append(np.array(batch, dtype=np.float64))
+            batch = []
+    if batch:
+        chunks.append(np.array(batch, dtype=np.float64))
+    table = np.concatenate(chunks) if chunks else np.empty((0, 5))
+
+    return AccidentColumns(
+        latitudes=np.ascontiguousarray(table[:, 0]),
+        longitudes=np.ascontiguousarray(table[:, 1]),
+        age_buckets=table[:, 2].astype(np.int8),
+        hours=table[:, 3].astype(np.int64),
+        severities=np.ascontiguousarray(table[:, 4])
+    )
+
+
+def _snapshot_columns(db: Session, now: datetime, snapshot) -> AccidentColumns:
+    snapshot.refresh(db)
+    source = snapshot.columns(["latitude", "longitude", "timestamp", "hour", "severity"])
+
+    # Snapshot timestamps are whole seconds
+    timestamps = source["timestamp"]
+    age_buckets = np.full(len(timestamps), OLDER, dtype=np.int8)
+    age_buckets[timestamps >= np.datetime64(now - timedelta(days=365), "s")] = LAST_YEAR
+    age_buckets[timestamps >= np.datetime64(now - timedelta(days=30), "s")] = LAST_MONTH
+
+    hours = source["hour"].astype(np.int64)
+    hours[(hours < 0) | (hours > 23)] = NO_HOUR
+
+    scores = np.array([SEVERITY_SCORES.get(value, DEFAULT_SEVERITY_SCORE) for value in SEVERITY_VALUES])
+    return AccidentColumns(
+        latitudes=source["latitude"],
+        longitudes=source["longitude"],
+        age_buckets=age_buckets,
+        hours=hours,
+        severities=scores[source["severity"]]
+    )
+
+
+def _ragged_arange(starts: np.ndarray, stops: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenation of arange(start, stop) for every pair
+
+    Returns:
+        Tuple of (values, index of the pair each value belongs to)
+    """
+    lengths = np.maximum(stops - starts, 0)
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    values = np.arange(lengths.sum()) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
+    return values, owners
+
+
+class BoxAggregator:
+    """
+    Sums accident statistics over many latitude/longitude boxes
+
+    Bounds are inclusive on both sides, as SQL BETWEEN. Work per box is
+    one slice per whole bucket it covers plus up to 2 * bucket_size
+    accidents checked individually.
+    """
+
+    def __init__(self, columns: AccidentColumns, bucket_size: int = 256):
+        self.columns = columns
+        self.bucket_size = bucket_size
+        n = len(columns.latitudes)
+
+        # Accidents by latitude; rank r lies in bucket r // bucket_size
+        self.by_latitude = np.argsort(columns.latitudes, kind="stable")
+        self.sorted_latitudes = columns.latitudes[self.by_latitude]
+
+        # Within each bucket by longitude. Longitudes are replaced by their
+        # rank among distinct values, so (bucket, longitude) is one exact
+        # int64 key.
+        self.distinct_longitudes = np.unique(columns.longitudes)
+        longitude_ranks = np.searchsorted(self.distinct_longitudes, columns.longitudes)
+        self.key_stride = len(self.distinct_longitudes) + 1
+        buckets = np.arange(n) // bucket_size
+        keys = buckets * self.key_stride + longitude_ranks[self.by_latitude]
+        within_bucket = np.argsort(keys, kind="stable")
+        self.keys = keys[within_bucket]
+        self.by_bucket = self.by_latitude[within_bucket]
+
+    def aggregate(
+        self,
+        min_lats: np.ndarray,
+        max_lats: np.ndarray,
+        min_lons: np.ndarray,
+        max_lons: np.ndarray
+    ) -> SegmentAggregates:
+        n_boxes = len(min_lats)
+        size = self.bucket_size
+
+        # Latitude ranks inside each box: [first, stop)
+        first = np.searchsorted(self.sorted_latitudes, min_lats, side="left")
+        stop = np.searchsorted(self.sorted_latitudes, max_lats, side="right")
+        first_full = -(-first // size)
+        stop_full = np.maximum(stop // size, first_full)
+        has_full = stop_full > first_full
+
+        # Whole buckets: one longitude slice each
+        min_ranks = np.searchsorted(self.distinct_longitudes, min_lons, side="left")
+        stop_ranks = np.searchsorted(self.distinct_longitudes, max_lons, side="right")
+        buckets, bucket_box = _ragged_arange(first_full, stop_full)
+        slice_starts = np.searchsorted(self.keys, buckets * self.key_stride + min_ranks[bucket_box])
+        slice_stops = np.searchsorted(self.keys, buckets * self.key_stride + stop_ranks[bucket_box])
+        positions, slice_owner = _ragged_arange(slice_starts, slice_stops)
+        full_accidents = self.by_bucket[positions]
+        full_boxes = bucket_box[slice_owner]
+
+        # Partial buckets at either end (the whole range if no bucket is whole)
+        head_stop = np.where(has_full, np.minimum(first_full * size, stop), stop)
+        tail_first = np.where(has_full, np.maximum(stop_full * size, first), stop)
+        head_ranks, head_boxes = _ragged_arange(first, head_stop)
+        tail_ranks, tail_boxes = _ragged_arange(tail_first, stop)
+        edge_accidents = self.by_latitude[np.concatenate([head_ranks, tail_ranks])]
+        edge_boxes = np.concatenate([head_boxes, tail_boxes])
+        edge_lons = self.columns.longitudes[edge_accidents]
+        inside = (edge_lons >= min_lons[edge_boxes]) & (edge_lons <= max_lons[edge_boxes])
+
+        accidents = np.concatenate([full_accidents, edge_accidents[inside]])
+        boxes = np.concatenate([full_boxes, edge_boxes[inside]])
+
+        columns = self.columns
+        ages = columns.age_buckets[accidents]
+        hours = np.bincount(
+            boxes * (NO_HOUR + 1) + columns.hours[accidents], minlength=n_boxes * (NO_HOUR + 1)
+        ).reshape(n_boxes, NO_HOUR + 1)
+        return SegmentAggregates(
+            totals=np.bincount(boxes, minlength=n_boxes),
+            last_year=np.bincount(boxes[ages >= LAST_YEAR], minlength=n_boxes),
+            last_month=np.bincount(boxes[ages == LAST_MONTH], minlength=n_boxes),
+            severity_sums=np.bincount(boxes, weights=columns.severities[accidents], minlength=n_boxes),
+            hour_counts=hours[:, :NO_HOUR]
+        )
+
+
+def recompute_segments(db: Session, snapshot=None) -> dict:
+    """
+    Recompute the statistics of all road segments in one pass
+
+    With an AccidentSnapshot as `snapshot`, accidents are read from it
+    (see load_accident_columns).
+
+    Returns:
+        Metrics of the pass: accidents scanned, segments scanned and
+        updated, accident-segment matches and duration
+    """
+    started_at = time.perf_counter()
+    now = datetime.now()
+
+    # Segments first: a segment updated after this read is skipped below
+    segments = db.query(
+        RoadSegment.id, RoadSegment.start_lat, RoadSegment.end_lat,
+        RoadSegment.start_lon, RoadSegment.end_lon,
+        *[getattr(RoadSegment, name) for name in STATISTIC_COLUMNS],
+        RoadSegment.last_updated
+    ).order_by(RoadSegment.id).all()
+    columns = load_accident_columns(db, now, snapshot)
+    # End the read transaction, so the check below sees later commits
+    db.commit()
+    aggregator = BoxAggregator(columns)
+    scanned_at = time.perf_counter()
+
+    table = RoadSegment.__table__
+    statement = update(table).where(table.c.id == bindparam("segment_pk")).values(
+        {name: bindparam(name) for name in STATISTIC_COLUMNS + ["last_updated"]}
+    )
+
+    updated = skipped = matches = 0
+    for start in range(0, len(segments), BATCH_SIZE):
+        batch = segments[start:start + BATCH_SIZE]
+        bounds = np.array([row[1:5] for row in batch], dtype=np.float64)
+        aggregates = aggregator.aggregate(
+            bounds[:, 0] - SEGMENT_MARGIN_DEG, bounds[:, 1] + SEGMENT_MARGIN_DEG,
+            bounds[:, 2] - SEGMENT_MARGIN_DEG, bounds[:, 3] + SEGMENT_MARGIN_DEG
+        )
+        matches += int(aggregates.totals.sum())
+
+        changes = []
+        for i, row in enumerate(batch):
+            total = int(aggregates.totals[i])
+            last_year = int(aggregates.last_year[i])
+            last_month = int(aggregates.last_month[i])
+            avg_severity = float(aggregates.severity_sums[i]) / total if total else None
+            hour_counts = aggregates.hour_counts[i].tolist()
+            risk_score, risk_level = RiskCalculator.segment_risk(last_year, last_month, avg_severity)
+            values = (
+                total, last_year, last_month, avg_severity,
+                RiskCalculator._peak_hour(hour_counts), hour_counts,
+                risk_score / 100.0, risk_level.value
+            )
+            if not _unchanged(row[5:-1], values):
+                changes.append({"segment_pk": row[0], **dict(zip(STATISTIC_COLUMNS, values)), "last_updated": now})
+
+        if changes:
+            seen = {row[0]: row[-1] for row in batch}
+            current = _lock_segments(db, changes[0]["segment_pk"], changes[-1]["segment_pk"])
+            unchanged_since_read = [
+                change for change in changes
+                if change["segment_pk"] in current and current[change["segment_pk"]] == seen[change["segment_pk"]]
+            ]
+            if unchanged_since_read:
+                db.execute(statement, unchanged_since_read)
+            db.commit()
+            updated += len(unchanged_since_read)
+            skipped += len(changes) - len(unchanged_since_read)
+
+    return {
+        "accidents_scanned": len(columns.latitudes),
+        "segments_scanned": len(segments),
+        "segments_updated": updated,
+        "segments_skipped": skipped,
+        "accident_segment_matches": matches,
+        "scan_seconds": round(scanned_at - started_at, 3),
+        "duration_seconds": round(time.perf_counter() - started_at, 3),
+        "finished_at": datetime.now().isoformat()
+    }
+
+
+def _lock_segments(db: Session, first_pk: int, last_pk: int) -> dict:
+    """Lock the segments with ids in [first_pk, last_pk] until commit; returns their last_updated by id"""
+    if db.get_bind().dialect.name == "sqlite":
+        # No row locks (FOR UPDATE is not emitted): a no-op write takes the
+        # database write lock before the read, without firing onupdate
+        db.execute(update(RoadSegment).where(RoadSegment.id == first_pk).values(
+            id=RoadSegment.id, last_updated=RoadSegment.last_updated
+        ))
+    return dict(
+        db.query(RoadSegment.id, RoadSegment.last_updated)
+        .filter(RoadSegment.id.between(first_pk, last_pk))
+        .with_for_update()
+        .all()
+    )
+
+
+def _unchanged(current, values) -> bool:
+    for old, new in zip(current, values):
+        if isinstance(new, float) and old is not None:
+            if abs(old - new) > 1e-9:
+                return False
+        elif old != new:
+            return False
+    return True
+
+
+class SegmentRefreshLock:
+    """
+    Exclusive lock on SEGMENT_REFRESH_LOCK_PATH, taken without waiting
+
+    Held for as long as a process runs passes. The kernel releases it when
+    the process exits, so a crashed holder does not block the others.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = Path(path or settings.SEGMENT_REFRESH_LOCK_PATH)
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """Take the lock if it is free; True if this process holds it"""
+        if self._file is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        file = open(self.path, "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file.close()
+                return False
+        self._file = file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class SegmentRefresher:
+    """
+    Runs recompute_segments every SEGMENT_REFRESH_INTERVAL_SECONDS
+
+    Only the process holding SegmentRefreshLock runs passes. Its first pass
+    runs right after startup, so windows that drifted while the API was down
+    are corrected. Passes run on the DB pool with their own session.
+    """
+
+    def __init__(self, interval_seconds: float = None):
+        self.interval_seconds = (
+            settings.SEGMENT_REFRESH_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+        )
+        self._task: Optional[asyncio.Task] = None
+        self._lock = SegmentRefreshLock()
+
+        # Metrics
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_run: Optional[dict] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.is_running or self.interval_seconds <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self.is_running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._lock.release()
+
+    async def _run(self):
+        while True:
+            # Another worker on this host runs the passes
+            if not self._lock.acquire():
+                self.skipped += 1
+            else:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    self.failures += 1
+                    print(f"Segment refresh failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def refresh(self) -> dict:
+        """Run one pass now"""
+        self.last_run = await worker_pools.run_db(self._refresh)
+        self.runs += 1
+        return self.last_run
+
+    @staticmethod
+    def _refresh() -> dict:
+        db = SessionLocal()
+        try:
+            return recompute_segments(
+                db, snapshot=accident_snapshot if settings.ACCIDENT_SNAPSHOT_ENABLED else None
+            )
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.is_running,
+            "interval_seconds": self.interval_seconds,
+            "holds_lock": self._lock.held,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_run": self.last_run
+        }
+
+
+# Global refresher instance
+segment_refresher = SegmentRefresher()
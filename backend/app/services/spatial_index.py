@@ -0,0 +1,638 @@
+"""
+In-memory spatial index for accident locations
+
+Every API worker holds its own index. Changes made through a worker are
+applied to its index right away; sync() picks up the changes made by other
+workers, from the accident snapshot or from the table.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+import math
+import threading
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.database import Accident, AccidentDailyRollup
+from app.services.geo import EARTH_RADIUS_KM, distance_km, use_approximation
+from config import settings
+
+
+Cell = Tuple[int, int]
+
+# Kilometers per degree of latitude on a sphere of radius 6371 km
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+# Points binned per step when building a count grid
+BUILD_CHUNK_POINTS = 1_000_000
+
+
+class AccidentCountGrid:
+    """
+    Row-wise cumulative accident counts over fine grid cells
+
+    `_cumulative[row, col]` holds the number of accidents in cells
+    `0..col-1` of `row`, so the accidents in any horizontal run of cells are
+    one subtraction. A radius count sums one run per cell row covered by the
+    circle, with no per-accident work or allocation.
+
+    Cells are counted when their center falls inside the circle, so the
+    result can only be off for accidents within one cell diagonal of the
+    circle boundary (~150 m at the default 0.001° cell size).
+    """
+
+    def __init__(self, cell_size_deg: float = None, max_cells: int = None):
+        self.base_cell_size_deg = cell_size_deg or settings.COUNT_GRID_CELL_DEG
+        self.max_cells = max_cells or settings.COUNT_GRID_MAX_CELLS
+        self.cell_size_deg = self.base_cell_size_deg
+        self._cumulative: Optional[np.ndarray] = None
+        self._min_lat = 0.0
+        self._min_lon = 0.0
+        self.is_built = False
+
+    def build(self, lats: np.ndarray, lons: np.ndarray, margin_km: float = None):
+        """Build the grid over the extent of the given points plus a margin"""
+        if len(lats) == 0:
+            self._cumulative = None
+            self.is_built = False
+            return
+
+        margin_km = settings.NEARBY_RADIUS_KM if margin_km is None else margin_km
+        lat_margin = margin_km / KM_PER_DEGREE
+        min_lat = max(float(lats.min()) - lat_margin, -90.0)
+        max_lat = min(float(lats.max()) + lat_margin, 90.0)
+        poleward_lat = max(abs(min_lat), abs(max_lat))
+        lon_margin = lat_margin / max(math.cos(math.radians(poleward_lat)), 0.01)
+        min_lon = float(lons.min()) - lon_margin
+        max_lon = float(lons.max()) + lon_margin
+
+        # Coarsen the cells if the extent would exceed the memory budget
+        area = (max_lat - min_lat) * (max_lon - min_lon)
+        cell_size = max(self.base_cell_size_deg, math.sqrt(area / self.max_cells))
+
+        n_rows = int((max_lat - min_lat) / cell_size) + 1
+        n_cols = int((max_lon - min_lon) / cell_size) + 1
+        cumulative = np.zeros((n_rows, n_cols + 1), dtype=np.int32)
+
+        # Binned in chunks, so memory-mapped inputs are never copied whole
+        for start in range(0, len(lats), BUILD_CHUNK_POINTS):
+            stop = start + BUILD_CHUNK_POINTS
+            rows = ((lats[start:stop] - min_lat) / cell_size).astype(np.int64)
+            cols = ((lons[start:stop] - min_lon) / cell_size).astype(np.int64)
+            np.add.at(cumulative, (rows, cols + 1), 1)
+        np.cumsum(cumulative, axis=1, out=cumulative)
+
+        self.cell_size_deg = cell_size
+        self._min_lat = min_lat
+        self._min_lon = min_lon
+        self._cumulative = cumulative
+        self.is_built = True
+
+    def add(self, latitude: float, longitude: float, delta: int = 1) -> bool:
+        """
+        Adjust the count of the cell containing the point
+
+        Returns False if the point lies outside the grid, in which case the
+        grid must be rebuilt before it can be used again.
+        """
+        if self._cumulative is None:
+            return False
+        row = int((latitude - self._min_lat) / self.cell_size_deg)
+        col = int((longitude - self._min_lon) / self.cell_size_deg)
+        n_rows, n_cols_plus_one = self._cumulative.shape
+        if not (0 <= row < n_rows and 0 <= col < n_cols_plus_one - 1):
+            return False
+        self._cumulative[row, col + 1:] += delta
+        return True
+
+    def count(self, latitude: float, longitude: float, radius_km: float) -> int:
+        """Approximate number of accidents within radius (see class docstring)"""
+        cumulative = self._cumulative
+        n_rows, n_cols_plus_one = cumulative.shape
+        size = self.cell_size_deg
+
+        lat_offset = radius_km / KM_PER_DEGREE
+        row_lo = max(math.floor((latitude - lat_offset - self._min_lat) / size), 0)
+        row_hi = min(math.floor((latitude + lat_offset - self._min_lat) / size), n_rows - 1)
+        if row_hi < row_lo:
+            return 0
+
+        rows = np.arange(row_lo, row_hi + 1)
+        dy_km = (self._min_lat + (rows + 0.5) * size - latitude) * KM_PER_DEGREE
+        half_width_km = np.sqrt(np.maximum(radius_km * radius_km - dy_km * dy_km, 0.0))
+        lon_half = half_width_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+
+        # First and last column whose center lies inside the circle
+        col_lo = np.ceil((longitude - lon_half - self._min_lon) / size - 0.5).astype(np.int64)
+        col_hi = np.floor((longitude + lon_half - self._min_lon) / size - 0.5).astype(np.int64)
+        col_lo = np.clip(col_lo, 0, n_cols_plus_one - 1)
+        col_hi = np.clip(col_hi, -1, n_cols_plus_one - 2)
+
+        valid = (np.abs(dy_km) <= radius_km) & (col_hi >= col_lo)
+        counts = cumulative[rows, col_hi + 1] - cumulative[rows, col_lo]
+        return int(counts[valid].sum())
+
+    def count_many(
+        self,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        radius_km: float,
+        block_size: int = 4096
+    ) -> np.ndarray:
+        """
+        count() for many points at once
+
+        Each block of points is evaluated as one (points, cell rows) array,
+        so the cost is linear in the number of points with no Python loop
+        per point. Results equal count() point for point.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        counts = np.zeros(len(latitudes), dtype=np.int64)
+        cumulative = self._cumulative
+        if cumulative is None:
+            return counts
+
+        n_rows, n_cols_plus_one = cumulative.shape
+        size = self.cell_size_deg
+        lat_offset = radius_km / KM_PER_DEGREE
+        # Upper bound on the cell rows a circle can cover
+        row_offsets = np.arange(int(2 * lat_offset / size) + 2)
+
+        for start in range(0, len(latitudes), block_size):
+            latitude = latitudes[start:start + block_size, None]
+            longitude = longitudes[start:start + block_size, None]
+
+            row_lo = np.floor((latitude - lat_offset - self._min_lat) / size).astype(np.int64)
+            row_hi = np.floor((latitude + lat_offset - self._min_lat) / size).astype(np.int64)
+            rows = row_lo + row_offsets
+            in_grid = (rows >= 0) & (rows < n_rows) & (rows <= row_hi)
+            rows = np.clip(rows, 0, n_rows - 1)
+
+            dy_km = (self._min_lat + (rows + 0.5) * size - latitude) * KM_PER_DEGREE
+            half_width_km = np.sqrt(np.maximum(radius_km * radius_km - dy_km * dy_km, 0.0))
+            cos_lat = np.maximum(np.cos(np.radians(latitude)), 1e-6)
+            lon_half = half_width_km / (KM_PER_DEGREE * cos_lat)
+
+            col_lo = np.ceil((longitude - lon_half - self._min_lon) / size - 0.5).astype(np.int64)
+            col_hi = np.floor((longitude + lon_half - self._min_lon) / size - 0.5).astype(np.int64)
+            col_lo = np.clip(col_lo, 0, n_cols_plus_one - 1)
+            col_hi = np.clip(col_hi, -1, n_cols_plus_one - 2)
+
+            valid = in_grid & (np.abs(dy_km) <= radius_km) & (col_hi >= col_lo)
+            runs = cumulative[rows, col_hi + 1] - cumulative[rows, col_lo]
+            counts[start:start + block_size] = np.where(valid, runs, 0).sum(axis=1)
+
+        return counts
+
+
+class AccidentSpatialIndex:
+    """
+    Grid bucket index over accident coordinates
+
+    Accidents are hashed into square cells of `cell_size_deg` degrees so a
+    radius query only visits the handful of cells overlapping its bounding
+    box instead of scanning the accidents table. An AccidentCountGrid is
+    kept alongside for count-only queries.
+    """
+
+    def __init__(self, cell_size_deg: float = None):
+        self.cell_size_deg = cell_size_deg or settings.SPATIAL_INDEX_CELL_DEG
+        self._cells: Dict[Cell, Dict[int, Tuple[float, float]]] = {}
+        self._cell_of_accident: Dict[int, Cell] = {}
+        self._count_grid = AccidentCountGrid()
+        self._count_grid_stale = True
+        self._lock = threading.RLock()
+        # Changes made while build() reads the table, replayed after the swap
+        self._journal: Optional[List[Tuple]] = None
+        # Snapshot rows applied so far: (created_at, rows, deleted rows)
+        self._snapshot_position: Optional[Tuple[str, int, int]] = None
+        # Table syncs: largest id read, and whether the count differed last time
+        self._max_id = 0
+        self._count_mismatch = False
+        self.is_built = False
+
+    def __len__(self) -> int:
+        return len(self._cell_of_accident)
+
+    def _cell(self, latitude: float, longitude: float) -> Cell:
+        return (
+            math.floor(latitude / self.cell_size_deg),
+            math.floor(longitude / self.cell_size_deg)
+        )
+
+    def build(self, db: Session, batch_size: int = 10000, snapshot=None):
+        """
+        Rebuild the index from all accidents in the database
+
+        With an AccidentSnapshot as `snapshot`, the snapshot is refreshed and
+        the coordinates are read from its columns instead of the table.
+
+        Safe to run in the background: add() and remove() calls made while
+        the table is read are applied to the new index as well.
+        """
+        cells: Dict[Cell, Dict[int, Tuple[float, float]]] = {}
+        cell_of_accident: Dict[int, Cell] = {}
+        position = None
+        with self._lock:
+            self._journal = []
+
+        try:
+            if snapshot is not None:
+                snapshot.refresh(db)
+                position = self._position_in(snapshot)
+                columns = snapshot.columns(["id", "latitude", "longitude"])
+                rows = zip(columns["id"].tolist(), columns["latitude"].tolist(), columns["longitude"].tolist())
+            else:
+                rows = db.query(
+                    Accident.id, Accident.latitude, Accident.longitude
+                ).yield_per(batch_size)
+
+            for accident_id, latitude, longitude in rows:
+                cell = self._cell(latitude, longitude)
+                cells.setdefault(cell, {})[accident_id] = (latitude, longitude)
+                cell_of_accident[accident_id] = cell
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+
+        with self._lock:
+            self._cells = cells
+            self._cell_of_accident = cell_of_accident
+            self._count_grid_stale = True
+            self._snapshot_position = position
+            self._max_id = max(cell_of_accident, default=0)
+            self._count_mismatch = False
+            self.is_built = True
+
+            journal, self._journal = self._journal, None
+            for change in journal:
+                if change[0] == "add":
+                    self.add(*change[1:])
+                else:
+                    self._discard(change[1])
+
+    def add(self, accident_id: int, latitude: float, longitude: float):
+        """Insert or move a single accident"""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(("add", accident_id, latitude, longitude))
+            self._discard(accident_id)
+            cell = self._cell(latitude, longitude)
+            self._cells.setdefault(cell, {})[accident_id] = (latitude, longitude)
+            self._cell_of_accident[accident_id] = cell
+            if not self._count_grid.add(latitude, longitude):
+                self._count_grid_stale = True
+
+    def remove(self, accident_id: int):
+        """Remove a single accident if it is indexed"""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(("remove", accident_id))
+            self._discard(accident_id)
+
+    def sync(self, db: Session, snapshot=None) -> Optional[List[Tuple[float, float]]]:
+        """
+        Apply accidents added or deleted by other processes since the last
+        build or sync
+
+        With an AccidentSnapshot as `snapshot`, it is refreshed and its rows
+        appended or flagged deleted since then are applied. If the index
+        still differs from the snapshot in size (an accident deleted before
+        it reached the snapshot), ids are compared. Without a snapshot,
+        accidents above the largest indexed id are read from the table, and
+        the index is rebuilt when its size differs from the table's on two
+        syncs in a row.
+
+        Returns:
+            Locations of the accidents added or removed, or None if the
+            index was rebuilt
+        """
+        if not self.is_built:
+            return []
+        if snapshot is None:
+            return self._sync_from_table(db)
+
+        snapshot.refresh(db)
+        if self._snapshot_position is None or self._snapshot_position[0] != snapshot.created_at:
+            # Built from the table, or the snapshot was rebuilt since
+            self.build(db, snapshot=snapshot)
+            return None
+
+        _, applied_rows, applied_deleted = self._snapshot_position
+        position = self._position_in(snapshot)
+        _, rows, deleted_rows = position
+        columns = snapshot.columns(["id", "latitude", "longitude", "deleted"], include_deleted=True)
+
+        changed = []
+        appended = slice(applied_rows, rows)
+        live = ~columns["deleted"][appended]
+        for accident_id, latitude, longitude in zip(
+            columns["id"][appended][live].tolist(),
+            columns["latitude"][appended][live].tolist(),
+            columns["longitude"][appended][live].tolist()
+        ):
+            self.add(accident_id, latitude, longitude)
+            changed.append((latitude, longitude))
+
+        if deleted_rows != applied_deleted:
+            deleted_ids = columns["id"][:rows][columns["deleted"][:rows]]
+            with self._lock:
+                for accident_id in deleted_ids.tolist():
+                    location = self._location(accident_id)
+                    if location is not None:
+                        self.remove(accident_id)
+                        changed.append(location)
+        self._snapshot_position = position
+
+        if len(self) != len(snapshot):
+            changed.extend(self._reconcile(db, columns, snapshot.watermark))
+        return changed
+
+    def _reconcile(
+        self,
+        db: Session,
+        columns: Dict[str, np.ndarray],
+        watermark: int
+    ) -> List[Tuple[float, float]]:
+        """Make the indexed ids equal the snapshot's live ids plus newer accidents in the table"""
+        live = ~columns["deleted"]
+        snapshot_ids = columns["id"][live]
+        changed = []
+        with self._lock:
+            indexed = np.fromiter(self._cell_of_accident, dtype=np.int64, count=len(self._cell_of_accident))
+            extra = indexed[~np.isin(indexed, snapshot_ids)]
+
+            # Ids above the watermark may have been added here after the
+            # refresh; keep those still in the table
+            newer = extra[extra > watermark].tolist()
+            if newer:
+                existing = {
+                    accident_id for accident_id, in
+                    db.query(Accident.id).filter(Accident.id.in_(newer)).all()
+                }
+                extra = np.array(
+                    [accident_id for accident_id in extra.tolist() if accident_id not in existing],
+                    dtype=np.int64
+                )
+
+            for accident_id in extra.tolist():
+                changed.append(self._location(accident_id))
+                self.remove(accident_id)
+
+            missing = ~np.isin(snapshot_ids, indexed)
+            for accident_id, latitude, longitude in zip(
+                snapshot_ids[missing].tolist(),
+                columns["latitude"][live][missing].tolist(),
+                columns["longitude"][live][missing].tolist()
+            ):
+                self.add(accident_id, latitude, longitude)
+                changed.append((latitude, longitude))
+        return changed
+
+    def _sync_from_table(self, db: Session) -> Optional[List[Tuple[float, float]]]:
+        changed = []
+        for accident_id, latitude, longitude in db.query(
+            Accident.id, Accident.latitude, Accident.longitude
+        ).filter(Accident.id > self._max_id).order_by(Accident.id).all():
+            self.add(accident_id, latitude, longitude)
+            changed.append((latitude, longitude))
+            self._max_id = accident_id
+
+        # Deletions: the rollup total is the accident count. A single
+        # mismatch may be a write that landed between the two queries.
+        expected = db.query(func.coalesce(func.sum(AccidentDailyRollup.accident_count), 0)).scalar()
+        if expected == len(self):
+            self._count_mismatch = False
+        elif self._count_mismatch:
+            self.build(db)
+            return None
+        else:
+            self._count_mismatch = True
+        return changed
+
+    @staticmethod
+    def _position_in(snapshot) -> Tuple[str, int, int]:
+        """Snapshot rows and deleted rows, read before its columns"""
+        deleted = snapshot.columns(["deleted"], include_deleted=True)["deleted"]
+        return snapshot.created_at, len(deleted), int(np.count_nonzero(deleted))
+
+    def _location(self, accident_id: int) -> Optional[Tuple[float, float]]:
+        cell = self._cell_of_accident.get(accident_id)
+        if cell is None:
+            return None
+        return self._cells[cell][accident_id]
+
+    def _discard(self, accident_id: int):
+        cell = self._cell_of_accident.pop(accident_id, None)
+        if cell is None:
+            return
+        bucket = self._cells.get(cell)
+        if bucket is None:
+            return
+        location = bucket.pop(accident_id, None)
+        if not bucket:
+            del self._cells[cell]
+        if location is not None and not self._count_grid.add(*location, delta=-1):
+            self._count_grid_stale = True
+
+    def candidates(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get ids, latitudes and longitudes of accidents in cells overlapping
+        the bounding box of the radius. Callers filter by exact distance.
+        """
+        lat_offset, lon_offset = self._offsets(latitude, radius_km)
+        min_row, min_col = self._cell(latitude - lat_offset, longitude - lon_offset)
+        max_row, max_col = self._cell(latitude + lat_offset, longitude + lon_offset)
+
+        return self._collect(
+            (row, col)
+            for row in range(min_row, max_row + 1)
+            for col in range(min_col, max_col + 1)
+        )
+
+    def candidates_near(
+        self,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        radius_km: float
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Candidates for radius queries around many points, collected once
+
+        Each cell overlapping any point's bounding box is visited a single
+        time, so overlapping query circles do not duplicate accidents.
+        """
+        cells = set()
+        for latitude, longitude in zip(np.asarray(latitudes).tolist(), np.asarray(longitudes).tolist()):
+            lat_offset, lon_offset = self._offsets(latitude, radius_km)
+            min_row, min_col = self._cell(latitude - lat_offset, longitude - lon_offset)
+            max_row, max_col = self._cell(latitude + lat_offset, longitude + lon_offset)
+            cells.update(
+                (row, col)
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+            )
+        return self._collect(cells)
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int,
+        radius_km: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact k nearest accidents within radius, closest first
+
+        Visits square rings of cells around the query cell and stops as soon
+        as k hits are closer than anything an unvisited ring could contain,
+        or once the rings cover the whole radius.
+
+        Returns:
+            Tuple of (ids, distances_km) arrays of at most k elements
+        """
+        approximate = use_approximation(radius_km)
+        center_row, center_col = self._cell(latitude, longitude)
+        lat_offset, lon_offset = self._offsets(latitude, radius_km)
+        max_ring = math.ceil(max(lat_offset, lon_offset) / self.cell_size_deg) + 1
+
+        found_ids, found_distances = [], []
+        found_count = 0
+        ring = 0
+        while True:
+            ids, lats, lons = self._collect(self._ring(center_row, center_col, ring))
+            if len(ids):
+                distances = distance_km(latitude, longitude, lats, lons, approximate)
+                inside = distances <= radius_km
+                found_ids.append(ids[inside])
+                found_distances.append(distances[inside])
+                found_count += int(inside.sum())
+
+            # Every point outside rings 0..ring is at least this far away
+            guaranteed_km = ring * self._min_cell_km(latitude, ring + 1)
+            if guaranteed_km >= radius_km or ring >= max_ring:
+                break
+            if found_count >= k:
+                closer = sum(int((d <= guaranteed_km).sum()) for d in found_distances)
+                if closer >= k:
+                    break
+            ring += 1
+
+        if not found_count:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        ids = np.concatenate(found_ids)
+        distances = np.concatenate(found_distances)
+        if len(ids) > k:
+            keep = np.argpartition(distances, k - 1)[:k]
+            ids, distances = ids[keep], distances[keep]
+        order = np.argsort(distances, kind="stable")
+        return ids[order], distances[order]
+
+    def count_within(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        exact: bool = False
+    ) -> int:
+        """
+        Number of accidents within radius, without materializing rows
+
+        By default the count comes from the cumulative-count grid and is
+        accurate to one fine cell at the circle boundary. Pass exact=True to
+        measure the distance to every candidate instead, which also happens
+        when the grid cells are too coarse for the radius.
+        """
+        if not exact:
+            with self._lock:
+                if self._count_grid_stale:
+                    self._rebuild_count_grid()
+                grid = self._count_grid
+                if grid.is_built and grid.cell_size_deg * KM_PER_DEGREE * 4 <= radius_km:
+                    return grid.count(latitude, longitude, radius_km)
+
+        _, lats, lons = self.candidates(latitude, longitude, radius_km)
+        if len(lats) == 0:
+            return 0
+        distances = distance_km(
+            latitude, longitude, lats, lons,
+            approximate=use_approximation(radius_km)
+        )
+        return int(np.count_nonzero(distances <= radius_km))
+
+    def count_many(self, lats: np.ndarray, lons: np.ndarray, radius_km: float) -> np.ndarray:
+        """Vectorized count_within for many points, from the count grid"""
+        with self._lock:
+            if self._count_grid_stale:
+                self._rebuild_count_grid()
+            grid = self._count_grid
+            if grid.is_built and grid.cell_size_deg * KM_PER_DEGREE * 4 <= radius_km:
+                return grid.count_many(lats, lons, radius_km)
+        return np.array([
+            self.count_within(lat, lon, radius_km)
+            for lat, lon in zip(np.asarray(lats).tolist(), np.asarray(lons).tolist())
+        ], dtype=np.int64)
+
+    def _rebuild_count_grid(self):
+        _, lats, lons = self._collect(list(self._cells))
+        self._count_grid.build(lats, lons)
+        self._count_grid_stale = False
+
+    @staticmethod
+    def _offsets(latitude: float, radius_km: float) -> Tuple[float, float]:
+        """Half-sizes in degrees of the bounding box of a radius"""
+        # 1 degree latitude ≈ 111 km
+        lat_offset = radius_km / 111.0
+        lon_offset = radius_km / (111.0 * max(math.cos(math.radians(latitude)), 1e-6))
+        return lat_offset, min(lon_offset, 180.0)
+
+    def _min_cell_km(self, latitude: float, rings: int) -> float:
+        """Smallest cell side in km over the latitude band spanned by `rings`"""
+        # 1 degree latitude ≈ 111 km; use the poleward edge for longitude width
+        extreme_lat = min(abs(latitude) + rings * self.cell_size_deg, 90.0)
+        height_km = self.cell_size_deg * 111.0
+        width_km = height_km * math.cos(math.radians(extreme_lat))
+        return min(height_km, width_km)
+
+    @staticmethod
+    def _ring(center_row: int, center_col: int, ring: int) -> Iterable[Cell]:
+        """Cells at Chebyshev distance `ring` from the center cell"""
+        if ring == 0:
+            yield center_row, center_col
+            return
+        for col in range(center_col - ring, center_col + ring + 1):
+            yield center_row - ring, col
+            yield center_row + ring, col
+        for row in range(center_row - ring + 1, center_row + ring):
+            yield row, center_col - ring
+            yield row, center_col + ring
+
+    def _collect(self, cells: Iterable[Cell]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        ids, lats, lons = [], [], []
+        with self._lock:
+            for cell in cells:
+                bucket = self._cells.get(cell)
+                if bucket:
+                    ids.extend(bucket.keys())
+                    for lat, lon in bucket.values():
+                        lats.append(lat)
+                        lons.append(lon)
+
+        return (
+            np.array(ids, dtype=np.int64),
+            np.array(lats, dtype=np.float64),
+            np.array(lons, dtype=np.float64)
+        )
+
+
+# Global index instance
+accident_index = AccidentSpatialIndex()
@@ -0,0 +1,237 @@
+"""
+Daily rollup of accident counts for /accidents/statistics
+
+accident_daily_rollups holds one count per day, severity, road type, hour
+of day and day of week. Statistics over a period are a GROUP BY over the
+rollup rows of its days, so their cost grows with the number of days and
+not with the number of accidents.
+
+The rollup is maintained in the transaction that writes the accidents:
+record_accident for single rows, record_frame for bulk import chunks.
+Both add to the existing count with an upsert. rebuild_rollup recomputes
+the whole table from the accidents table with one INSERT ... SELECT; it
+runs at startup when the table is empty and from
+scripts.rebuild_statistics_rollup.
+
+Missing severity and road type are stored as "unknown", missing hour and
+day of week as -1, as keys must not be NULL for the upsert to match.
+"""
+
+from datetime import datetime, time as dt_time, timedelta
+from typing import Dict, Iterable, List
+import time
+
+from sqlalchemy import Date, cast, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models.database import Accident, AccidentDailyRollup
+
+
+KEY_COLUMNS = ["day", "severity", "road_type", "hour_of_day", "day_of_week"]
+
+UNKNOWN = "unknown"
+NO_VALUE = -1
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def _day_of(column, dialect_name: str):
+    # CAST(... AS DATE) is numeric affinity on SQLite, date() returns the
+    # 'YYYY-MM-DD' text the Date type reads back
+    if dialect_name == "sqlite":
+        return func.date(column)
+    return cast(column, Date)
+
+
+def _upsert(db: Session, rows: List[dict]):
+    """Add each row's accident_count to the count stored under its key"""
+    if not rows:
+        return
+    table = AccidentDailyRollup.__table__
+    dialect_name = db.get_bind().dialect.name
+
+    if dialect_name in ("sqlite", "postgresql"):
+        if dialect_name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=KEY_COLUMNS,
+            set_={"accident_count": table.c.accident_count + statement.excluded.accident_count}
+        )
+        db.execute(statement, rows)
+        return
+
+    # Other databases: update, then insert the keys that had no row
+    for row in rows:
+        matched = db.execute(
+            update(table)
+            .where(*(table.c[name] == row[name] for name in KEY_COLUMNS))
+            .values(accident_count=table.c.accident_count + row["accident_count"])
+        ).rowcount
+        if not matched:
+            db.execute(insert(table), [row])
+
+
+def rollup_key(accident: Accident) -> dict:
+    return {
+        "day": accident.accident_date.date(),
+        "severity": accident.severity or UNKNOWN,
+        "road_type": accident.road_type or UNKNOWN,
+        "hour_of_day": NO_VALUE if accident.hour_of_day is None else accident.hour_of_day,
+        "day_of_week": NO_VALUE if accident.day_of_week is None else accident.day_of_week
+    }
+
+
+def record_accident(db: Session, accident: Accident, delta: int = 1):
+    """
+    Count an added (delta=1) or deleted (delta=-1) accident in the rollup
+
+    Runs in the caller's transaction; commit it together with the accident.
+    """
+    _upsert(db, [dict(rollup_key(accident), accident_count=delta)])
+
+
+def record_frame(db: Session, rows):
+    """
+    Count a DataFrame of imported accidents in the rollup
+
+    `rows` has the accident columns as prepared by bulk_ingest.prepare_chunk;
+    it is reduced to one upsert row per key first.
+    """
+    if rows.empty:
+        return
+    keys = rows[["severity", "road_type", "hour_of_day", "day_of_week"]].fillna(
+        {"severity": UNKNOWN, "road_type": UNKNOWN, "hour_of_day": NO_VALUE, "day_of_week": NO_VALUE}
+    )
+    keys.insert(0, "day", rows["accident_date"].dt.normalize())
+    counts = keys.groupby(KEY_COLUMNS, sort=False).size()
+
+    _upsert(db, [
+        {
+            "day": day.date(),
+            "severity": severity,
+            "road_type": road_type,
+            "hour_of_day": int(hour),
+            "day_of_week": int(weekday),
+            "accident_count": int(count)
+        }
+        for (day, severity, road_type, hour, weekday), count in counts.items()
+    ])
+
+
+def rebuild_rollup(db: Session) -> dict:
+    """
+    Recompute the rollup from the accidents table in one transaction
+
+    Returns:
+        Dictionary with the number of rollup rows and accidents and the
+        time taken
+    """
+    started_at = time.perf_counter()
+    dialect_name = db.get_bind().dialect.name
+    day = _day_of(Accident.accident_date, dialect_name)
+    key_expressions = [
+        day,
+        func.coalesce(Accident.severity, UNKNOWN),
+        func.coalesce(Accident.road_type, UNKNOWN),
+        func.coalesce(Accident.hour_of_day, NO_VALUE),
+        func.coalesce(Accident.day_of_week, NO_VALUE)
+    ]
+    table = AccidentDailyRollup.__table__
+
+    try:
+        db.execute(delete(table))
+        db.execute(insert(table).from_select(
+            KEY_COLUMNS + ["accident_count"],
+            select(*key_expressions, func.count()).group_by(*key_expressions)
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    rows, accidents = db.execute(
+        select(func.count(), func.coalesce(func.sum(table.c.accident_count), 0))
+    ).one()
+    return {
+        "rollup_rows": rows,
+        "accidents": accidents,
+        "seconds": round(time.perf_counter() - started_at, 3)
+    }
+
+
+def rebuild_if_empty(db: Session) -> bool:
+    """Backfill the rollup of a database that has accidents but no rollup rows"""
+    if db.query(AccidentDailyRollup.id).first() is not None:
+        return False
+    if db.query(Accident.id).first() is None:
+        return False
+    rebuild_rollup(db)
+    return True
+
+
+def accident_statistics(db: Session, start_date: datetime) -> Dict:
+    """
+    Accident counts since `start_date`, as in StatisticsResponse
+
+    Whole days come from the rollup. The rest of the first day, from
+    `start_date` to midnight, is counted in the accidents table.
+    """
+    first_full_day = start_date.date()
+    if start_date.time() != dt_time.min:
+        first_full_day += timedelta(days=1)
+
+    table = AccidentDailyRollup.__table__
+    groups: List[Iterable] = [
+        db.execute(
+            select(
+                table.c.severity, table.c.road_type, table.c.hour_of_day, table.c.day_of_week,
+                func.sum(table.c.accident_count)
+            )
+            .where(table.c.day >= first_full_day)
+            .group_by(table.c.severity, table.c.road_type, table.c.hour_of_day, table.c.day_of_week)
+        ).all()
+    ]
+
+    if first_full_day != start_date.date():
+        key_expressions = [
+            func.coalesce(Accident.severity, UNKNOWN),
+            func.coalesce(Accident.road_type, UNKNOWN),
+            func.coalesce(Accident.hour_of_day, NO_VALUE),
+            func.coalesce(Accident.day_of_week, NO_VALUE)
+        ]
+        groups.append(db.execute(
+            select(*key_expressions, func.count())
+            .where(
+                Accident.accident_date >= start_date,
+                Accident.accident_date < datetime.combine(first_full_day, dt_time.min)
+            )
+            .group_by(*key_expressions)
+        ).all())
+
+    total = 0
+    by_severity: Dict[str, int] = {}
+    by_road_type: Dict[str, int] = {}
+    by_hour: Dict[str, int] = {}
+    by_day: Dict[str, int] = {}
+    for rows in groups:
+        for severity, road_type, hour, weekday, count in rows:
+            if not count:
+                continue
+            total += count
+            by_severity[severity] = by_severity.get(severity, 0) + count
+            by_road_type[road_type] = by_road_type.get(road_type, 0) + count
+            if hour != NO_VALUE:
+                by_hour[str(hour)] = by_hour.get(str(hour), 0) + count
+            if weekday != NO_VALUE:
+                by_day[DAY_NAMES[weekday]] = by_day.get(DAY_NAMES[weekday], 0) + count
+
+    return {
+        "total_accidents": total,
+        "accidents_by_severity": by_severity,
+        "accidents_by_road_type": by_road_type,
+        "accidents_by_hour": by_hour,
+        "accidents_by_day": by_day
+    }
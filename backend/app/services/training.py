@@ -0,0 +1,374 @@
+"""
+Out-of-core training pipeline for the accident risk model
+
+Training runs in two stages over memory-mapped NumPy files in a cache
+directory, so memory stays bounded by the chunk size rather than the table
+size:
+
+1. extract_accidents streams the accidents table in id order and writes
+   one column file per input (coordinates, timestamp, weather, road type).
+   With an accident snapshot the columns are copied from it instead.
+2. build_feature_cache builds an AccidentCountGrid over all coordinates
+   and then computes the feature matrix chunk by chunk on a thread pool.
+   Every accident is a positive row. Negative rows are sampled near
+   accident locations at random times and conditions.
+
+`historical_accidents_nearby` comes from the grid's count_many, which is
+the same grid that serves `count_nearby_accidents` in the API. Features are
+built with AccidentRiskModel.prepare_features_many, so training and serving
+share one feature definition. A positive row does not count itself.
+
+train_from_cache fits the scaler incrementally, writes the scaled training
+rows to another memory-mapped file and fits the model on it.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import json
+import os
+import time
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.database import Accident
+from app.models.ml_model import accident_model
+from app.services.accident_snapshot import ROAD_TYPE_VALUES, WEATHER_VALUES, encode
+from app.services.spatial_index import KM_PER_DEGREE, AccidentCountGrid
+from config import settings
+
+
+COLUMN_DTYPES = {
+    "latitude": np.float64,
+    "longitude": np.float64,
+    "timestamp": "datetime64[s]",
+    "weather": np.int8,
+    "road_type": np.int8,
+}
+
+MODEL_TYPES = ("random_forest", "extra_trees", "gradient_boosting")
+
+METADATA_FILE = "cache.json"
+
+
+def _open_column(cache_dir: Path, name: str, mode: str = "r", rows: int = None) -> np.ndarray:
+    path = cache_dir / f"{name}.npy"
+    if mode == "r":
+        return np.load(path, mmap_mode="r")
+    return np.lib.format.open_memmap(path, mode="w+", dtype=COLUMN_DTYPES[name], shape=(rows,))
+
+
+def extract_accidents(db: Session, cache_dir: str, chunk_size: int = None, snapshot=None) -> int:
+    """
+    Write the accident columns used for training to `cache_dir`
+
+    Rows are read with yield_per and written chunk by chunk into
+    preallocated memory-mapped files. Rows inserted after the initial count
+    are left for the next run. With an AccidentSnapshot as `snapshot`, it
+    is refreshed and its live rows are copied instead; the result is the
+    same.
+
+    Returns:
+        Number of accidents written
+    """
+    chunk_size = chunk_size or settings.TRAINING_CHUNK_ROWS
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    if snapshot is not None:
+        snapshot.refresh(db)
+        source = snapshot.columns(COLUMN_DTYPES)
+        for name in COLUMN_DTYPES:
+            column = _open_column(cache_dir, name, "w+", len(source[name]))
+            column[:] = source[name]
+            column.flush()
+        return len(source["latitude"])
+
+    total = db.query(Accident.id).count()
+    columns = {name: _open_column(cache_dir, name, "w+", total) for name in COLUMN_DTYPES}
+
+    rows = iter(db.query(
+        Accident.latitude, Accident.longitude, Accident.accident_date,
+        Accident.weather_condition, Accident.road_type
+    ).order_by(Accident.id).yield_per(chunk_size))
+
+    written = 0
+    while written < total:
+        chunk = list(islice(rows, min(chunk_size, total - written)))
+        if not chunk:
+            break
+        latitudes, longitudes, dates, weather, road_types = zip(*chunk)
+        stop = written + len(chunk)
+        columns["latitude"][written:stop] = latitudes
+        columns["longitude"][written:stop] = longitudes
+        columns["timestamp"][written:stop] = np.array(dates, dtype="datetime64[s]")
+        columns["weather"][written:stop] = encode(weather, WEATHER_VALUES)
+        columns["road_type"][written:stop] = encode(road_types, ROAD_TYPE_VALUES)
+        written = stop
+
+    for column in columns.values():
+        column.flush()
+    return written
+
+
+def _feature_rows(
+    grid: AccidentCountGrid,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    timestamps: np.ndarray,
+    weather: np.ndarray,
+    road_types: np.ndarray,
+    radius_km: float,
+    exclude_self: bool
+) -> np.ndarray:
+    historical = grid.count_many(latitudes, longitudes, radius_km)
+    if exclude_self:
+        historical = np.maximum(historical - 1, 0)
+    return accident_model.prepare_features_many(
+        latitudes, longitudes, timestamps,
+        np.array(WEATHER_VALUES, dtype=object)[weather],
+        np.array(ROAD_TYPE_VALUES, dtype=object)[road_types],
+        historical,
+        scale=False
+    )
+
+
+def build_feature_cache(
+    db: Session,
+    cache_dir: str = None,
+    negative_ratio: float = 3.0,
+    negative_jitter_km: float = 2.0,
+    radius_km: float = None,
+    chunk_size: int = None,
+    workers: int = None,
+    seed: int = 42,
+    snapshot=None
+) -> Dict[str, Any]:
+    """
+    Extract accidents and write the training feature matrix
+
+    Writes `features.npy` (float32, one row per sample, columns as
+    AccidentRiskModel.feature_names) and `labels.npy` (int8) next to the
+    column files. Negatives are `negative_ratio` samples per accident:
+    a random accident location moved by up to `negative_jitter_km`, a
+    timestamp drawn uniformly from the accidents' time span, and weather
+    and road type taken from another random accident. Sampling is seeded
+    per chunk, so the cache is reproducible for any number of workers.
+
+    Returns:
+        Cache metadata, also written to cache.json
+    """
+    cache_dir = Path(cache_dir or settings.TRAINING_CACHE_DIR)
+    radius_km = radius_km or settings.NEARBY_RADIUS_KM
+    chunk_size = chunk_size or settings.TRAINING_CHUNK_ROWS
+    workers = workers or os.cpu_count() or 1
+    started_at = time.perf_counter()
+
+    # A cache without metadata is incomplete and never reused
+    (cache_dir / METADATA_FILE).unlink(missing_ok=True)
+
+    n_positive = extract_accidents(db, cache_dir, chunk_size, snapshot)
+    if n_positive == 0:
+        raise ValueError("No accidents to train on")
+    extracted_at = time.perf_counter()
+
+    latitudes = _open_column(cache_dir, "latitude")
+    longitudes = _open_column(cache_dir, "longitude")
+    timestamps = _open_column(cache_dir, "timestamp")
+    weather = _open_column(cache_dir, "weather")
+    road_types = _open_column(cache_dir, "road_type")
+
+    grid = AccidentCountGrid()
+    grid.build(latitudes, longitudes)
+    first_seconds = int(timestamps.min().astype(np.int64))
+    last_seconds = int(timestamps.max().astype(np.int64))
+
+    n_negative_per_chunk = int(round(chunk_size * negative_ratio))
+    n_chunks = -(-n_positive // chunk_size)
+    last_chunk_negatives = int(round((n_positive - (n_chunks - 1) * chunk_size) * negative_ratio))
+    n_negative = (n_chunks - 1) * n_negative_per_chunk + last_chunk_negatives
+    n_rows = n_positive + n_negative
+
+    n_features = len(accident_model.feature_names)
+    features = np.lib.format.open_memmap(
+        cache_dir / "features.npy", mode="w+", dtype=np.float32, shape=(n_rows, n_features)
+    )
+    labels = np.lib.format.open_memmap(
+        cache_dir / "labels.npy", mode="w+", dtype=np.int8, shape=(n_rows,)
+    )
+    labels[:n_positive] = 1
+    labels[n_positive:] = 0
+
+    def process(chunk: int):
+        start = chunk * chunk_size
+        stop = min(start + chunk_size, n_positive)
+        features[start:stop] = _feature_rows(
+            grid, latitudes[start:stop], longitudes[start:stop], timestamps[start:stop],
+            weather[start:stop], road_types[start:stop], radius_km, exclude_self=True
+        )
+
+        rng = np.random.default_rng([seed, chunk])
+        n = n_negative_per_chunk if chunk < n_chunks - 1 else last_chunk_negatives
+        if n == 0:
+            return
+        # Random access into the memory-mapped columns reads sorted indices
+        places = np.sort(rng.integers(0, n_positive, n))
+        conditions = np.sort(rng.integers(0, n_positive, n))
+        jitter_lat = rng.uniform(-1.0, 1.0, n) * negative_jitter_km / KM_PER_DEGREE
+        sample_lats = latitudes[places] + jitter_lat
+        jitter_lon = rng.uniform(-1.0, 1.0, n) * negative_jitter_km / KM_PER_DEGREE
+        sample_lons = longitudes[places] + jitter_lon / np.maximum(np.cos(np.radians(sample_lats)), 1e-6)
+        sample_times = rng.integers(first_seconds, last_seconds + 1, n).astype("datetime64[s]")
+
+        offset = n_positive + chunk * n_negative_per_chunk
+        features[offset:offset + n] = _feature_rows(
+            grid, sample_lats, sample_lons, sample_times,
+            weather[conditions], road_types[conditions], radius_km, exclude_self=False
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(process, range(n_chunks)))
+
+    features.flush()
+    labels.flush()
+    del features, labels
+
+    metadata = {
+        "rows": n_rows,
+        "positives": n_positive,
+        "negatives": n_negative,
+        "feature_names": accident_model.feature_names,
+        "negative_ratio": negative_ratio,
+        "negative_jitter_km": negative_jitter_km,
+        "radius_km": radius_km,
+        "count_grid_cell_deg": grid.cell_size_deg,
+        "seed": seed,
+        "built_at": datetime.now().isoformat(),
+        "extract_seconds": round(extracted_at - started_at, 2),
+        "feature_seconds": round(time.perf_counter() - extracted_at, 2),
+    }
+    (cache_dir / METADATA_FILE).write_text(json.dumps(metadata, indent=2))
+    return metadata
+
+
+def load_feature_cache(cache_dir: str = None) -> Optional[Tuple[np.ndarray, np.ndarray, Dict[str, Any]]]:
+    """Memory-map a complete feature cache; None if there is none"""
+    cache_dir = Path(cache_dir or settings.TRAINING_CACHE_DIR)
+    metadata_path = cache_dir / METADATA_FILE
+    if not metadata_path.exists():
+        return None
+    metadata = json.loads(metadata_path.read_text())
+    if metadata["feature_names"] != accident_model.feature_names:
+        return None
+    features = np.load(cache_dir / "features.npy", mmap_mode="r")
+    labels = np.load(cache_dir / "labels.npy", mmap_mode="r")
+    return features, labels, metadata
+
+
+def _make_model(model_type: str, n_estimators: int, max_depth: Optional[int], seed: int):
+    if model_type == "random_forest":
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(
+            n_estimators=n_estimators, max_depth=max_depth, min_samples_leaf=5,
+            n_jobs=-1, random_state=seed
+        )
+    if model_type == "extra_trees":
+        from sklearn.ensemble import ExtraTreesClassifier
+        return ExtraTreesClassifier(
+            n_estimators=n_estimators, max_depth=max_depth, min_samples_leaf=5,
+            n_jobs=-1, random_state=seed
+        )
+    if model_type == "gradient_boosting":
+        from sklearn.ensemble import GradientBoostingClassifier
+        return GradientBoostingClassifier(
+            n_estimators=n_estimators, max_depth=max_depth or 3, random_state=seed
+        )
+    raise ValueError(f"Unknown model type {model_type!r}; expected one of {MODEL_TYPES}")
+
+
+def train_from_cache(
+    cache_dir: str = None,
+    model_type: str = "random_forest",
+    n_estimators: int = 100,
+    max_depth: Optional[int] = 16,
+    max_train_rows: int = None,
+    validation_fraction: float = 0.2,
+    chunk_size: int = None,
+    seed: int = 42
+) -> Tuple[Any, Any, Dict[str, Any]]:
+    """
+    Fit a scaler and model on a feature cache
+
+    A random `validation_fraction` of the rows is held out. At most
+    `max_train_rows` of the rest are used for fitting, which bounds the
+    memory the estimator needs; the scaler statistics still cover every
+    training row. The scaled training matrix is a memory-mapped float32
+    file, which scikit-learn trees consume without a copy.
+
+    Returns:
+        Tuple of (model, scaler, metrics)
+    """
+    from sklearn.metrics import average_precision_score, roc_auc_score
+    from sklearn.preprocessing import StandardScaler
+
+    cache = load_feature_cache(cache_dir)
+    if cache is None:
+        raise ValueError(f"No feature cache in {cache_dir or settings.TRAINING_CACHE_DIR}")
+    features, labels, _ = cache
+    cache_dir = Path(cache_dir or settings.TRAINING_CACHE_DIR)
+    max_train_rows = max_train_rows or settings.TRAINING_MAX_ROWS
+    chunk_size = chunk_size or settings.TRAINING_CHUNK_ROWS
+    started_at = time.perf_counter()
+
+    rng = np.random.default_rng(seed)
+    held_out = rng.random(len(labels)) < validation_fraction
+    train_rows = np.flatnonzero(~held_out)
+    validation_rows = np.flatnonzero(held_out)
+    del held_out
+    if len(train_rows) > max_train_rows:
+        train_rows = np.sort(rng.choice(train_rows, max_train_rows, replace=False))
+    if len(validation_rows) > max_train_rows:
+        validation_rows = np.sort(rng.choice(validation_rows, max_train_rows, replace=False))
+
+    scaler = StandardScaler()
+    for start in range(0, len(train_rows), chunk_size):
+        scaler.partial_fit(features[train_rows[start:start + chunk_size]].astype(np.float64))
+
+    X_train = np.lib.format.open_memmap(
+        cache_dir / "train_features.npy", mode="w+", dtype=np.float32,
+        shape=(len(train_rows), features.shape[1])
+    )
+    for start in range(0, len(train_rows), chunk_size):
+        rows = train_rows[start:start + chunk_size]
+        X_train[start:start + len(rows)] = scaler.transform(features[rows].astype(np.float64))
+    y_train = np.asarray(labels[train_rows])
+
+    model = _make_model(model_type, n_estimators, max_depth, seed)
+    model.fit(X_train, y_train)
+    fitted_at = time.perf_counter()
+    del X_train
+    os.remove(cache_dir / "train_features.npy")
+
+    metrics = {
+        "model_type": model_type,
+        "train_rows": int(len(train_rows)),
+        "validation_rows": int(len(validation_rows)),
+        "fit_seconds": round(fitted_at - started_at, 2),
+    }
+    if len(validation_rows) and len(np.unique(labels[validation_rows])) == 2:
+        probabilities = np.concatenate([
+            model.predict_proba(scaler.transform(
+                features[validation_rows[start:start + chunk_size]].astype(np.float64)
+            ))[:, 1]
+            for start in range(0, len(validation_rows), chunk_size)
+        ])
+        y_validation = np.asarray(labels[validation_rows])
+        metrics.update({
+            "roc_auc": round(float(roc_auc_score(y_validation, probabilities)), 4),
+            "average_precision": round(float(average_precision_score(y_validation, probabilities)), 4),
+            "accuracy": round(float(np.mean((probabilities >= 0.5) == y_validation)), 4),
+        })
+    return model, scaler, metrics
@@ -0,0 +1,4 @@
+"""
+Offline jobs and benchmarks, run from the backend directory with
+`python -m scripts.<name>`
+"""
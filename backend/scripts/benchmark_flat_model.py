@@ -0,0 +1,134 @@
+"""
+Parity check and latency benchmark of the flat tree evaluator
+
+Compares AccidentRiskModel with the native predict_proba against the
+flattened NumPy evaluator, on the trained model at MODEL_PATH or, with
+--synthetic (or when no model is trained), on models fitted to random data.
+
+Usage (from the backend directory):
+    python -m scripts.benchmark_flat_model
+    python -m scripts.benchmark_flat_model --synthetic
+
+Exits with status 1 if any probability differs by more than --tolerance.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from app.models.flat_ensemble import export_ensemble
+from app.models.ml_model import AccidentRiskModel
+
+
+def _synthetic_models(n_rows: int = 5000):
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(0)
+    features = np.column_stack([
+        21.0 + rng.random(n_rows) * 0.2,
+        105.7 + rng.random(n_rows) * 0.2,
+        rng.integers(0, 24, n_rows),
+        rng.integers(0, 7, n_rows),
+        rng.integers(0, 2, n_rows),
+        rng.integers(0, 2, n_rows),
+        rng.random(n_rows),
+        rng.random(n_rows),
+        rng.integers(0, 200, n_rows)
+    ])
+    labels = (features[:, 8] / 200 + features[:, 6] * 0.3 + rng.normal(0, 0.2, n_rows) > 0.6).astype(int)
+    scaler = StandardScaler().fit(features)
+    scaled = scaler.transform(features)
+
+    models = [
+        RandomForestClassifier(n_estimators=100, max_depth=12, random_state=0).fit(scaled, labels),
+        GradientBoostingClassifier(n_estimators=100, max_depth=4, random_state=0).fit(scaled, labels)
+    ]
+    try:
+        from xgboost import XGBClassifier
+        models.append(XGBClassifier(n_estimators=100, max_depth=6).fit(scaled, labels))
+    except ImportError:
+        pass
+    return [(model, scaler) for model in models]
+
+
+def _inputs(n: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    timestamps = np.datetime64("2024-01-01T00", "h") + rng.integers(0, 24 * 365, n)
+    return (
+        21.0 + rng.random(n) * 0.2,
+        105.7 + rng.random(n) * 0.2,
+        timestamps,
+        rng.choice(["clear", "rain", "fog", "snow", "storm"], n).tolist(),
+        rng.choice(["highway", "national_road", "urban", "rural"], n).tolist(),
+        rng.integers(0, 200, n)
+    )
+
+
+def _latency_us(model: AccidentRiskModel, inputs, repeats: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(repeats):
+        model.predict_risk_many(*inputs)
+    return (time.perf_counter() - started_at) / repeats * 1e6
+
+
+def benchmark(native: AccidentRiskModel, rows: int, repeats: int, tolerance: float) -> bool:
+    flat = AccidentRiskModel()
+    flat.model, flat.scaler, flat.is_trained = native.model, native.scaler, True
+    flat.flat_model = export_ensemble(native.model, native.scaler)
+
+    inputs = _inputs(rows)
+    _, expected = native.predict_risk_many(*inputs)
+    _, actual = flat.predict_risk_many(*inputs)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    exact = float(np.mean(expected == actual))
+    passed = max_diff <= tolerance
+
+    print(f"{flat.flat_model.source}: {flat.flat_model.n_trees} trees, "
+          f"{flat.flat_model.n_nodes} nodes, depth {flat.flat_model.max_depth}")
+    print(f"  parity on {rows} rows: max |diff| = {max_diff:.2e}, "
+          f"identical = {exact:.1%} -> {'OK' if passed else 'FAIL'}")
+
+    for batch in (1, 16, 256):
+        batch_inputs = tuple(column[:batch] for column in inputs)
+        n = max(repeats // batch, 20)
+        native_us = _latency_us(native, batch_inputs, n)
+        flat_us = _latency_us(flat, batch_inputs, n)
+        print(f"  batch {batch:>4}: native {native_us:9.1f} us, flat {flat_us:9.1f} us "
+              f"({native_us / flat_us:5.1f}x)")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", action="store_true", help="benchmark models fitted to random data")
+    parser.add_argument("--rows", type=int, default=20000, help="rows for the parity check")
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    args = parser.parse_args()
+
+    models = []
+    if not args.synthetic:
+        model = AccidentRiskModel()
+        model.load_model()
+        if model.is_trained:
+            models.append((model.model, model.scaler))
+    if not models:
+        print("Using models fitted to synthetic data")
+        models = _synthetic_models()
+
+    passed = True
+    for estimator, scaler in models:
+        native = AccidentRiskModel()
+        native.model, native.scaler, native.is_trained = estimator, scaler, True
+        # xgboost sums leaves in float32
+        tolerance = max(args.tolerance, 1e-6) if type(estimator).__module__.startswith("xgboost") else args.tolerance
+        passed &= benchmark(native, args.rows, args.repeats, tolerance)
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Startup time and per-worker memory of the model loading modes
+
+Each mode loads the model at MODEL_PATH in a fresh interpreter and
+reports the load time and the growth of resident memory, split into
+private (anonymous) pages and file-backed pages. File-backed pages of a
+memory-mapped model are shared by all workers on the host, so the private
+part is what every extra uvicorn worker costs.
+
+Usage (from the backend directory):
+    python -m scripts.benchmark_model_loading
+
+Modes:
+    joblib      joblib.load into private memory (default)
+    mmap        joblib.load with mmap_mode="r"
+    flat-mmap   memory-mapped flat export (MODEL_EVALUATOR=flat, needs
+                python -m scripts.export_flat_model first)
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+MODES = {
+    "joblib": {"MODEL_MMAP": "false", "MODEL_EVALUATOR": "native"},
+    "mmap": {"MODEL_MMAP": "true", "MODEL_EVALUATOR": "native"},
+    "flat-mmap": {"MODEL_MMAP": "true", "MODEL_EVALUATOR": "flat"},
+}
+
+
+def _memory_kb() -> dict:
+    """Resident memory of this process from /proc (Linux only)"""
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0])
+    return fields
+
+
+def _measure():
+    """Run in the child process: load the model and print one JSON line"""
+    import time
+
+    # Import before measuring so only the model itself is counted
+    from app.models.ml_model import AccidentRiskModel
+    import sklearn.ensemble  # noqa: F401
+
+    before = _memory_kb()
+    started_at = time.perf_counter()
+    model = AccidentRiskModel()
+    model.load_model()
+    model.predict_risk(21.03, 105.85)
+    load_ms = (time.perf_counter() - started_at) * 1000
+    after = _memory_kb()
+
+    print(json.dumps({
+        "trained": model.is_trained,
+        "evaluator": model.evaluator,
+        "load_ms": load_ms,
+        **{key: after[key] - before[key] for key in after}
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.child:
+        _measure()
+        return
+
+    print(f"{'mode':<10} {'evaluator':<9} {'load ms':>9} {'RSS MB':>8} {'private MB':>11} {'shared MB':>10}")
+    for mode, env in MODES.items():
+        results = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, "-m", "scripts.benchmark_model_loading", "--child"],
+                env={**os.environ, **env, "DEBUG": "false"},
+                capture_output=True, text=True, check=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        if not results[0]["trained"]:
+            sys.exit("No trained model found at MODEL_PATH")
+        best = min(results, key=lambda r: r["load_ms"])
+        print(f"{mode:<10} {best['evaluator']:<9} {best['load_ms']:>9.1f} {best['VmRSS'] / 1024:>8.1f} "
+              f"{best['RssAnon'] / 1024:>11.1f} {best['RssFile'] / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Cold start benchmark of the API process
+
+Measures, each in a fresh interpreter:
+- import time of app.main
+- time from launching uvicorn to the first /health response
+- time until /health reports ready (model and spatial index loaded)
+
+with FAST_START off and on.
+
+Usage (from the backend directory):
+    python -m scripts.benchmark_startup
+    python -m scripts.benchmark_startup --runs 5 --port 8765
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+IMPORT_SNIPPET = (
+    "import time; started_at = time.perf_counter(); import app.main; "
+    "print((time.perf_counter() - started_at) * 1000)"
+)
+
+
+def import_ms(env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def _health(port: int):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+            return json.loads(response.read())
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return None
+
+
+def serve_ms(env: dict, port: int, timeout: float = 120.0):
+    """Milliseconds until the first /health answer and until it reports ready"""
+    started_at = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    first_response = ready = None
+    try:
+        while time.perf_counter() - started_at < timeout:
+            health = _health(port)
+            now = (time.perf_counter() - started_at) * 1000
+            if health is not None:
+                first_response = first_response or now
+                # Older builds without readiness report are ready on answer
+                if health.get("ready", True):
+                    ready = now
+                    break
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+    return first_response, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn  # noqa: F401
+    except ImportError:
+        sys.exit("uvicorn is not installed; pip install -r requirements.txt")
+
+    print(f"{'mode':<12} {'import ms':>10} {'first response ms':>18} {'ready ms':>10}")
+    for fast_start in ("false", "true"):
+        env = {**os.environ, "FAST_START": fast_start, "DEBUG": "false"}
+        imports = [import_ms(env) for _ in range(args.runs)]
+        serves = [serve_ms(env, args.port) for _ in range(args.runs)]
+        first = [s[0] for s in serves if s[0] is not None]
+        ready = [s[1] for s in serves if s[1] is not None]
+        mode = "fast-start" if fast_start == "true" else "default"
+        print(f"{mode:<12} {statistics.median(imports):>10.0f} "
+              f"{statistics.median(first) if first else float('nan'):>18.0f} "
+              f"{statistics.median(ready) if ready else float('nan'):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
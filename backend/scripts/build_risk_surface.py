@@ -0,0 +1,74 @@
+"""
+Precompute the risk surface served by /prediction/risk
+
+Usage (from the backend directory):
+    python -m scripts.build_risk_surface
+    python -m scripts.build_risk_surface --bounds 20.9 105.7 21.1 106.0 --cell-deg 0.002
+
+Without --bounds the grid covers all accidents plus a margin, and the build
+is refused if the surface would exceed RISK_SURFACE_MAX_BYTES. Restart the
+API afterwards to map the new surface (with RISK_SURFACE_ENABLED=true).
+"""
+
+import argparse
+import time
+
+from sqlalchemy import func
+
+from app.database import SessionLocal, init_db
+from app.models.database import Accident
+from app.models.ml_model import accident_model
+from app.services.accident_snapshot import accident_snapshot
+from app.services.risk_surface import build_risk_surface, surface_size_bytes
+from app.services.spatial_index import KM_PER_DEGREE, accident_index
+from config import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bounds", nargs=4, type=float, metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"))
+    parser.add_argument("--cell-deg", type=float, default=settings.RISK_SURFACE_CELL_DEG)
+    parser.add_argument("--margin-km", type=float, default=settings.NEARBY_RADIUS_KM)
+    parser.add_argument("--output", default=settings.RISK_SURFACE_PATH)
+    args = parser.parse_args()
+
+    init_db()
+    accident_model.load_model()
+
+    db = SessionLocal()
+    try:
+        accident_index.build(db, snapshot=accident_snapshot if settings.ACCIDENT_SNAPSHOT_ENABLED else None)
+
+        if args.bounds:
+            min_lat, min_lon, max_lat, max_lon = args.bounds
+        else:
+            min_lat, max_lat, min_lon, max_lon = db.query(
+                func.min(Accident.latitude), func.max(Accident.latitude),
+                func.min(Accident.longitude), func.max(Accident.longitude)
+            ).one()
+            if min_lat is None:
+                parser.error("no accidents in the database; pass --bounds")
+            margin = args.margin_km / KM_PER_DEGREE
+            min_lat, min_lon = min_lat - margin, min_lon - margin
+            max_lat, max_lon = max_lat + margin, max_lon + margin
+
+        started_at = time.perf_counter()
+        try:
+            metadata = build_risk_surface(
+                db, min_lat, min_lon, max_lat, max_lon,
+                cell_size_deg=args.cell_deg, path=args.output,
+                max_bytes=None if args.bounds else settings.RISK_SURFACE_MAX_BYTES
+            )
+        except ValueError as e:
+            parser.error(f"{e}, or pass --bounds")
+    finally:
+        db.close()
+
+    print(f"Risk surface written to {args.output}")
+    print(f"  grid: {metadata['rows']} x {metadata['cols']} cells of {args.cell_deg} deg")
+    print(f"  size: {surface_size_bytes(metadata['rows'], metadata['cols']) / 1e6:.1f} MB")
+    print(f"  time: {time.perf_counter() - started_at:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
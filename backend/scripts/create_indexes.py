@@ -0,0 +1,74 @@
+"""
+Create the model indexes that an existing database does not have yet
+
+Usage (from the backend directory):
+    python -m scripts.create_indexes
+
+create_all only creates indexes with their tables, and the API does not
+run index DDL at startup (it logs the missing ones). Run this once after
+upgrading, before or while the new version serves traffic:
+
+- PostgreSQL: CREATE INDEX CONCURRENTLY, so writes to the table continue
+  during the build. An index left INVALID by an interrupted build is
+  dropped and built again.
+- SQLite: CREATE INDEX IF NOT EXISTS, which holds the database write lock
+  for the duration of the build.
+
+Running it again, or from several hosts at once, is safe: existing indexes
+are skipped.
+"""
+
+import argparse
+import time
+
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+
+from app.database import engine, missing_indexes
+from app.models.database import Base
+
+
+def _invalid_indexes(connection) -> list:
+    """Model indexes PostgreSQL has only as INVALID leftovers of a failed build"""
+    names = {index.name for table in Base.metadata.sorted_tables for index in table.indexes}
+    rows = connection.execute(text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE NOT i.indisvalid"
+    ))
+    invalid = {row[0] for row in rows} & names
+    return [
+        index for table in Base.metadata.sorted_tables for index in table.indexes
+        if index.name in invalid
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    postgres = engine.dialect.name == "postgresql"
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        indexes = missing_indexes()
+        if postgres:
+            for index in _invalid_indexes(connection):
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+                print(f"Dropped invalid index {index.name}")
+                if index not in indexes:
+                    indexes.append(index)
+
+        if not indexes:
+            print("All indexes exist")
+            return
+
+        for index in indexes:
+            if postgres:
+                index.dialect_options["postgresql"]["concurrently"] = True
+            started_at = time.perf_counter()
+            connection.execute(CreateIndex(index, if_not_exists=True))
+            print(f"Created index {index.name} on {index.table.name} "
+                  f"in {time.perf_counter() - started_at:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Export the trained model and scaler as flat NumPy arrays
+
+Usage (from the backend directory):
+    python -m scripts.export_flat_model
+
+Set MODEL_EVALUATOR=flat to serve predictions from the export.
+"""
+
+import argparse
+
+from app.models.flat_ensemble import export_ensemble
+from app.models.ml_model import accident_model
+from config import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=settings.FLAT_MODEL_PATH)
+    args = parser.parse_args()
+
+    accident_model.load_model()
+    if not accident_model.is_trained:
+        parser.error(f"no trained model at {settings.MODEL_PATH}")
+
+    ensemble = export_ensemble(accident_model.model, accident_model.scaler)
+    ensemble.save(args.output)
+    print(f"Exported {ensemble.source}: {ensemble.n_trees} trees, {ensemble.n_nodes} nodes, "
+          f"depth {ensemble.max_depth} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
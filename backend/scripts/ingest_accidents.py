@@ -0,0 +1,51 @@
+"""
+Bulk import accidents from a CSV or Parquet file
+
+Usage (from the backend directory):
+    python -m scripts.ingest_accidents data/raw/accidents.csv
+    python -m scripts.ingest_accidents data/raw/accidents.parquet --chunk-rows 100000
+
+The format is taken from the file extension unless --format is given.
+Columns are named as in the accidents table; latitude, longitude and
+accident_date are required. A running API picks up the new rows at its next
+spatial index build; restart it or use POST /accidents/bulk instead.
+"""
+
+import argparse
+from pathlib import Path
+
+from app.database import SessionLocal, init_db
+from app.services.bulk_ingest import FORMATS, IngestError, ingest_file
+from config import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=settings.BULK_INGEST_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    file_format = args.format or Path(args.path).suffix.lstrip(".").lower()
+    if file_format not in FORMATS:
+        parser.error(f"cannot infer the format of {args.path}; pass --format")
+
+    init_db()
+    db = SessionLocal()
+    try:
+        report = ingest_file(db, args.path, file_format, args.chunk_rows)
+    except IngestError as e:
+        parser.exit(1, f"Import failed: {e}\n  segments updated: {e.report.segments_updated}\n")
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        db.close()
+
+    print(f"Imported {report.rows_inserted} of {report.rows_read} rows from {args.path}")
+    print(f"  rejected: {report.rows_rejected}")
+    print(f"  segments updated: {report.segments_updated}")
+    print(f"  time: {report.seconds:.1f}s ({report.rows_per_second:,.0f} rows/sec)")
+
+
+if __name__ == "__main__":
+    main()
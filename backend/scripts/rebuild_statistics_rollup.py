@@ -0,0 +1,34 @@
+"""
+Recompute the daily statistics rollup from the accidents table
+
+Usage (from the backend directory):
+    python -m scripts.rebuild_statistics_rollup
+
+The API keeps the rollup current as accidents are added, deleted or bulk
+imported, and backfills it at startup when it is empty. Run this after
+changing accidents outside the API (e.g. SQL updates or restores).
+"""
+
+import argparse
+
+from app.database import SessionLocal, init_db
+from app.services.statistics_rollup import rebuild_rollup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        result = rebuild_rollup(db)
+    finally:
+        db.close()
+
+    print(f"Rollup rebuilt: {result['rollup_rows']} rows for {result['accidents']} accidents")
+    print(f"  time: {result['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
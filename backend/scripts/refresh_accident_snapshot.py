@@ -0,0 +1,38 @@
+"""
+Bring the memory-mapped accident snapshot up to date
+
+Usage (from the backend directory):
+    python -m scripts.refresh_accident_snapshot
+    python -m scripts.refresh_accident_snapshot --rebuild
+
+The API refreshes the snapshot in ACCIDENT_SNAPSHOT_DIR whenever it builds
+its spatial index, reading only accidents added since the last refresh.
+Use --rebuild after changing existing accident rows outside the API.
+"""
+
+import argparse
+
+from app.database import SessionLocal, init_db
+from app.services.accident_snapshot import accident_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="read the whole accidents table again")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        result = accident_snapshot.refresh(db, rebuild=args.rebuild)
+    finally:
+        db.close()
+
+    action = "Rebuilt" if result["rebuilt"] else "Refreshed"
+    print(f"{action} snapshot in {accident_snapshot.directory}: {result['rows']} accidents")
+    print(f"  appended: {result['appended']}, deletions found: {result['deleted']}")
+    print(f"  watermark: id {result['watermark']}, time: {result['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Recompute the statistics of all road segments once
+
+Usage (from the backend directory):
+    python -m scripts.refresh_segments
+
+For deployments with API servers on several hosts: set
+SEGMENT_REFRESH_INTERVAL_SECONDS=0 for the API and run this from one
+scheduler (cron, a Kubernetes CronJob). It takes the same lock as the API
+refresher and exits without a pass if a process on this host holds it.
+"""
+
+import sys
+
+from app.database import SessionLocal, init_db
+from app.services.accident_snapshot import accident_snapshot
+from app.services.segment_refresher import SegmentRefreshLock, recompute_segments
+from config import settings
+
+
+def main():
+    lock = SegmentRefreshLock()
+    if not lock.acquire():
+        print(f"Another process holds {lock.path}; no pass run")
+        sys.exit(1)
+
+    init_db()
+    db = SessionLocal()
+    try:
+        result = recompute_segments(
+            db, snapshot=accident_snapshot if settings.ACCIDENT_SNAPSHOT_ENABLED else None
+        )
+    finally:
+        db.close()
+        lock.release()
+
+    print(f"Updated {result['segments_updated']} of {result['segments_scanned']} segments")
+    print(f"  accidents scanned: {result['accidents_scanned']}, skipped: {result['segments_skipped']}")
+    print(f"  time: {result['duration_seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Train the accident risk model from the accidents table
+
+Usage (from the backend directory):
+    python -m scripts.train_model
+    python -m scripts.train_model --model-type gradient_boosting --n-estimators 200
+    python -m scripts.train_model --reuse-cache --max-depth 12
+
+Features are written to TRAINING_CACHE_DIR first; --reuse-cache trains on
+an existing cache without reading the database. The model and scaler are
+saved to MODEL_PATH and SCALER_PATH, where a running API picks them up
+(see MODEL_RELOAD_INTERVAL_SECONDS).
+"""
+
+import argparse
+import time
+
+from app.database import SessionLocal, init_db
+from app.models.flat_ensemble import export_ensemble
+from app.models.ml_model import accident_model
+from app.services.accident_snapshot import accident_snapshot
+from app.services.training import (
+    MODEL_TYPES, build_feature_cache, load_feature_cache, train_from_cache
+)
+from config import settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cache-dir", default=settings.TRAINING_CACHE_DIR)
+    parser.add_argument("--reuse-cache", action="store_true", help="train on the existing feature cache")
+    parser.add_argument("--chunk-rows", type=int, default=settings.TRAINING_CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=None, help="feature threads (default: all cores)")
+    parser.add_argument("--negative-ratio", type=float, default=3.0)
+    parser.add_argument("--negative-jitter-km", type=float, default=2.0)
+    parser.add_argument("--model-type", choices=MODEL_TYPES, default="random_forest")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=16)
+    parser.add_argument("--max-train-rows", type=int, default=settings.TRAINING_MAX_ROWS)
+    parser.add_argument("--validation-fraction", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--export-flat", action="store_true", help="also write the flat evaluator export")
+    args = parser.parse_args()
+
+    started_at = time.perf_counter()
+    cache = load_feature_cache(args.cache_dir) if args.reuse_cache else None
+    if cache is not None:
+        metadata = cache[2]
+        print(f"Reusing feature cache in {args.cache_dir} (built {metadata['built_at']})")
+    else:
+        init_db()
+        db = SessionLocal()
+        try:
+            metadata = build_feature_cache(
+                db, args.cache_dir,
+                negative_ratio=args.negative_ratio,
+                negative_jitter_km=args.negative_jitter_km,
+                chunk_size=args.chunk_rows,
+                workers=args.workers,
+                seed=args.seed,
+                snapshot=accident_snapshot if settings.ACCIDENT_SNAPSHOT_ENABLED else None
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        finally:
+            db.close()
+        print(f"Feature cache written to {args.cache_dir}")
+        print(f"  extract: {metadata['extract_seconds']}s, features: {metadata['feature_seconds']}s")
+    print(f"  rows: {metadata['rows']} ({metadata['positives']} accidents, {metadata['negatives']} negatives)")
+
+    model, scaler, metrics = train_from_cache(
+        args.cache_dir,
+        model_type=args.model_type,
+        n_estimators=args.n_estimators,
+        max_depth=args.max_depth,
+        max_train_rows=args.max_train_rows,
+        validation_fraction=args.validation_fraction,
+        chunk_size=args.chunk_rows,
+        seed=args.seed
+    )
+    for name, value in metrics.items():
+        print(f"  {name}: {value}")
+
+    accident_model.model = model
+    accident_model.scaler = scaler
+    accident_model.is_trained = True
+    accident_model.save_model()
+
+    if args.export_flat:
+        ensemble = export_ensemble(model, scaler)
+        ensemble.save(settings.FLAT_MODEL_PATH)
+        print(f"Flat export written to {settings.FLAT_MODEL_PATH}")
+
+    print(f"Done in {time.perf_counter() - started_at:.1f}s")
+
+
+if __name__ == "__main__":
+    main()